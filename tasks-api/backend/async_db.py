@@ -0,0 +1,169 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+import db
+import instrumentation
+
+logger = logging.getLogger()
+
+# asyncio counterpart of db.py for routes that fan independent queries out
+# concurrently. Each concurrent query needs its own connection, so the pool is
+# small but larger than one; statements are prepared once per connection and
+# kept in asyncpg's statement cache across warm invocations.
+# Both pools draw on db.CONNECTION_BUDGET: this one takes enough for the task
+# board's three reads and the psycopg2 pool keeps the remainder, which is
+# plenty since a Lambda container serves one request at a time.
+ASYNC_POOL_MAX_CONNECTIONS = min(
+    int(os.environ.get('DB_ASYNC_POOL_MAX_CONNECTIONS', '3')), max(1, db.CONNECTION_BUDGET - 1)
+)
+STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', '256'))
+
+db.reserve_connections(ASYNC_POOL_MAX_CONNECTIONS)
+
+_pool = None
+_pool_loop = None
+_pool_lock = None
+
+
+class TenantConnection(asyncpg.Connection):
+    # Tenant the session is currently scoped to (None: unscoped), mirroring
+    # db._tenants so SET ROLE is only sent when a connection changes tenant
+    tenant = None
+
+    def get_reset_query(self):
+        # The pool would otherwise RESET ALL on every release, dropping the
+        # tenant scope and costing a round-trip; connection() always closes
+        # its transaction before a connection goes back.
+        return ''
+
+    async def set_tenant(self, company_id):
+        tenant = str(company_id) if company_id is not None and db.TENANT_ROLE else None
+        if self.tenant == tenant:
+            return
+        try:
+            if tenant is None:
+                await self.execute("RESET ROLE; RESET app.company_id")
+            else:
+                await self.execute(
+                    "SELECT set_config('role', $1, false), set_config('app.company_id', $2, false)",
+                    db.TENANT_ROLE, tenant,
+                )
+        except Exception:
+            # Session state unknown: the pool replaces terminated connections
+            self.terminate()
+            raise
+        self.tenant = tenant
+
+
+def _record_query(record):
+    elapsed_ms = (record.elapsed or 0) * 1000
+    instrumentation.record_query(None, record.query, elapsed_ms, failed=record.exception is not None)
+
+
+async def _connect(*args, **kwargs):
+    start = time.perf_counter()
+    conn = await asyncpg.connect(*args, **kwargs)
+    instrumentation.record_connect((time.perf_counter() - start) * 1000)
+    conn.add_query_logger(_record_query)
+    return conn
+
+
+def _asyncpg_kwargs():
+    kwargs = db.connect_kwargs()
+    if 'dsn' in kwargs:
+        return kwargs
+    kwargs['database'] = kwargs.pop('dbname')
+    return kwargs
+
+
+async def _build_pool():
+    return await asyncpg.create_pool(
+        **_asyncpg_kwargs(),
+        min_size=0,
+        max_size=ASYNC_POOL_MAX_CONNECTIONS,
+        statement_cache_size=STATEMENT_CACHE_SIZE,
+        connection_class=TenantConnection,
+        connect=_connect,
+    )
+
+
+def _terminate(old_pool):
+    # The old loop may be closed, so the pool can't be awaited; terminate()
+    # drops its connections synchronously.
+    try:
+        old_pool.terminate()
+    except Exception as e:
+        logger.warning(f"Could not close the previous event loop's pool: {str(e)}")
+
+
+async def get_pool():
+    # A pool belongs to the event loop it was created on. Mangum reuses one
+    # loop across warm invocations; anything else (tests, benchmarks calling
+    # asyncio.run) gets a fresh pool, and the old one's connections are closed
+    # rather than left open against the budget.
+    global _pool, _pool_loop, _pool_lock
+    loop = asyncio.get_running_loop()
+    if _pool_loop is not loop:
+        if _pool is not None:
+            _terminate(_pool)
+        _pool, _pool_loop, _pool_lock = None, loop, asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await _build_pool()
+        return _pool
+
+
+async def reset_pool():
+    global _pool
+    if _pool is not None and _pool_loop is asyncio.get_running_loop():
+        await _pool.close()
+    _pool = None
+
+
+@asynccontextmanager
+async def acquire(company_id=None):
+    # With a company_id the session runs as db.TENANT_ROLE and row-level
+    # security limits every query to that company. Statements run in
+    # autocommit; use connection() when several must share a transaction.
+    for attempt in range(2):
+        db_pool = await get_pool()
+        try:
+            conn = await db_pool.acquire()
+            break
+        except (asyncpg.InvalidPasswordError, asyncpg.InvalidAuthorizationSpecificationError) as e:
+            if attempt:
+                raise
+            # Credentials rotated: refresh the secret and rebuild the pool once
+            logger.warning(f"Database connect failed, refreshing secret: {str(e)}")
+            db.get_secret(force_refresh=True)
+            await reset_pool()
+    try:
+        await conn.set_tenant(company_id)
+        yield conn
+    finally:
+        await db_pool.release(conn)
+
+
+@asynccontextmanager
+async def connection(company_id=None):
+    # Same contract as db.connection(): commit on success, roll back on error
+    async with acquire(company_id) as conn:
+        async with conn.transaction():
+            yield conn
+
+
+async def fetch(company_id, query, *args):
+    # A single read needs no BEGIN/COMMIT round-trips
+    async with acquire(company_id) as conn:
+        return [dict(row) for row in await conn.fetch(query, *args)]
+
+
+async def gather(*queries):
+    # Runs independent (company_id, query, *args) statements concurrently, each
+    # on its own pooled connection, and returns their rows in order.
+    return await asyncio.gather(*(fetch(*query) for query in queries))
@@ -1,9 +1,596 @@
-from fastapi import FastAPI
+import io
+import os
+import re
+import csv
+import json
+import uuid
+import base64
+from datetime import date
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException, Request, Response, Depends, Query
+from fastapi.responses import StreamingResponse
 from mangum import Mangum
+from pydantic import BaseModel, Field
+from psycopg2.extras import RealDictCursor
+
+import db
+import auth
+import async_db
+import cache
+import aws_clients
+import instrumentation
+from dataloader import DataLoader, parse_fields, parse_ids
 
 app = FastAPI()
 handler = Mangum(app)
 
+TASK_COLUMNS = """
+    t.task_id, t.creation_timestamp, t.source, t.creation_date_by_user, t.location_id,
+    t.task_title, t.description, t.due_date, t.assigned_to, t.is_pooled,
+    t.completed_timestamp, t.status, t.edit_timestamp, t.priority
+"""
+
+# Columns callers may project with ?fields= and the CSV export header
+TASK_FIELDS = [
+    'task_id', 'creation_timestamp', 'source', 'creation_date_by_user', 'location_id',
+    'task_title', 'description', 'due_date', 'assigned_to', 'is_pooled',
+    'completed_timestamp', 'status', 'edit_timestamp', 'priority',
+]
+
+# Tasks without a due date or priority sort last; the same expressions back the
+# keyset cursor so every page is a single index range scan instead of an OFFSET.
+SORT_KEY = "(COALESCE(t.due_date, 'infinity'::date), COALESCE(t.priority, 6), t.task_id)"
+
+MAX_PAGE_SIZE = 200
+MAX_BULK_TASKS = 10000
+
+# Exports read through a server-side cursor EXPORT_FETCH_ROWS rows at a time.
+# Lambda buffers whole responses, so when TASK_EXPORT_BUCKET is set exports
+# are written to S3 as a multipart upload instead and a download URL returned.
+EXPORT_FETCH_ROWS = int(os.environ.get('EXPORT_FETCH_ROWS', '2000'))
+EXPORT_BUCKET = os.environ.get('TASK_EXPORT_BUCKET')
+EXPORT_PART_BYTES = 8 * 1024 * 1024
+EXPORT_URL_EXPIRY_SECONDS = 3600
+EXPORT_ROLES = ('super_admin', 'admin')
+
+MAX_SEARCH_RESULTS = 100
+MAX_SEARCH_OFFSET = 1000
+MAX_SEARCH_TERMS = 8
+SEARCH_TERM = re.compile(r'\w+', re.UNICODE)
+
+UPDATABLE_FIELDS = ('task_title', 'description', 'due_date', 'assigned_to', 'is_pooled', 'status', 'priority', 'location_id')
+
+
+class TaskCreate(BaseModel):
+    task_title: str = Field(..., max_length=200)
+    description: Optional[str] = None
+    location_id: int
+    due_date: Optional[date] = None
+    assigned_to: Optional[int] = None
+    is_pooled: bool = False
+    priority: Optional[int] = Field(None, ge=1, le=5)
+    creation_date_by_user: Optional[date] = None
+
+
+class TaskUpdate(BaseModel):
+    task_title: Optional[str] = Field(None, max_length=200)
+    description: Optional[str] = None
+    location_id: Optional[int] = None
+    due_date: Optional[date] = None
+    assigned_to: Optional[int] = None
+    is_pooled: Optional[bool] = None
+    status: Optional[str] = Field(None, pattern='^(open|in progress|completed)$')
+    priority: Optional[int] = Field(None, ge=1, le=5)
+
+
+class BulkTaskUpdate(BaseModel):
+    task_ids: List[int] = Field(..., min_length=1, max_length=MAX_BULK_TASKS)
+    changes: TaskUpdate
+
+
+class TaskClaim(BaseModel):
+    location_id: Optional[int] = None
+
+
+def encode_cursor(row):
+    due_date = row['due_date'].isoformat() if row['due_date'] else None
+    payload = json.dumps([due_date, row['priority'], row['task_id']])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        due_date, priority, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (
+            date.fromisoformat(due_date).isoformat() if due_date else 'infinity',
+            int(priority) if priority is not None else 6,
+            int(task_id),
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
+def get_current_user(request: Request):
+    sub = auth.claims(request.scope.get('aws.event', {})).get('sub')
+    if not sub:
+        raise HTTPException(status_code=401, detail='Unauthorized')
+
+    # Resolved on every request, so this is the hottest cached lookup. It runs
+    # unscoped because the company is what it resolves; every other query in
+    # this module runs with row-level security for the caller's company.
+    user = auth.get_user(sub)
+    if not user:
+        raise HTTPException(status_code=403, detail='User not found')
+    return user
+
+
+def task_filters(user, status=None, location_id=None, assigned_to=None):
+    conditions = ["l.company_id = %s"]
+    params = [user['company_id']]
+    if status:
+        conditions.append("t.status = %s")
+        params.append(status)
+    if location_id is not None:
+        conditions.append("t.location_id = %s")
+        params.append(location_id)
+    if assigned_to is not None:
+        conditions.append("t.assigned_to = %s")
+        params.append(assigned_to)
+    return conditions, params
+
+
+def load_tasks(task_ids, company_id, fields):
+    columns = ', '.join(f't.{field}' for field in fields)
+    with db.connection(company_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"""
+                SELECT {columns}
+                FROM tasks t
+                JOIN locations l ON l.location_id = t.location_id
+                WHERE t.task_id = ANY(%s) AND l.company_id = %s
+            """, (list(task_ids), company_id))
+            return {row['task_id']: row for row in cur.fetchall()}
+
+
+def task_loader(user, fields=TASK_FIELDS):
+    # Per-request batching loader for tasks in the caller's company
+    return DataLoader(lambda task_ids: load_tasks(task_ids, user['company_id'], fields))
+
+
+def fetch_task(cur, task_id, company_id):
+    cur.execute(f"""
+        SELECT {TASK_COLUMNS}
+        FROM tasks t
+        JOIN locations l ON l.location_id = t.location_id
+        WHERE t.task_id = %s AND l.company_id = %s
+    """, (task_id, company_id))
+    return cur.fetchone()
+
+
+def check_assignee(cur, assigned_to, company_id):
+    # Tasks can only be assigned to users of the caller's company
+    if assigned_to is None:
+        return
+    cur.execute("SELECT 1 FROM users WHERE user_id = %s AND company_id = %s", (assigned_to, company_id))
+    if cur.fetchone() is None:
+        raise HTTPException(status_code=400, detail='assigned_to must be a user in your company')
+
+
+@app.middleware("http")
+async def emit_metrics(request: Request, call_next):
+    try:
+        return await call_next(request)
+    finally:
+        cache.emit_metrics()
+        instrumentation.emit_metrics()
+
+
 @app.get("/")
 def root():
-    return {"message": "Hello World"}
\ No newline at end of file
+    return {"message": "Hello World"}
+
+
+@app.get("/tasks")
+def list_tasks(
+    status: Optional[str] = None,
+    location_id: Optional[int] = None,
+    assigned_to: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    ids: Optional[str] = None,
+    fields: Optional[str] = None,
+    user=Depends(get_current_user),
+):
+    if ids is not None:
+        return get_tasks_by_id(ids, fields, user)
+
+    conditions, params = task_filters(user, status, location_id, assigned_to)
+    if cursor:
+        conditions.append(f"{SORT_KEY} > (%s::date, %s, %s)")
+        params.extend(decode_cursor(cursor))
+
+    # Fetch one extra row to know whether another page exists. Pages are read
+    # in SORT_KEY order from idx_tasks_location_sort, idx_tasks_assignee_sort
+    # or, with a status filter, idx_tasks_location_status_sort.
+    params.append(limit + 1)
+    with db.connection(user['company_id']) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"""
+                SELECT {TASK_COLUMNS}
+                FROM tasks t
+                JOIN locations l ON l.location_id = t.location_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {SORT_KEY}
+                LIMIT %s
+            """, params)
+            rows = cur.fetchall()
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {'tasks': rows[:limit], 'next_cursor': next_cursor}
+
+
+def get_tasks_by_id(ids, fields, user):
+    # GET /tasks?ids=1,2,3&fields=task_id,status: one query for the whole list
+    try:
+        task_ids = parse_ids(ids)
+        columns = parse_fields(fields, TASK_FIELDS, 'task_id')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    found = task_loader(user, columns).load_many(task_ids)
+    return {
+        'tasks': [task for task in found.values() if task],
+        'missing': [task_id for task_id, task in found.items() if not task],
+    }
+
+
+def search_query(text):
+    # Every word must match, the last one as a prefix so results show up while
+    # the user is still typing ("inv rest" -> 'inv' & 'rest':*). Only word
+    # characters reach to_tsquery, so user input can never break its syntax.
+    terms = SEARCH_TERM.findall(text.lower())[:MAX_SEARCH_TERMS]
+    if not terms:
+        return None
+    return ' & '.join([f"'{term}'" for term in terms[:-1]] + [f"'{terms[-1]}':*"])
+
+
+def search_tasks(cur, user, text, status=None, location_id=None, limit=20, offset=0):
+    query = search_query(text)
+    if query is None:
+        return []
+    conditions, params = task_filters(user, status, location_id)
+    conditions.append("t.search_vector @@ q.query")
+    cur.execute(f"""
+        SELECT {TASK_COLUMNS}, ts_rank_cd(t.search_vector, q.query) AS rank
+        FROM tasks t
+        JOIN locations l ON l.location_id = t.location_id
+        CROSS JOIN to_tsquery('english', %s) AS q(query)
+        WHERE {' AND '.join(conditions)}
+        ORDER BY rank DESC, t.task_id DESC
+        LIMIT %s OFFSET %s
+    """, [query] + params + [limit, offset])
+    return cur.fetchall()
+
+
+@app.get("/tasks/search")
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    status: Optional[str] = None,
+    location_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+    user=Depends(get_current_user),
+):
+    with db.connection(user['company_id']) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            results = search_tasks(cur, user, q, status, location_id, limit, offset)
+    return {'tasks': results, 'next_offset': offset + limit if len(results) == limit else None}
+
+
+# The board's three reads are independent, so they run concurrently on
+# separate pooled connections through async_db instead of one after another.
+# Each takes (company_id, location_id[, limit]) as $1, $2[, $3].
+BOARD_QUERIES = {
+    # Served by idx_tasks_location_active_sort
+    'tasks': f"""
+        SELECT {TASK_COLUMNS}
+        FROM tasks t
+        JOIN locations l ON l.location_id = t.location_id
+        WHERE l.company_id = $1 AND t.location_id = $2 AND t.status <> 'completed'
+        ORDER BY {SORT_KEY}
+        LIMIT $3
+    """,
+    'counts': """
+        SELECT l.location_id, l.name,
+               COALESCE(c.total_open, 0) AS total_open_tasks,
+               COALESCE(c.total_in_progress, 0) AS total_in_progress_tasks,
+               COALESCE(c.total_completed, 0) AS total_completed_tasks
+        FROM locations l
+        LEFT JOIN location_task_counters c ON c.location_id = l.location_id
+        WHERE l.company_id = $1 AND l.location_id = $2
+    """,
+    'assignees': """
+        SELECT u.user_id, u.fname, u.lname, u.email, u.profile_type,
+               COALESCE(c.assigned_open, 0) AS assigned_open,
+               COALESCE(c.assigned_in_progress, 0) AS assigned_in_progress
+        FROM users u
+        LEFT JOIN user_task_counters c ON c.user_id = u.user_id
+        WHERE u.company_id = $1 AND u.location_id = $2
+        ORDER BY u.lname, u.fname, u.user_id
+    """,
+}
+
+
+@app.get("/tasks/board")
+async def task_board(
+    location_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    user=Depends(get_current_user),
+):
+    company_id = user['company_id']
+    location_id = location_id if location_id is not None else user['location_id']
+    if location_id is None:
+        raise HTTPException(status_code=400, detail='location_id is required')
+
+    # Fetch one extra row to know whether the board has more tasks
+    task_rows, counts, assignees = await async_db.gather(
+        (company_id, BOARD_QUERIES['tasks'], company_id, location_id, limit + 1),
+        (company_id, BOARD_QUERIES['counts'], company_id, location_id),
+        (company_id, BOARD_QUERIES['assignees'], company_id, location_id),
+    )
+    if not counts:
+        raise HTTPException(status_code=404, detail='Location not found')
+
+    next_cursor = encode_cursor(task_rows[limit - 1]) if len(task_rows) > limit else None
+    return {
+        'location': counts[0],
+        'tasks': task_rows[:limit],
+        'next_cursor': next_cursor,
+        'assignees': assignees,
+    }
+
+
+def export_chunks(company_id, conditions, params, export_format):
+    # A named cursor keeps the result set on the server; only one fetch batch
+    # and one encoded chunk are ever held in memory.
+    with db.connection(company_id) as conn:
+        with conn.cursor(name=f'task_export_{uuid.uuid4().hex}', cursor_factory=RealDictCursor) as cur:
+            cur.itersize = EXPORT_FETCH_ROWS
+            cur.execute(f"""
+                SELECT {TASK_COLUMNS}
+                FROM tasks t
+                JOIN locations l ON l.location_id = t.location_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY t.task_id
+            """, params)
+
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=TASK_FIELDS) if export_format == 'csv' else None
+            if writer:
+                writer.writeheader()
+            while True:
+                rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+                if not rows:
+                    break
+                for row in rows:
+                    if writer:
+                        writer.writerow(row)
+                    else:
+                        buffer.write(json.dumps(row, default=str) + '\n')
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode()
+
+
+def upload_export(chunks, export_format):
+    s3 = aws_clients.get_client('s3')
+    key = f"exports/{date.today().isoformat()}/{uuid.uuid4().hex}.{export_format}"
+    upload = s3.create_multipart_upload(Bucket=EXPORT_BUCKET, Key=key)
+    parts = []
+    part = bytearray()
+
+    def flush():
+        response = s3.upload_part(
+            Bucket=EXPORT_BUCKET, Key=key, UploadId=upload['UploadId'], PartNumber=len(parts) + 1, Body=bytes(part)
+        )
+        parts.append({'ETag': response['ETag'], 'PartNumber': len(parts) + 1})
+        part.clear()
+
+    try:
+        for chunk in chunks:
+            part.extend(chunk)
+            if len(part) >= EXPORT_PART_BYTES:
+                flush()
+        if part or not parts:
+            flush()
+        s3.complete_multipart_upload(
+            Bucket=EXPORT_BUCKET, Key=key, UploadId=upload['UploadId'], MultipartUpload={'Parts': parts}
+        )
+    except Exception:
+        s3.abort_multipart_upload(Bucket=EXPORT_BUCKET, Key=key, UploadId=upload['UploadId'])
+        raise
+    return s3.generate_presigned_url(
+        'get_object', Params={'Bucket': EXPORT_BUCKET, 'Key': key}, ExpiresIn=EXPORT_URL_EXPIRY_SECONDS
+    )
+
+
+@app.get("/tasks/export")
+def export_tasks(
+    format: str = Query('csv', pattern='^(csv|ndjson)$'),
+    status: Optional[str] = None,
+    location_id: Optional[int] = None,
+    assigned_to: Optional[int] = None,
+    user=Depends(get_current_user),
+):
+    if user['profile_type'] not in EXPORT_ROLES:
+        raise HTTPException(status_code=403, detail='Only admins can export tasks')
+
+    conditions, params = task_filters(user, status, location_id, assigned_to)
+    chunks = export_chunks(user['company_id'], conditions, params, format)
+    if EXPORT_BUCKET:
+        return {'url': upload_export(chunks, format), 'expires_in': EXPORT_URL_EXPIRY_SECONDS}
+
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(chunks, media_type=media_type, headers={
+        'Content-Disposition': f'attachment; filename="tasks.{format}"',
+    })
+
+
+@app.post("/tasks", status_code=201)
+def create_task(task: TaskCreate, user=Depends(get_current_user)):
+    with db.connection(user['company_id']) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            check_assignee(cur, task.assigned_to, user['company_id'])
+            cur.execute(f"""
+                INSERT INTO tasks AS t (source, creation_date_by_user, location_id, task_title, description,
+                                        due_date, assigned_to, is_pooled, priority)
+                SELECT %s, %s, l.location_id, %s, %s, %s, %s, %s, %s
+                FROM locations l
+                WHERE l.location_id = %s AND l.company_id = %s
+                RETURNING {TASK_COLUMNS}
+            """, (
+                user['user_id'],
+                task.creation_date_by_user or date.today(),
+                task.task_title,
+                task.description,
+                task.due_date,
+                task.assigned_to,
+                task.is_pooled,
+                task.priority,
+                task.location_id,
+                user['company_id'],
+            ))
+            created = cur.fetchone()
+    if not created:
+        raise HTTPException(status_code=404, detail='Location not found')
+    return created
+
+
+@app.get("/tasks/{task_id}")
+def get_task(task_id: int, user=Depends(get_current_user)):
+    with db.connection(user['company_id']) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            task = fetch_task(cur, task_id, user['company_id'])
+    if not task:
+        raise HTTPException(status_code=404, detail='Task not found')
+    return task
+
+
+def update_tasks(cur, task_ids, changes, user, returning=TASK_COLUMNS):
+    fields = {k: v for k, v in changes.model_dump(exclude_unset=True).items() if k in UPDATABLE_FIELDS}
+    if not fields:
+        raise HTTPException(status_code=400, detail='No fields to update')
+    check_assignee(cur, fields.get('assigned_to'), user['company_id'])
+
+    # The audit trigger reads app.current_user_id for task_changes.changed_by;
+    # setting it in the same execute keeps the update to one round-trip.
+    params = [str(user['user_id'])]
+    assignments = [f"{name} = %s" for name in fields]
+    params.extend(fields.values())
+    if 'status' in fields:
+        assignments.append("completed_timestamp = CASE WHEN %s = 'completed' THEN CURRENT_TIMESTAMP END")
+        params.append(fields['status'])
+    conditions = ["t.task_id = ANY(%s)", "l.location_id = t.location_id", "l.company_id = %s"]
+    params.extend([list(task_ids), user['company_id']])
+    if 'location_id' in fields:
+        # Tasks may only move between locations of the same company
+        conditions.append("EXISTS (SELECT 1 FROM locations nl WHERE nl.location_id = %s AND nl.company_id = l.company_id)")
+        params.append(fields['location_id'])
+
+    cur.execute(f"""
+        SELECT set_config('app.current_user_id', %s, true);
+        UPDATE tasks t
+        SET {', '.join(assignments)}
+        FROM locations l
+        WHERE {' AND '.join(conditions)}
+        RETURNING {returning}
+    """, params)
+    return cur.fetchall()
+
+
+def claim_next_task(cur, location_id, user):
+    # SKIP LOCKED lets concurrent claimers each take a different row instead of
+    # queueing behind whoever locked the head of the pool; the outer UPDATE
+    # re-checks assigned_to so a row can never be handed out twice.
+    cur.execute(f"""
+        SELECT set_config('app.current_user_id', %s, true);
+        WITH next_task AS (
+            SELECT t.task_id
+            FROM tasks t
+            JOIN locations l ON l.location_id = t.location_id
+            WHERE t.location_id = %s AND l.company_id = %s
+              AND t.is_pooled AND t.assigned_to IS NULL AND t.status = 'open'
+            ORDER BY {SORT_KEY}
+            LIMIT 1
+            FOR UPDATE OF t SKIP LOCKED
+        )
+        UPDATE tasks t
+        SET assigned_to = %s, is_pooled = FALSE
+        FROM next_task
+        WHERE t.task_id = next_task.task_id AND t.assigned_to IS NULL
+        RETURNING {TASK_COLUMNS}
+    """, (str(user['user_id']), location_id, user['company_id'], user['user_id']))
+    return cur.fetchone()
+
+
+@app.post("/tasks/claim")
+def claim_task(claim: Optional[TaskClaim] = None, user=Depends(get_current_user)):
+    location_id = (claim and claim.location_id) or user['location_id']
+    if location_id is None:
+        raise HTTPException(status_code=400, detail='location_id is required')
+
+    with db.connection(user['company_id']) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            task = claim_next_task(cur, location_id, user)
+    if not task:
+        # Nothing left in the pool (or every remaining row is mid-claim)
+        return Response(status_code=204)
+    return task
+
+
+@app.put("/tasks/bulk")
+def bulk_update_tasks(request: BulkTaskUpdate, user=Depends(get_current_user)):
+    # A single UPDATE so the statement-level audit trigger logs every change in
+    # one INSERT. Only the ids come back: echoing up to MAX_BULK_TASKS full rows
+    # would dwarf the request; clients refetch what they display.
+    with db.connection(user['company_id']) as conn:
+        with conn.cursor() as cur:
+            rows = update_tasks(cur, set(request.task_ids), request.changes, user, returning='t.task_id')
+    task_ids = sorted(row[0] for row in rows)
+    return {'updated': len(task_ids), 'task_ids': task_ids}
+
+
+@app.put("/tasks/{task_id}")
+def update_task(task_id: int, changes: TaskUpdate, user=Depends(get_current_user)):
+    with db.connection(user['company_id']) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            tasks = update_tasks(cur, [task_id], changes, user)
+    if not tasks:
+        raise HTTPException(status_code=404, detail='Task not found')
+    return tasks[0]
+
+
+@app.delete("/tasks/{task_id}")
+def delete_task(task_id: int, user=Depends(get_current_user)):
+    with db.connection(user['company_id']) as conn:
+        with conn.cursor() as cur:
+            # Audit rows reference the task, so they go first in the same transaction
+            cur.execute("""
+                WITH target AS (
+                    SELECT t.task_id
+                    FROM tasks t
+                    JOIN locations l ON l.location_id = t.location_id
+                    WHERE t.task_id = %s AND l.company_id = %s
+                ), changes AS (
+                    DELETE FROM task_changes WHERE task_id IN (SELECT task_id FROM target)
+                )
+                DELETE FROM tasks WHERE task_id IN (SELECT task_id FROM target)
+                RETURNING task_id
+            """, (task_id, user['company_id']))
+            deleted = cur.fetchone()
+    if not deleted:
+        raise HTTPException(status_code=404, detail='Task not found')
+    return {'message': 'Task deleted successfully'}
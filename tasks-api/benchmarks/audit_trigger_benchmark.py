@@ -0,0 +1,102 @@
+"""Compare the V1 row-level task_changes trigger with the V4 statement-level one.
+
+Runs against a migrated database (DATABASE_URL) and leaves it untouched:
+every run happens inside a transaction that is rolled back.
+
+    DATABASE_URL=postgresql://localhost/tasksdb python benchmarks/audit_trigger_benchmark.py --tasks 10000
+"""
+import argparse
+import os
+import time
+
+import psycopg2
+
+ROW_LEVEL_TRIGGER = """
+    DROP TRIGGER log_task_changes ON tasks;
+    CREATE FUNCTION pg_temp.log_task_changes_row()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        IF NEW.task_title <> OLD.task_title THEN
+            INSERT INTO task_changes (task_id, field_name, old_value, new_value, changed_by)
+            VALUES (NEW.task_id, 'task_title', OLD.task_title, NEW.task_title, NEW.source);
+        END IF;
+        IF NEW.description <> OLD.description THEN
+            INSERT INTO task_changes (task_id, field_name, old_value, new_value, changed_by)
+            VALUES (NEW.task_id, 'description', OLD.description, NEW.description, NEW.source);
+        END IF;
+        IF NEW.status <> OLD.status THEN
+            INSERT INTO task_changes (task_id, field_name, old_value, new_value, changed_by)
+            VALUES (NEW.task_id, 'status', OLD.status, NEW.status, NEW.source);
+        END IF;
+        IF NEW.priority <> OLD.priority THEN
+            INSERT INTO task_changes (task_id, field_name, old_value, new_value, changed_by)
+            VALUES (NEW.task_id, 'priority', OLD.priority::text, NEW.priority::text, NEW.source);
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    CREATE TRIGGER log_task_changes_row
+    AFTER UPDATE ON tasks
+    FOR EACH ROW
+    EXECUTE FUNCTION pg_temp.log_task_changes_row();
+"""
+
+
+def seed(cur, task_count):
+    cur.execute("INSERT INTO companies (name) VALUES ('Benchmark Co') RETURNING company_id")
+    company_id = cur.fetchone()[0]
+    cur.execute("INSERT INTO locations (company_id, name) VALUES (%s, 'Benchmark') RETURNING location_id", (company_id,))
+    location_id = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO users (cognito_user_id, profile_type, fname, lname, email, company_id, location_id)
+        VALUES ('benchmark-user', 'employee', 'Bench', 'Mark', 'benchmark@example.com', %s, %s)
+        RETURNING user_id
+    """, (company_id, location_id))
+    user_id = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO tasks (source, creation_date_by_user, location_id, task_title, assigned_to, priority)
+        SELECT %s, CURRENT_DATE, %s, 'Task ' || g, %s, 1 + g %% 5
+        FROM generate_series(1, %s) g
+    """, (user_id, location_id, user_id, task_count))
+    return location_id
+
+
+def run(conn, task_count, row_level):
+    with conn.cursor() as cur:
+        location_id = seed(cur, task_count)
+        if row_level:
+            cur.execute(ROW_LEVEL_TRIGGER)
+        start = time.perf_counter()
+        # Touches two audited fields per task: status and priority
+        cur.execute("""
+            UPDATE tasks
+            SET status = 'in progress', priority = 1 + priority %% 5
+            WHERE location_id = %s
+        """, (location_id,))
+        elapsed = time.perf_counter() - start
+        cur.execute("SELECT COUNT(*) FROM task_changes tc JOIN tasks t USING (task_id) WHERE t.location_id = %s", (location_id,))
+        audit_rows = cur.fetchone()[0]
+    conn.rollback()
+    return elapsed, audit_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        for label, row_level in (('row-level (V1)', True), ('statement-level (V4)', False)):
+            timings = []
+            for _ in range(args.repeat):
+                elapsed, audit_rows = run(conn, args.tasks, row_level)
+                timings.append(elapsed)
+            print(f"{label:<22} best {min(timings) * 1000:8.1f} ms  {audit_rows} audit rows for {args.tasks} tasks")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
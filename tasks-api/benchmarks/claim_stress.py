@@ -0,0 +1,134 @@
+"""Concurrency stress test for POST /tasks/claim.
+
+Seeds --tasks pooled tasks at one location, then starts --claimers threads,
+each on its own connection (as separate Lambda instances would be), that
+claim until the pool is empty. Fails if any task is claimed twice, if any
+pooled task is left unclaimed, or if the database disagrees with what the
+claimers saw. Reports claim latency percentiles and throughput.
+
+    python benchmarks/claim_stress.py --claimers 200 --tasks 5000
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+
+import harness
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+
+def seed(connect_kwargs, task_count, claimer_count):
+    conn = psycopg2.connect(**connect_kwargs)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO companies (name) VALUES ('Claim stress') RETURNING company_id")
+        company_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO locations (company_id, name, address) VALUES (%s, 'Claim', '1 Claim Street')
+            RETURNING location_id
+        """, (company_id,))
+        location_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO users (cognito_user_id, profile_type, fname, lname, email, location_id, company_id)
+            SELECT 'claim-stress-' || g, 'employee', 'Claim', 'Er' || g, 'claim-stress-' || g || '@example.com', %s, %s
+            FROM generate_series(1, %s) g
+            RETURNING user_id
+        """, (location_id, company_id, claimer_count))
+        user_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("""
+            INSERT INTO tasks (source, creation_date_by_user, location_id, task_title, due_date, is_pooled, priority)
+            SELECT %s, CURRENT_DATE, %s, 'Pooled task ' || g, CURRENT_DATE + g %% 30, TRUE, 1 + g %% 5
+            FROM generate_series(1, %s) g
+        """, (user_ids[0], location_id, task_count))
+        cur.execute("ANALYZE tasks")
+    conn.commit()
+    conn.close()
+    users = [{'user_id': user_id, 'company_id': company_id, 'location_id': location_id} for user_id in user_ids]
+    return location_id, users
+
+
+def claimer(tasks, connect_kwargs, user, start_gate, claims, latencies, errors):
+    conn = psycopg2.connect(**connect_kwargs)
+    start_gate.wait()
+    try:
+        while True:
+            start = time.perf_counter()
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                task = tasks.claim_next_task(cur, user['location_id'], user)
+            conn.commit()
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not task:
+                return
+            claims.append((task['task_id'], user['user_id']))
+    except Exception as e:
+        errors.append(str(e))
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--claimers', type=int, default=200)
+    parser.add_argument('--tasks', type=int, default=5000)
+    args = parser.parse_args()
+
+    import tasks
+
+    problems = []
+    # Every claimer holds its own connection
+    with harness.database(args.database_url, {'max_connections': args.claimers + 20}) as connect_kwargs:
+        harness.apply_migrations(connect_kwargs)
+        location_id, users = seed(connect_kwargs, args.tasks, args.claimers)
+
+        claims, latencies, errors = [], [], []
+        start_gate = threading.Barrier(args.claimers + 1)
+        threads = [
+            threading.Thread(target=claimer, args=(tasks, connect_kwargs, user, start_gate, claims, latencies, errors))
+            for user in users
+        ]
+        for thread in threads:
+            thread.start()
+        start_gate.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        duplicates = [task_id for task_id, count in Counter(task_id for task_id, _ in claims).items() if count > 1]
+        if duplicates:
+            problems.append(f"{len(duplicates)} tasks claimed more than once, e.g. {duplicates[:5]}")
+        if errors:
+            problems.append(f"{len(errors)} claimers failed, e.g. {errors[0]}")
+
+        conn = psycopg2.connect(**connect_kwargs)
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT count(*) FILTER (WHERE is_pooled AND assigned_to IS NULL),
+                       count(*) FILTER (WHERE assigned_to IS NOT NULL)
+                FROM tasks WHERE location_id = %s
+            """, (location_id,))
+            unclaimed, assigned = cur.fetchone()
+            cur.execute("SELECT task_id, assigned_to FROM tasks WHERE location_id = %s AND assigned_to IS NOT NULL",
+                        (location_id,))
+            recorded = dict(cur.fetchall())
+        conn.close()
+        if unclaimed:
+            problems.append(f"{unclaimed} pooled tasks were never claimed")
+        if assigned != len(claims) or any(recorded.get(task_id) != user_id for task_id, user_id in claims):
+            problems.append(f"database shows {assigned} assigned tasks but claimers saw {len(claims)}")
+
+        latencies.sort()
+        print(f"{len(claims)} claims by {args.claimers} claimers in {elapsed:.2f}s ({len(claims) / elapsed:.0f} claims/s)")
+        print(f"claim latency p50 {latencies[len(latencies) // 2]:.2f} ms  "
+              f"p95 {harness.percentile(latencies, 0.95):.2f} ms  p99 {harness.percentile(latencies, 0.99):.2f} ms")
+
+    if problems:
+        print('Claim stress test failed:\n  ' + '\n  '.join(problems), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
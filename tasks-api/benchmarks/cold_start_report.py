@@ -0,0 +1,131 @@
+"""Record zip size and handler import time for every packaged Lambda.
+
+Run after package_lambdas.sh. Each handler module is imported in a fresh
+interpreter with -X importtime, against its own zip plus the shared layer,
+the same way the Lambda runtime loads it. Results are written as JSON; pass
+--baseline with a previous report to fail on cold-start regressions.
+
+    python benchmarks/cold_start_report.py --output cold_start.json --baseline previous.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+LAYER_ZIP = 'lambda_layer_deps.zip'
+
+# Zip -> handler modules it contains
+FUNCTIONS = {
+    'lambda_backend.zip': ['tasks'],
+    'lambda_db_init.zip': ['dbInitLambda'],
+    'lambda_cognito_triggers.zip': ['preSignup', 'postSignup'],
+    'lambda_company_management.zip': ['companyManagementLambda'],
+    'lambda_user_management.zip': ['userManagementLambda'],
+    'lambda_maintenance.zip': ['maintenanceLambda'],
+}
+
+# Placeholder configuration so module-level environment lookups succeed
+DUMMY_ENV = {
+    'AWS_REGION': 'us-east-1',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'DB_SECRET_ARN': 'arn:aws:secretsmanager:us-east-1:000000000000:secret:dummy',
+    'DB_NAME': 'tasksdb',
+    'COGNITO_USER_POOL_ID': 'us-east-1_dummy',
+    'COGNITO_APP_CLIENT_ID': 'dummy',
+    'USER_POOL_ID': 'us-east-1_dummy',
+}
+
+
+def import_time_us(module, path_entries, python):
+    env = dict(os.environ, **DUMMY_ENV, PYTHONPATH=os.pathsep.join(path_entries), PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [python, '-s', '-X', 'importtime', '-c', f'import {module}'],
+        env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'Importing {module} failed:\n{result.stderr[-2000:]}')
+
+    # Lines look like "import time:  self [us] | cumulative | imported package";
+    # the handler module's own line carries the cumulative cost of everything it pulled in.
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.replace('import time:', '').split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise RuntimeError(f'No importtime entry for {module}')
+
+
+def measure(python, repeat):
+    report = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        layer_dir = os.path.join(workdir, 'layer')
+        layer_zip = os.path.join(API_DIR, LAYER_ZIP)
+        if os.path.exists(layer_zip):
+            zipfile.ZipFile(layer_zip).extractall(layer_dir)
+            report[LAYER_ZIP] = {'zip_bytes': os.path.getsize(layer_zip)}
+
+        for zip_name, modules in FUNCTIONS.items():
+            zip_path = os.path.join(API_DIR, zip_name)
+            if not os.path.exists(zip_path):
+                print(f'Skipping {zip_name}: not packaged', file=sys.stderr)
+                continue
+            function_dir = os.path.join(workdir, zip_name)
+            zipfile.ZipFile(zip_path).extractall(function_dir)
+            path_entries = [function_dir, os.path.join(layer_dir, 'python')]
+
+            entry = {'zip_bytes': os.path.getsize(zip_path), 'import_us': {}}
+            for module in modules:
+                # Best of several runs filters out scheduler noise
+                entry['import_us'][module] = min(
+                    import_time_us(module, path_entries, python) for _ in range(repeat)
+                )
+            report[zip_name] = entry
+    return report
+
+
+def regressions(report, baseline, time_tolerance, size_tolerance):
+    failures = []
+    for zip_name, entry in report.items():
+        previous = baseline.get(zip_name)
+        if not previous:
+            continue
+        if entry['zip_bytes'] > previous['zip_bytes'] * (1 + size_tolerance):
+            failures.append(f"{zip_name}: size {previous['zip_bytes']} -> {entry['zip_bytes']} bytes")
+        for module, import_us in entry.get('import_us', {}).items():
+            before = previous.get('import_us', {}).get(module)
+            if before and import_us > before * (1 + time_tolerance):
+                failures.append(f"{zip_name}:{module}: import {before} -> {import_us} us")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--python', default='python3.9', help='interpreter matching the Lambda runtime')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='cold_start_report.json')
+    parser.add_argument('--baseline', help='previous report to compare against')
+    parser.add_argument('--time-tolerance', type=float, default=0.2)
+    parser.add_argument('--size-tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    report = measure(args.python, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    for zip_name, entry in report.items():
+        imports = ', '.join(f'{m} {us / 1000:.1f} ms' for m, us in entry.get('import_us', {}).items())
+        print(f"{zip_name:<32} {entry['zip_bytes'] / 1024:9.1f} KiB  {imports}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = regressions(report, json.load(f), args.time_tolerance, args.size_tolerance)
+        if failures:
+            print('Cold-start regressions:\n  ' + '\n  '.join(failures), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
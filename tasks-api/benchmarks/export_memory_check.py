@@ -0,0 +1,101 @@
+"""Verify that task exports run in constant memory.
+
+Seeds --rows tasks into a throwaway Postgres (or --database-url), then drains
+the GET /tasks/export generator for CSV and NDJSON while tracing Python
+allocations and sampling the process's resident set after every chunk. Exits
+non-zero if the traced peak exceeds --max-mb or RSS grows by more than
+--max-rss-mb, which would mean the export materialised the result set instead
+of streaming it. tracemalloc alone can't see libpq's buffers, where a
+client-side cursor would hold every row.
+
+    python benchmarks/export_memory_check.py --rows 1000000 --max-mb 32 --max-rss-mb 64
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import harness
+
+import psycopg2
+
+
+def seed(connect_kwargs, rows):
+    conn = psycopg2.connect(**connect_kwargs)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO companies (name) VALUES ('Export check') RETURNING company_id")
+        company_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO locations (company_id, name, address) VALUES (%s, 'Export', '1 Export Street')
+            RETURNING location_id
+        """, (company_id,))
+        location_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO users (cognito_user_id, profile_type, fname, lname, email, location_id, company_id)
+            VALUES ('export-check-admin', 'admin', 'Export', 'Admin', 'export-check@example.com', %s, %s)
+            RETURNING user_id, company_id, location_id, profile_type
+        """, (location_id, company_id))
+        user = dict(zip(('user_id', 'company_id', 'location_id', 'profile_type'), cur.fetchone()))
+        cur.execute("""
+            INSERT INTO tasks (source, creation_date_by_user, location_id, task_title, description, due_date, status, priority)
+            SELECT %s, CURRENT_DATE, %s, 'Export task ' || g, repeat('x', 120), CURRENT_DATE + g %% 365,
+                   (ARRAY['open', 'in progress', 'completed'])[1 + g %% 3], 1 + g %% 5
+            FROM generate_series(1, %s) g
+        """, (user['user_id'], location_id, rows))
+    conn.commit()
+    conn.close()
+    return user
+
+
+def current_rss():
+    # Resident pages right now (Linux); ru_maxrss would only give the
+    # process-wide peak, which the first export would set for both
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def drain(tasks, user, export_format):
+    conditions, params = tasks.task_filters(user)
+    tracemalloc.start()
+    start = time.perf_counter()
+    total_bytes = 0
+    rss_before = peak_rss = current_rss()
+    for chunk in tasks.export_chunks(user['company_id'], conditions, params, export_format):
+        total_bytes += len(chunk)
+        peak_rss = max(peak_rss, current_rss())
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return total_bytes, peak, peak_rss - rss_before, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--max-mb', type=float, default=32.0, help='allowed peak of traced Python allocations')
+    parser.add_argument('--max-rss-mb', type=float, default=64.0, help='allowed resident set growth during an export')
+    args = parser.parse_args()
+
+    import tasks
+
+    failed = False
+    with harness.database(args.database_url) as connect_kwargs:
+        harness.apply_migrations(connect_kwargs)
+        user = seed(connect_kwargs, args.rows)
+        for export_format in ('csv', 'ndjson'):
+            total_bytes, peak, rss_growth, elapsed = drain(tasks, user, export_format)
+            peak_mb = peak / 1024 / 1024
+            rss_mb = rss_growth / 1024 / 1024
+            print(f"{export_format:<7} {total_bytes / 1024 / 1024:9.1f} MiB exported in {elapsed:6.1f}s, "
+                  f"peak traced memory {peak_mb:6.2f} MiB, RSS growth {rss_mb:6.2f} MiB")
+            failed = failed or peak_mb > args.max_mb or rss_mb > args.max_rss_mb
+
+    if failed:
+        print(f"Export exceeded the {args.max_mb} MiB traced or {args.max_rss_mb} MiB RSS memory cap", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,559 @@
+"""Latency/throughput benchmark for every Lambda handler against a local Postgres.
+
+Starts a throwaway PostgreSQL cluster with initdb/pg_ctl (no Docker), or uses
+--database-url, applies the real migrations with the dbInit runner, seeds
+synthetic companies/locations/users/tasks and then drives each handler with
+API Gateway / Cognito trigger events. Secrets Manager and Cognito are
+replaced by in-memory stubs. For every scenario it reports p50/p95/p99
+latency, throughput and SQL statements per request, and can write/compare
+JSON reports so results are comparable from commit to commit.
+
+    python benchmarks/harness.py --tasks-per-location 2000 --output bench.json
+    python benchmarks/harness.py --compare bench.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+for module_dir in ('shared', 'backend', 'userManagement', 'companyManagement', 'cognitoTriggers', 'dbInitLambda'):
+    sys.path.insert(0, os.path.join(API_DIR, module_dir))
+
+DB_NAME = 'tasksdb'
+SECRET_ARN = 'arn:aws:secretsmanager:local:000000000000:secret:tasks-benchmark'
+USER_POOL_ID = 'local_benchmark'
+
+os.environ.update({
+    'AWS_REGION': 'us-east-1',
+    'DB_NAME': DB_NAME,
+    'DB_SECRET_ARN': SECRET_ARN,
+    'COGNITO_USER_POOL_ID': USER_POOL_ID,
+    'COGNITO_APP_CLIENT_ID': 'local',
+    'USER_POOL_ID': USER_POOL_ID,
+})
+
+import psycopg2  # noqa: E402
+import psycopg2.extensions  # noqa: E402
+
+
+# -- Local PostgreSQL ---------------------------------------------------------
+
+def find_pg_bindir():
+    for name in ('initdb', 'pg_ctl'):
+        path = shutil.which(name)
+        if path:
+            return os.path.dirname(path)
+    pg_config = shutil.which('pg_config')
+    if pg_config:
+        return subprocess.run([pg_config, '--bindir'], capture_output=True, text=True, check=True).stdout.strip()
+    raise RuntimeError('PostgreSQL binaries (initdb, pg_ctl) not found; install PostgreSQL or pass --database-url')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LocalPostgres:
+    def __init__(self, settings=None):
+        self.settings = settings or {}
+
+    def __enter__(self):
+        bindir = find_pg_bindir()
+        self.pg_ctl = os.path.join(bindir, 'pg_ctl')
+        self.workdir = tempfile.mkdtemp(prefix='tasks-bench-pg-')
+        self.datadir = os.path.join(self.workdir, 'data')
+        self.port = free_port()
+        subprocess.run(
+            [os.path.join(bindir, 'initdb'), '-D', self.datadir, '-U', 'postgres', '-A', 'trust', '--no-sync'],
+            check=True, capture_output=True,
+        )
+        # Durability is irrelevant for a throwaway benchmark cluster
+        options = f"-p {self.port} -k {self.workdir} -c listen_addresses='' -c fsync=off -c synchronous_commit=off"
+        options += ''.join(f' -c {name}={value}' for name, value in self.settings.items())
+        subprocess.run(
+            [self.pg_ctl, '-D', self.datadir, '-o', options, '-l', os.path.join(self.workdir, 'postgres.log'), '-w', 'start'],
+            check=True, capture_output=True,
+        )
+        conn = psycopg2.connect(host=self.workdir, port=self.port, user='postgres', dbname='postgres')
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f'CREATE DATABASE {DB_NAME}')
+        conn.close()
+        return {'host': self.workdir, 'port': self.port, 'username': 'postgres', 'password': ''}
+
+    def __exit__(self, *exc):
+        subprocess.run([self.pg_ctl, '-D', self.datadir, '-m', 'immediate', 'stop'], capture_output=True)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def database(database_url=None, settings=None):
+    # Yields psycopg2.connect() arguments for a throwaway cluster, or for
+    # --database-url when one is given, with the handlers' db module pointed at
+    # the same database. The pool is closed before the cluster stops.
+    import aws_clients
+    import db
+
+    with contextlib.ExitStack() as stack:
+        if database_url:
+            os.environ['DATABASE_URL'] = database_url
+            connect_kwargs = {'dsn': database_url}
+        else:
+            secret = stack.enter_context(LocalPostgres(settings))
+            connect_kwargs = {'host': secret['host'], 'port': secret['port'], 'user': 'postgres', 'dbname': DB_NAME}
+            aws_clients._clients['secretsmanager'] = StubSecretsManager(secret)
+        stack.callback(db.reset_pool)
+        yield connect_kwargs
+
+
+# -- AWS stubs ----------------------------------------------------------------
+
+class StubSecretsManager:
+    def __init__(self, secret):
+        self.secret = secret
+
+    def get_secret_value(self, SecretId):
+        return {'SecretString': json.dumps(self.secret)}
+
+
+class StubCognito:
+    """In-memory stand-in for the cognito-idp admin API calls the handlers make."""
+
+    def __init__(self):
+        self.users = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def _call(self):
+        with self.lock:
+            self.calls += 1
+
+    def admin_create_user(self, UserPoolId, Username, UserAttributes, TemporaryPassword=None, **kwargs):
+        self._call()
+        attributes = {attr['Name']: attr['Value'] for attr in UserAttributes}
+        attributes.setdefault('sub', str(uuid.uuid4()))
+        with self.lock:
+            self.users[Username] = attributes
+        return {'User': {'Username': Username, 'Attributes': [{'Name': k, 'Value': v} for k, v in attributes.items()]}}
+
+    def admin_get_user(self, UserPoolId, Username):
+        self._call()
+        attributes = self.users.get(Username, {'custom:role': 'super_admin'})
+        return {'Username': Username, 'UserAttributes': [{'Name': k, 'Value': v} for k, v in attributes.items()]}
+
+    def admin_update_user_attributes(self, UserPoolId, Username, UserAttributes):
+        self._call()
+        with self.lock:
+            self.users.setdefault(Username, {}).update({attr['Name']: attr['Value'] for attr in UserAttributes})
+        return {}
+
+    def admin_delete_user(self, UserPoolId, Username):
+        self._call()
+        with self.lock:
+            self.users.pop(Username, None)
+        return {}
+
+
+# -- Query counting -------------------------------------------------------------
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+        self.factories = {}
+
+    def increment(self):
+        with self.lock:
+            self.count += 1
+
+    def counting_factory(self, factory):
+        # Wrap whichever cursor class the handler asked for (e.g. RealDictCursor)
+        if factory not in self.factories:
+            counter = self
+
+            def execute(cursor, query, vars=None):
+                counter.increment()
+                return factory.execute(cursor, query, vars)
+
+            def executemany(cursor, query, vars_list):
+                counter.increment()
+                return factory.executemany(cursor, query, vars_list)
+
+            self.factories[factory] = type(f'Counting{factory.__name__}', (factory,), {
+                'execute': execute, 'executemany': executemany,
+            })
+        return self.factories[factory]
+
+    def connection_factory(self):
+        import instrumentation
+        counter = self
+
+        class CountingConnection(instrumentation.InstrumentedConnection):
+            def cursor(self, *args, **kwargs):
+                factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+                kwargs['cursor_factory'] = counter.counting_factory(factory)
+                return super().cursor(*args, **kwargs)
+
+        return CountingConnection
+
+
+# -- Seeding ----------------------------------------------------------------------
+
+def apply_migrations(connect_kwargs):
+    import dbInitLambda
+    conn = psycopg2.connect(**connect_kwargs)
+    try:
+        with conn.cursor() as cur:
+            dbInitLambda.apply_migrations(cur, conn, os.path.join(API_DIR, 'dbInitLambda', 'migrations'))
+    finally:
+        conn.close()
+
+
+def seed(connect_kwargs, args):
+    conn = psycopg2.connect(**connect_kwargs)
+    start = time.monotonic()
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO companies (name)
+            SELECT 'Company ' || g FROM generate_series(1, %s) g
+        """, (args.companies,))
+        cur.execute("""
+            INSERT INTO locations (company_id, name, address)
+            SELECT c.company_id, 'Location ' || g, g || ' Benchmark Street'
+            FROM companies c CROSS JOIN generate_series(1, %s) g
+        """, (args.locations_per_company,))
+        cur.execute("""
+            INSERT INTO users (cognito_user_id, profile_type, fname, lname, email, location_id, company_id)
+            SELECT 'bench-' || l.location_id || '-' || g,
+                   CASE WHEN g > 1 THEN 'employee'
+                        WHEN l.location_id = (SELECT min(location_id) FROM locations WHERE company_id = l.company_id)
+                        THEN 'super_admin' ELSE 'admin' END,
+                   'First' || g, 'Last' || g,
+                   'bench-' || l.location_id || '-' || g || '@example.com',
+                   l.location_id, l.company_id
+            FROM locations l CROSS JOIN generate_series(1, %s) g
+        """, (args.users_per_location,))
+        cur.execute("""
+            INSERT INTO tasks (source, creation_date_by_user, location_id, task_title, description,
+                               due_date, assigned_to, is_pooled, status, priority)
+            SELECT u.user_id, CURRENT_DATE, l.location_id,
+                   'Task ' || g, 'Synthetic benchmark task ' || g,
+                   CURRENT_DATE + (g %% 90) - 30,
+                   CASE WHEN g %% 10 = 0 THEN NULL ELSE u.user_id END,
+                   g %% 10 = 0,
+                   (ARRAY['open', 'in progress', 'completed'])[1 + g %% 3],
+                   1 + g %% 5
+            FROM locations l
+            CROSS JOIN generate_series(1, %s) g
+            JOIN users u ON u.cognito_user_id = 'bench-' || l.location_id || '-' || (1 + g %% %s)
+        """, (args.tasks_per_location, args.users_per_location))
+        conn.commit()
+        cur.execute("ANALYZE")
+        conn.commit()
+
+        cur.execute(
+            "SELECT user_id, cognito_user_id, company_id, location_id, profile_type FROM users "
+            "WHERE cognito_user_id LIKE 'bench-%%'"
+        )
+        users = [
+            dict(zip(('user_id', 'cognito_user_id', 'company_id', 'location_id', 'profile_type'), row))
+            for row in cur.fetchall()
+        ]
+        cur.execute("SELECT task_id FROM tasks ORDER BY random() LIMIT 5000")
+        task_ids = [row[0] for row in cur.fetchall()]
+    conn.close()
+    print(f"Seeded {len(users)} users and {args.tasks_per_location * len(users) // args.users_per_location} tasks "
+          f"in {time.monotonic() - start:.1f}s", file=sys.stderr)
+    return users, task_ids
+
+
+# -- Events ---------------------------------------------------------------------------
+
+def api_event(method, resource, path, body=None, path_parameters=None, query=None, sub=None):
+    return {
+        'resource': resource,
+        'path': path,
+        'httpMethod': method,
+        'headers': {'Content-Type': 'application/json', 'Host': 'localhost'},
+        'multiValueHeaders': {'Content-Type': ['application/json'], 'Host': ['localhost']},
+        'queryStringParameters': query,
+        'multiValueQueryStringParameters': {k: [v] for k, v in query.items()} if query else None,
+        'pathParameters': path_parameters,
+        'stageVariables': None,
+        'requestContext': {
+            'resourcePath': resource,
+            'httpMethod': method,
+            'path': f'/prod{path}',
+            'stage': 'prod',
+            'requestId': str(uuid.uuid4()),
+            'identity': {'sourceIp': '127.0.0.1', 'userAgent': 'benchmark'},
+            'authorizer': {'claims': {'sub': sub}} if sub else {},
+        },
+        'body': json.dumps(body) if body is not None else None,
+        'isBase64Encoded': False,
+    }
+
+
+def trigger_event(attributes):
+    return {'request': {'userAttributes': [{'Name': k, 'Value': str(v)} for k, v in attributes.items()]}}
+
+
+def lambda_context(username='admin@example.com'):
+    return SimpleNamespace(
+        function_name='benchmark', aws_request_id=str(uuid.uuid4()), log_stream_name='benchmark',
+        identity=SimpleNamespace(username=username), get_remaining_time_in_millis=lambda: 30000,
+    )
+
+
+def build_scenarios(users, task_ids, cognito):
+    import cognito_outbox
+    import userManagementLambda
+    import companyManagementLambda
+    import preSignup
+    import postSignup
+
+    sequence = iter(range(10 ** 9))
+
+    def new_email():
+        return f'bench-new-{next(sequence)}-{uuid.uuid4().hex[:8]}@example.com'
+
+    def user_get():
+        user = random.choice(users)
+        return userManagementLambda.handler(api_event(
+            'GET', '/users/{userId}', f"/users/{user['user_id']}", path_parameters={'userId': str(user['user_id'])}
+        ), lambda_context())
+
+    def users_batch():
+        # Ids from the caller's own company, the only ones it gets back
+        caller = random.choice(users)
+        colleagues = [user for user in users if user['company_id'] == caller['company_id']]
+        ids = ','.join(str(user['user_id']) for user in random.sample(colleagues, min(50, len(colleagues))))
+        return userManagementLambda.handler(api_event(
+            'GET', '/users', '/users', query={'ids': ids, 'fields': 'fname,lname,email'}, sub=caller['cognito_user_id']
+        ), lambda_context())
+
+    def user_update():
+        user = random.choice(users)
+        return userManagementLambda.handler(api_event(
+            'PUT', '/users/{userId}', f"/users/{user['user_id']}", path_parameters={'userId': str(user['user_id'])},
+            body={'first_name': 'Updated', 'last_name': 'User', 'role': 'employee'},
+        ), lambda_context())
+
+    def user_create():
+        user = random.choice(users)
+        return userManagementLambda.handler(api_event('POST', '/users', '/users', body={
+            'email': new_email(), 'first_name': 'New', 'last_name': 'User',
+            'company_id': str(user['company_id']), 'role': 'employee', 'temporary_password': 'Temp-Passw0rd!',
+        }), lambda_context())
+
+    super_admins = [user for user in users if user['profile_type'] == 'super_admin']
+
+    def company_create():
+        return companyManagementLambda.handler(api_event(
+            'POST', '/companies', '/companies', body={'company_name': f'Bench Co {uuid.uuid4().hex[:8]}'},
+            sub=random.choice(super_admins)['cognito_user_id'],
+        ), lambda_context())
+
+    def company_tree():
+        user = random.choice(users)
+        company_id = str(user['company_id'])
+        return companyManagementLambda.handler(api_event(
+            'GET', '/companies/{companyId}/tree', f'/companies/{company_id}/tree', path_parameters={'companyId': company_id},
+            sub=user['cognito_user_id'],
+        ), lambda_context())
+
+    etags = {}
+
+    def company_tree_not_modified():
+        # A poller revalidating the copy it last received; other scenarios add
+        # users, so some revalidations return a fresh tree instead of a 304
+        user = random.choice(users)
+        company_id = str(user['company_id'])
+        event = api_event(
+            'GET', '/companies/{companyId}/tree', f'/companies/{company_id}/tree', path_parameters={'companyId': company_id},
+            sub=user['cognito_user_id'],
+        )
+        if company_id in etags:
+            event['headers']['If-None-Match'] = etags[company_id]
+        result = companyManagementLambda.handler(event, lambda_context())
+        etags[company_id] = result['headers']['ETag']
+        return result
+
+    def pre_signup():
+        user = random.choice(users)
+        return preSignup.handler(
+            trigger_event({'custom:company_id': user['company_id'], 'custom:role': 'employee'}), lambda_context()
+        )
+
+    def post_signup():
+        user = random.choice(users)
+        return postSignup.handler(trigger_event({
+            'sub': str(uuid.uuid4()), 'custom:role': 'employee', 'custom:company_id': user['company_id'],
+            'custom:location_id': user['location_id'], 'given_name': 'New', 'family_name': 'Signup',
+            'email': new_email(),
+        }), lambda_context())
+
+    def outbox_drain():
+        # Applies whatever users.update queued, as the maintenance job would
+        return cognito_outbox.drain(cognito, USER_POOL_ID, max_batches=1)
+
+    scenarios = {
+        'users.get': user_get,
+        'users.batch': users_batch,
+        'users.update': user_update,
+        'users.create': user_create,
+        'companies.create': company_create,
+        'companies.tree': company_tree,
+        'companies.tree304': company_tree_not_modified,
+        'cognito.preSignup': pre_signup,
+        'cognito.postSignup': post_signup,
+        'cognito.outboxDrain': outbox_drain,
+    }
+
+    try:
+        import tasks
+    except ImportError as e:
+        print(f"Skipping backend scenarios ({e})", file=sys.stderr)
+        return scenarios
+
+    def tasks_list():
+        user = random.choice(users)
+        query = {'location_id': str(user['location_id']), 'status': 'open', 'limit': '50'}
+        return tasks.handler(api_event('GET', '/tasks', '/tasks', query=query, sub=user['cognito_user_id']), lambda_context())
+
+    def tasks_get():
+        user = random.choice(users)
+        task_id = random.choice(task_ids)
+        return tasks.handler(api_event(
+            'GET', '/tasks/{taskId}', f'/tasks/{task_id}', path_parameters={'taskId': str(task_id)},
+            sub=user['cognito_user_id'],
+        ), lambda_context())
+
+    def tasks_batch():
+        user = random.choice(users)
+        ids = ','.join(str(task_id) for task_id in random.sample(task_ids, min(50, len(task_ids))))
+        query = {'ids': ids, 'fields': 'task_title,status,assigned_to'}
+        return tasks.handler(api_event('GET', '/tasks', '/tasks', query=query, sub=user['cognito_user_id']), lambda_context())
+
+    def tasks_update():
+        user = random.choice(users)
+        task_id = random.choice(task_ids)
+        return tasks.handler(api_event(
+            'PUT', '/tasks/{taskId}', f'/tasks/{task_id}', path_parameters={'taskId': str(task_id)},
+            body={'status': random.choice(['open', 'in progress', 'completed'])}, sub=user['cognito_user_id'],
+        ), lambda_context())
+
+    scenarios.update({'tasks.list': tasks_list, 'tasks.get': tasks_get, 'tasks.batch': tasks_batch, 'tasks.update': tasks_update})
+    return scenarios
+
+
+# -- Measurement ------------------------------------------------------------------------
+
+def percentile(samples, fraction):
+    index = min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))
+    return samples[index]
+
+
+def run_scenario(func, iterations, warmup, counter):
+    for _ in range(warmup):
+        func()
+    samples = []
+    errors = 0
+    counter.count = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        try:
+            response = func()
+            if isinstance(response, dict) and response.get('statusCode', 200) >= 500:
+                errors += 1
+        except Exception:
+            errors += 1
+        samples.append((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(percentile(samples, 0.95), 3),
+        'p99_ms': round(percentile(samples, 0.99), 3),
+        'throughput_rps': round(iterations / elapsed, 1),
+        'queries_per_request': round(counter.count / iterations, 2),
+        'errors': errors,
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"{'scenario':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'queries':>8} {'errors':>7}")
+    for name, result in report.items():
+        line = (f"{name:<20} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+                f"{result['throughput_rps']:>8.1f} {result['queries_per_request']:>8.2f} {result['errors']:>7}")
+        previous = (baseline or {}).get(name)
+        if previous:
+            change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100 if previous['p50_ms'] else 0
+            line += f"   p50 {change:+.1f}% vs baseline"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='use an existing (empty) database instead of a throwaway cluster')
+    parser.add_argument('--companies', type=int, default=5)
+    parser.add_argument('--locations-per-company', type=int, default=4)
+    parser.add_argument('--users-per-location', type=int, default=50)
+    parser.add_argument('--tasks-per-location', type=int, default=2000)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--scenario', action='append', help='run only the named scenario(s)')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='previous JSON report to compare against')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    import aws_clients
+    import db
+
+    counter = QueryCounter()
+    cognito = StubCognito()
+    db.connect_options['connection_factory'] = counter.connection_factory()
+
+    with database(args.database_url) as connect_kwargs:
+        aws_clients._clients['cognito-idp'] = cognito
+
+        apply_migrations(connect_kwargs)
+        users, task_ids = seed(connect_kwargs, args)
+        scenarios = build_scenarios(users, task_ids, cognito)
+
+        report = {}
+        # Handlers print an EMF line per invocation; keep them out of the report
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for name, func in scenarios.items():
+                if args.scenario and name not in args.scenario:
+                    continue
+                report[name] = run_scenario(func, args.iterations, args.warmup, counter)
+
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        print_report(report, baseline)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Fails if a hot task query shape plans a sequential scan of tasks.
+
+Seeds the harness data set (1M tasks by default) into a throwaway Postgres
+(or --database-url), then EXPLAINs the GET /tasks list by location, by
+location and status, by assignee, the next keyset page and the pooled claim
+(POST /tasks/claim), each under the caller's tenant scope as the API runs
+them. Prints the scan and sort nodes of every plan and exits non-zero if any
+of them reads tasks with a Seq Scan, or if a list shape sorts its tasks rows
+instead of reading them in SORT_KEY order from an index, e.g. because the
+V2/V16 indexes no longer match the backend's SORT_KEY or filters.
+
+    python benchmarks/plan_check.py --tasks-per-location 20000
+"""
+import argparse
+import random
+import sys
+from types import SimpleNamespace
+
+import harness
+
+
+SORT_NODES = ('Sort', 'Incremental Sort')
+
+
+def scan_nodes(plan):
+    if 'Relation Name' in plan or 'Index Name' in plan or plan['Node Type'] in SORT_NODES:
+        yield plan
+    for child in plan.get('Plans', []):
+        yield from scan_nodes(child)
+
+
+def sorts_tasks(plan):
+    # A sort with a tasks scan anywhere beneath it reads every matching row
+    # before returning the first page
+    if plan['Node Type'] in SORT_NODES:
+        return any(node.get('Relation Name') == 'tasks' for node in scan_nodes(plan))
+    return any(sorts_tasks(child) for child in plan.get('Plans', []))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--companies', type=int, default=10)
+    parser.add_argument('--locations-per-company', type=int, default=5)
+    parser.add_argument('--users-per-location', type=int, default=20)
+    parser.add_argument('--tasks-per-location', type=int, default=20000)
+    args = parser.parse_args()
+    random.seed(1)
+
+    import db
+    import tasks
+
+    problems = []
+    with harness.database(args.database_url) as connect_kwargs:
+        harness.apply_migrations(connect_kwargs)
+        users, _ = harness.seed(connect_kwargs, SimpleNamespace(
+            companies=args.companies, locations_per_company=args.locations_per_company,
+            users_per_location=args.users_per_location, tasks_per_location=args.tasks_per_location,
+        ))
+        user = random.choice(users)
+
+        def list_query(cursor=None, **filters):
+            # The statement list_tasks builds for these filters
+            conditions, params = tasks.task_filters(user, **filters)
+            if cursor:
+                conditions.append(f"{tasks.SORT_KEY} > (%s::date, %s, %s)")
+                params.extend(cursor)
+            return f"""
+                SELECT {tasks.TASK_COLUMNS}
+                FROM tasks t
+                JOIN locations l ON l.location_id = t.location_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {tasks.SORT_KEY}
+                LIMIT 51
+            """, params
+
+        def claim():
+            return f"""
+                WITH next_task AS (
+                    SELECT t.task_id
+                    FROM tasks t
+                    JOIN locations l ON l.location_id = t.location_id
+                    WHERE t.location_id = %s AND l.company_id = %s
+                      AND t.is_pooled AND t.assigned_to IS NULL AND t.status = 'open'
+                    ORDER BY {tasks.SORT_KEY}
+                    LIMIT 1
+                    FOR UPDATE OF t SKIP LOCKED
+                )
+                UPDATE tasks t
+                SET assigned_to = %s, is_pooled = FALSE
+                FROM next_task
+                WHERE t.task_id = next_task.task_id AND t.assigned_to IS NULL
+                RETURNING {tasks.TASK_COLUMNS}
+            """, [user['location_id'], user['company_id'], user['user_id']]
+
+        shapes = {
+            'list by location': list_query(location_id=user['location_id']),
+            'list by location+status': list_query(location_id=user['location_id'], status='open'),
+            'list by assignee': list_query(assigned_to=user['user_id']),
+            'list next page': list_query(location_id=user['location_id'], cursor=('2026-01-01', 3, 1000)),
+            'claim pooled task': claim(),
+        }
+        with db.connection(user['company_id']) as conn:
+            with conn.cursor() as cur:
+                for name, (sql, params) in shapes.items():
+                    cur.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                    plan = cur.fetchone()[0][0]['Plan']
+                    print(f"{name:<24} cost {plan['Total Cost']:>10.2f}")
+                    for node in scan_nodes(plan):
+                        label = node.get('Index Name') or node.get('Relation Name') or ', '.join(node.get('Sort Key', []))
+                        print(f"    {node['Node Type']:<20} {label}")
+                        if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') == 'tasks':
+                            problems.append(f'{name} (Seq Scan)')
+                    if name.startswith('list') and sorts_tasks(plan):
+                        problems.append(f'{name} (Sort)')
+
+    if problems:
+        print('Tasks read without an index in SORT_KEY order: ' + ', '.join(problems), file=sys.stderr)
+        sys.exit(1)
+    print('No query shape scans or sorts tasks')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Concurrency test for the postSignup first-user race.
+
+Creates --companies empty companies, then for each one releases --signups
+simultaneous postSignup inserts on separate connections (as concurrent
+Lambda invocations would be). Fails unless every company ends up with exactly
+one default location, every signup created its user, and the first user
+owns the default location. Reports per-signup latency.
+
+    python benchmarks/postsignup_race.py --companies 20 --signups 16
+"""
+import argparse
+import sys
+import threading
+import time
+import uuid
+
+import harness
+
+import psycopg2
+
+
+def signup(postSignup, connect_kwargs, company_id, start_gate, latencies, errors):
+    conn = psycopg2.connect(**connect_kwargs)
+    suffix = uuid.uuid4().hex[:12]
+    attributes = {
+        'sub': f'race-{suffix}', 'custom:role': 'employee', 'custom:company_id': str(company_id),
+        'given_name': 'Race', 'family_name': 'Signup', 'email': f'race-{suffix}@example.com',
+    }
+    try:
+        start_gate.wait()
+        start = time.perf_counter()
+        with conn.cursor() as cur:
+            postSignup.insert_user(cur, attributes)
+        conn.commit()
+        latencies.append((time.perf_counter() - start) * 1000)
+    except Exception as e:
+        errors.append(str(e))
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--companies', type=int, default=20)
+    parser.add_argument('--signups', type=int, default=16, help='simultaneous signups per company')
+    args = parser.parse_args()
+
+    import postSignup
+
+    problems = []
+    with harness.database(args.database_url, {'max_connections': args.signups + 20}) as connect_kwargs:
+        harness.apply_migrations(connect_kwargs)
+
+        conn = psycopg2.connect(**connect_kwargs)
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO companies (name) SELECT 'Race company ' || g FROM generate_series(1, %s) g
+                RETURNING company_id
+            """, (args.companies,))
+            company_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+
+        latencies, errors = [], []
+        for company_id in company_ids:
+            start_gate = threading.Barrier(args.signups)
+            threads = [
+                threading.Thread(target=signup, args=(postSignup, connect_kwargs, company_id, start_gate, latencies, errors))
+                for _ in range(args.signups)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            problems.append(f"{len(errors)} signups failed, e.g. {errors[0]}")
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.company_id,
+                       (SELECT count(*) FROM locations l WHERE l.company_id = c.company_id) AS locations,
+                       (SELECT count(*) FROM users u WHERE u.company_id = c.company_id) AS users,
+                       (SELECT u.location_id = (SELECT min(location_id) FROM locations l WHERE l.company_id = c.company_id)
+                        FROM users u WHERE u.company_id = c.company_id ORDER BY u.user_id LIMIT 1) AS first_owns_default
+                FROM companies c
+                WHERE c.company_id = ANY(%s)
+            """, (company_ids,))
+            for company_id, locations, users, first_owns_default in cur.fetchall():
+                if locations != 1:
+                    problems.append(f"company {company_id} has {locations} default locations")
+                if users != args.signups:
+                    problems.append(f"company {company_id} has {users} users, expected {args.signups}")
+                if not first_owns_default:
+                    problems.append(f"company {company_id}: first user is not in the default location")
+        conn.close()
+
+        latencies.sort()
+        if latencies:
+            print(f"{len(latencies)} signups across {len(company_ids)} companies: p50 {latencies[len(latencies) // 2]:.2f} ms  "
+                  f"p95 {harness.percentile(latencies, 0.95):.2f} ms  max {latencies[-1]:.2f} ms")
+
+    if problems:
+        print('postSignup race test failed:\n  ' + '\n  '.join(problems[:20]), file=sys.stderr)
+        sys.exit(1)
+    print('Exactly one default location per company')
+
+
+if __name__ == '__main__':
+    main()
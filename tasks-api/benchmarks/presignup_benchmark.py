@@ -0,0 +1,120 @@
+"""Latency of the preSignup validation path, old vs. new.
+
+Compares the original implementation (a fresh connection and a COUNT(*)
+per check) with preSignup validation on a warm pooled connection, with and
+without the cache. Cognito is replaced by a stub with a fixed delay.
+
+    DATABASE_URL=postgresql://localhost/tasksdb python benchmarks/presignup_benchmark.py --users 5000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import psycopg2
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path[:0] = [os.path.join(API_DIR, 'shared'), os.path.join(API_DIR, 'cognitoTriggers')]
+os.environ.setdefault('USER_POOL_ID', 'local')
+
+import aws_clients  # noqa: E402
+import cache  # noqa: E402
+import preSignup  # noqa: E402
+
+
+class StubCognito:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def admin_get_user(self, UserPoolId, Username):
+        time.sleep(self.delay)
+        return {'UserAttributes': [{'Name': 'custom:role', 'Value': 'super_admin'}]}
+
+
+def legacy_checks(company_id):
+    # The pre-pool behaviour: one connection and one COUNT(*) per question,
+    # followed by an uncached admin_get_user
+    results = []
+    for query in ("SELECT COUNT(*) FROM companies WHERE company_id = %s",
+                  "SELECT COUNT(*) FROM users WHERE company_id = %s"):
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        try:
+            with conn.cursor() as cur:
+                cur.execute(query, (company_id,))
+                results.append(cur.fetchone()[0] > 0)
+        finally:
+            conn.close()
+    aws_clients.get_client('cognito-idp').admin_get_user(UserPoolId='local', Username='admin@example.com')
+    return results
+
+
+def seed(conn, user_count):
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO companies (name) VALUES ('preSignup benchmark') RETURNING company_id")
+        company_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO users (cognito_user_id, profile_type, fname, lname, email, company_id)
+            SELECT 'presignup-bench-' || g, 'employee', 'Bench', 'User', 'presignup-bench-' || g || '@example.com', %s
+            FROM generate_series(1, %s) g
+        """, (company_id, user_count))
+    conn.commit()
+    return company_id
+
+
+def cleanup(conn, company_id):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM users WHERE company_id = %s", (company_id,))
+        cur.execute("DELETE FROM companies WHERE company_id = %s", (company_id,))
+    conn.commit()
+
+
+def timed(func, iterations, before_each=None):
+    samples = []
+    for _ in range(iterations):
+        if before_each:
+            before_each()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'p50': statistics.median(samples),
+        'p95': samples[int(len(samples) * 0.95) - 1],
+        'max': samples[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000, help='users seeded into the benchmark company')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--cognito-delay-ms', type=float, default=30.0)
+    args = parser.parse_args()
+
+    aws_clients._clients['cognito-idp'] = StubCognito(args.cognito_delay_ms / 1000)
+    setup_conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    company_id = seed(setup_conn, args.users)
+    try:
+        event = {'request': {'userAttributes': [
+            {'Name': 'custom:company_id', 'Value': str(company_id)},
+            {'Name': 'custom:role', 'Value': 'employee'},
+        ]}}
+        context = SimpleNamespace(identity=SimpleNamespace(username='admin@example.com'))
+        reset_cache = lambda: cache.set_backend(cache.LocalCache(cache.MAX_ENTRIES))
+
+        results = {
+            'legacy checks (2 connects, COUNT)': timed(lambda: legacy_checks(company_id), args.iterations),
+            'handler, cold cache': timed(lambda: preSignup.validate_signup(event, context), args.iterations, reset_cache),
+            'handler, warm cache': timed(lambda: preSignup.validate_signup(event, context), args.iterations),
+        }
+        for label, timing in results.items():
+            print(f"{label:<36} p50 {timing['p50']:7.2f} ms  p95 {timing['p95']:7.2f} ms  max {timing['max']:7.2f} ms")
+    finally:
+        cleanup(setup_conn, company_id)
+        setup_conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Row-level security overhead on the hot task queries.
+
+Seeds the harness data set into a throwaway Postgres (or --database-url),
+then times the GET /tasks list (by location, by location and status, by
+assignee), GET /tasks/{id}, the company-wide export and search handlers with
+tenant scoping off (owner role, explicit company filters only) and on
+(tasks_tenant role under the V10/V14 policies). Modes alternate in rounds so
+drift affects both equally. Exits non-zero if the median overhead of any
+query exceeds --max-overhead percent. --explain prints the RLS plans of the
+list, export and search queries; the tasks policy should show up as an
+InitPlan, not a per-row call of app_company_location_ids().
+
+    python benchmarks/rls_benchmark.py --tasks-per-location 20000 --explain
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import harness
+
+import psycopg2
+
+
+def timed(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--companies', type=int, default=10)
+    parser.add_argument('--locations-per-company', type=int, default=5)
+    parser.add_argument('--users-per-location', type=int, default=20)
+    parser.add_argument('--tasks-per-location', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=50, help='calls per query per round and mode')
+    parser.add_argument('--export-iterations', type=int, default=2, help='company-wide exports per round and mode')
+    parser.add_argument('--max-overhead', type=float, default=5.0, help='allowed median overhead in percent')
+    parser.add_argument('--explain', action='store_true', help='print the RLS plans of the list, export and search queries')
+    args = parser.parse_args()
+    random.seed(1)
+
+    import db
+    import tasks
+
+    failed = False
+    with harness.database(args.database_url) as connect_kwargs:
+        harness.apply_migrations(connect_kwargs)
+        users, task_ids = harness.seed(connect_kwargs, SimpleNamespace(
+            companies=args.companies, locations_per_company=args.locations_per_company,
+            users_per_location=args.users_per_location, tasks_per_location=args.tasks_per_location,
+        ))
+
+        conn = psycopg2.connect(**connect_kwargs)
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT t.task_id, l.company_id FROM tasks t JOIN locations l ON l.location_id = t.location_id
+                WHERE t.task_id = ANY(%s)
+            """, (task_ids,))
+            task_companies = cur.fetchall()
+        conn.close()
+
+        def list_kwargs(**overrides):
+            base = dict(status=None, location_id=None, assigned_to=None, limit=50, cursor=None, ids=None, fields=None)
+            base.update(overrides)
+            return base
+
+        def by_location():
+            user = random.choice(users)
+            return tasks.list_tasks(**list_kwargs(location_id=user['location_id'], user=user))
+
+        def by_location_status():
+            user = random.choice(users)
+            return tasks.list_tasks(**list_kwargs(location_id=user['location_id'], status='open', user=user))
+
+        def by_assignee():
+            user = random.choice(users)
+            return tasks.list_tasks(**list_kwargs(assigned_to=user['user_id'], user=user))
+
+        def single_task():
+            task_id, company_id = random.choice(task_companies)
+            return tasks.get_task(task_id, user={'company_id': company_id})
+
+        def export():
+            # Every task of one company, read to the end like a download
+            user = random.choice(users)
+            conditions, params = tasks.task_filters(user)
+            for _ in tasks.export_chunks(user['company_id'], conditions, params, 'csv'):
+                pass
+
+        def search():
+            user = random.choice(users)
+            with db.connection(user['company_id']) as conn:
+                with conn.cursor() as cur:
+                    return tasks.search_tasks(cur, user, f'synthetic task {random.randint(1, 99)}')
+
+        queries = {
+            'list by location': (by_location, args.iterations),
+            'list by location+status': (by_location_status, args.iterations),
+            'list by assignee': (by_assignee, args.iterations),
+            'get task': (single_task, args.iterations),
+            'export company': (export, args.export_iterations),
+            'search': (search, args.iterations),
+        }
+        samples = {name: {'off': [], 'on': []} for name in queries}
+        for _ in range(args.rounds):
+            for mode in ('off', 'on'):
+                db.TENANT_ROLE = 'tasks_tenant' if mode == 'on' else ''
+                for name, (func, iterations) in queries.items():
+                    func()
+                    samples[name][mode].extend(timed(func, iterations))
+
+        print(f"{'query':<26} {'no RLS p50':>11} {'RLS p50':>9} {'overhead':>9}")
+        for name, modes in samples.items():
+            off, on = statistics.median(modes['off']), statistics.median(modes['on'])
+            overhead = (on - off) / off * 100
+            failed = failed or overhead > args.max_overhead
+            print(f"{name:<26} {off:>9.3f}ms {on:>7.3f}ms {overhead:>+8.1f}%")
+
+        if args.explain:
+            db.TENANT_ROLE = 'tasks_tenant'
+            user = users[0]
+            conditions, params = tasks.task_filters(user)
+            plans = {
+                'list by location': (f"""
+                    SELECT {tasks.TASK_COLUMNS}
+                    FROM tasks t JOIN locations l ON l.location_id = t.location_id
+                    WHERE l.company_id = %s AND t.location_id = %s
+                    ORDER BY {tasks.SORT_KEY} LIMIT 51
+                """, (user['company_id'], user['location_id'])),
+                'export company': (f"""
+                    SELECT {tasks.TASK_COLUMNS}
+                    FROM tasks t JOIN locations l ON l.location_id = t.location_id
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY t.task_id
+                """, params),
+                'search': (f"""
+                    SELECT {tasks.TASK_COLUMNS}, ts_rank_cd(t.search_vector, q.query) AS rank
+                    FROM tasks t
+                    JOIN locations l ON l.location_id = t.location_id
+                    CROSS JOIN to_tsquery('english', %s) AS q(query)
+                    WHERE {' AND '.join(conditions)} AND t.search_vector @@ q.query
+                    ORDER BY rank DESC, t.task_id DESC
+                    LIMIT 20
+                """, [tasks.search_query('synthetic task 4')] + params),
+            }
+            with db.connection(user['company_id']) as scoped:
+                with scoped.cursor() as cur:
+                    for name, (sql, sql_params) in plans.items():
+                        cur.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", sql_params)
+                        print(f"\n-- {name}")
+                        print('\n'.join(row[0] for row in cur.fetchall()))
+
+    if failed:
+        print(f"RLS overhead above {args.max_overhead}%", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
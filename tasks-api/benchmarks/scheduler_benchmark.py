@@ -0,0 +1,136 @@
+"""Nightly task scheduler run time and its effect on live task writes.
+
+Seeds --tasks open tasks, most of them overdue, and --templates recurring
+task templates into a throwaway Postgres (or --database-url), then runs
+task_scheduler.run() while --writers threads keep updating random tasks as
+the API would, recording those updates' latency. A second run picks up the
+rows the writers held locked; a third must find nothing left to do, or the
+script exits non-zero.
+
+    python benchmarks/scheduler_benchmark.py --tasks 3000000 --chunk-size 5000
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+import harness
+
+import psycopg2
+
+
+def seed(connect_kwargs, tasks, templates):
+    conn = psycopg2.connect(**connect_kwargs)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO companies (name) VALUES ('Scheduler check') RETURNING company_id")
+        company_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO locations (company_id, name, address)
+            SELECT %s, 'Scheduler ' || g, g || ' Schedule Street' FROM generate_series(1, 20) g
+        """, (company_id,))
+        cur.execute("""
+            INSERT INTO users (cognito_user_id, profile_type, fname, lname, email, location_id, company_id)
+            SELECT 'scheduler-' || location_id, 'admin', 'Scheduler', 'Admin',
+                   'scheduler-' || location_id || '@example.com', location_id, company_id
+            FROM locations WHERE company_id = %s
+        """, (company_id,))
+        # Due dates from a year ago to a month ahead; a fifth already at priority 1
+        cur.execute("""
+            INSERT INTO tasks (source, creation_date_by_user, location_id, task_title, due_date, status, priority)
+            SELECT u.user_id, CURRENT_DATE, u.location_id, 'Scheduled task ' || g,
+                   CURRENT_DATE - 365 + g %% 395,
+                   (ARRAY['open', 'open', 'open', 'in progress', 'completed'])[1 + g %% 5],
+                   CASE WHEN g %% 5 = 0 THEN 1 WHEN g %% 7 = 0 THEN NULL ELSE 2 + g %% 4 END
+            FROM generate_series(1, %s) g
+            JOIN users u ON u.user_id = (SELECT min(user_id) FROM users WHERE company_id = %s) + g %% 20
+        """, (tasks, company_id))
+        cur.execute("""
+            INSERT INTO recurring_tasks (location_id, created_by, task_title, recurrence_interval, next_due_date)
+            SELECT u.location_id, u.user_id, 'Recurring task ' || g,
+                   (ARRAY['1 day', '1 week', '1 month'])[1 + g %% 3]::interval,
+                   CURRENT_DATE - g %% 10
+            FROM generate_series(1, %s) g
+            JOIN users u ON u.user_id = (SELECT min(user_id) FROM users WHERE company_id = %s) + g %% 20
+        """, (templates, company_id))
+        cur.execute("SELECT min(task_id), max(task_id) FROM tasks")
+        task_range = cur.fetchone()
+    conn.commit()
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("VACUUM ANALYZE tasks")
+        cur.execute("VACUUM ANALYZE recurring_tasks")
+    conn.close()
+    return task_range
+
+
+def writer(connect_kwargs, task_range, stop, latencies):
+    # Single-row updates like PUT /tasks/{id}, each its own transaction
+    conn = psycopg2.connect(**connect_kwargs)
+    with conn.cursor() as cur:
+        while not stop.is_set():
+            task_id = random.randint(*task_range)
+            start = time.perf_counter()
+            cur.execute("UPDATE tasks SET description = %s WHERE task_id = %s", (f'touched {time.time()}', task_id))
+            conn.commit()
+            latencies.append((time.perf_counter() - start) * 1000)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--tasks', type=int, default=3000000)
+    parser.add_argument('--templates', type=int, default=100000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--writers', type=int, default=4, help='concurrent API-like task updaters')
+    args = parser.parse_args()
+    random.seed(1)
+
+    import task_scheduler
+
+    failed = False
+    with harness.database(args.database_url, {'shared_buffers': '512MB'}) as connect_kwargs:
+        harness.apply_migrations(connect_kwargs)
+        start = time.monotonic()
+        task_range = seed(connect_kwargs, args.tasks, args.templates)
+        print(f"Seeded {args.tasks} tasks and {args.templates} templates in {time.monotonic() - start:.1f}s")
+
+        stop = threading.Event()
+        latencies = []
+        writers = [
+            threading.Thread(target=writer, args=(connect_kwargs, task_range, stop, latencies))
+            for _ in range(args.writers)
+        ]
+        for thread in writers:
+            thread.start()
+        start = time.monotonic()
+        try:
+            summary = task_scheduler.run(chunk_size=args.chunk_size)
+        finally:
+            elapsed = time.monotonic() - start
+            stop.set()
+            for thread in writers:
+                thread.join()
+
+        print(f"Scheduler run in {elapsed:.1f}s")
+        for name in ('recurring', 'escalation'):
+            print(f"  {name:<11} {summary[name]}")
+        latencies.sort()
+        if latencies:
+            print(f"Concurrent task updates: {len(latencies)}  p50 {latencies[len(latencies) // 2]:.2f} ms  "
+                  f"p99 {harness.percentile(latencies, 0.99):.2f} ms  max {latencies[-1]:.2f} ms")
+
+        for label in ('Catch-up run (rows skipped while locked)', 'Idempotency run'):
+            rerun = task_scheduler.run(chunk_size=args.chunk_size)
+            changed = rerun['recurring']['tasks_created'] + rerun['escalation']['tasks_escalated']
+            print(f"{label}: changed {changed} task(s)")
+        failed = changed > 0
+
+    if failed:
+        print("The scheduler is not idempotent: a repeated run found more work", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
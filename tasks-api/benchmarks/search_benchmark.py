@@ -0,0 +1,119 @@
+"""Full-text task search vs. ILIKE scans.
+
+Seeds --rows tasks with generated titles and descriptions into a throwaway
+Postgres (or --database-url), then times GET /tasks/search's query against
+the ILIKE '%term%' filter it replaces, scoped to one company as the endpoint
+is, for a set of single-word, multi-word and prefix searches.
+
+    python benchmarks/search_benchmark.py --rows 3000000
+"""
+import argparse
+import statistics
+import time
+
+import harness
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+WORDS = [
+    'restock', 'freezer', 'inventory', 'clean', 'counter', 'inspect', 'delivery', 'schedule',
+    'register', 'window', 'display', 'shelf', 'invoice', 'order', 'repair', 'lighting',
+    'parking', 'training', 'safety', 'audit', 'supplier', 'refund', 'storage', 'signage',
+]
+
+SEARCHES = ['freezer', 'restock shelf', 'inv', 'safety audit training', 'signage repair']
+
+
+def seed(connect_kwargs, rows, companies):
+    conn = psycopg2.connect(**connect_kwargs)
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO companies (name) SELECT 'Search company ' || g FROM generate_series(1, %s) g
+        """, (companies,))
+        cur.execute("""
+            INSERT INTO locations (company_id, name, address)
+            SELECT company_id, 'Search location', '1 Search Street' FROM companies
+        """)
+        cur.execute("""
+            INSERT INTO users (cognito_user_id, profile_type, fname, lname, email, location_id, company_id)
+            SELECT 'search-' || location_id, 'admin', 'Search', 'Admin', 'search-' || location_id || '@example.com',
+                   location_id, company_id
+            FROM locations
+        """)
+        cur.execute("SELECT user_id, company_id, location_id, profile_type FROM users ORDER BY user_id LIMIT 1")
+        user = dict(zip(('user_id', 'company_id', 'location_id', 'profile_type'), cur.fetchone()))
+        # Random three-word titles and eight-word descriptions from a small vocabulary
+        cur.execute("""
+            INSERT INTO tasks (source, creation_date_by_user, location_id, task_title, description, status)
+            SELECT u.user_id, CURRENT_DATE, u.location_id,
+                   (SELECT string_agg(w[1 + floor(random() * array_length(w, 1))::int], ' ')
+                    FROM generate_series(1, 3) WHERE g > 0),
+                   (SELECT string_agg(w[1 + floor(random() * array_length(w, 1))::int], ' ')
+                    FROM generate_series(1, 8) WHERE g > 0),
+                   (ARRAY['open', 'in progress', 'completed'])[1 + g %% 3]
+            FROM generate_series(1, %s) g
+            JOIN users u ON u.user_id = (SELECT min(user_id) FROM users) + g %% %s
+            CROSS JOIN (SELECT %s::text[] AS w) words
+        """, (rows, companies, WORDS))
+        cur.execute("ANALYZE tasks")
+    conn.commit()
+    conn.close()
+    return user
+
+
+def ilike_search(cur, user, text, limit=20):
+    conditions = ["l.company_id = %s"]
+    params = [user['company_id']]
+    for term in text.split():
+        conditions.append("(t.task_title ILIKE %s OR t.description ILIKE %s)")
+        params.extend([f'%{term}%', f'%{term}%'])
+    cur.execute(f"""
+        SELECT t.task_id FROM tasks t
+        JOIN locations l ON l.location_id = t.location_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY t.task_id DESC
+        LIMIT %s
+    """, params + [limit])
+    return cur.fetchall()
+
+
+def timed(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), harness.percentile(samples, 0.95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--rows', type=int, default=3000000)
+    parser.add_argument('--companies', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    import tasks
+
+    with harness.database(args.database_url, {'shared_buffers': '512MB'}) as connect_kwargs:
+        harness.apply_migrations(connect_kwargs)
+        start = time.monotonic()
+        user = seed(connect_kwargs, args.rows, args.companies)
+        print(f"Seeded {args.rows} tasks in {time.monotonic() - start:.1f}s")
+
+        conn = psycopg2.connect(**connect_kwargs)
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            print(f"{'search':<26} {'matches':>8} {'fts p50':>9} {'fts p95':>9} {'ilike p50':>10} {'ilike p95':>10}")
+            for text in SEARCHES:
+                matches = len(tasks.search_tasks(cur, user, text))
+                fts = timed(lambda: tasks.search_tasks(cur, user, text), args.iterations)
+                ilike = timed(lambda: ilike_search(cur, user, text), args.iterations)
+                print(f"{text:<26} {matches:>8} {fts[0]:>7.2f}ms {fts[1]:>7.2f}ms {ilike[0]:>8.2f}ms {ilike[1]:>8.2f}ms")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,91 +1,55 @@
-import os
-import boto3
-import psycopg2
-from botocore.exceptions import ClientError
+import db
+import instrumentation
 
-def get_secret():
-    secret_name = os.environ['DB_SECRET_ARN']
-    region_name = os.environ['AWS_REGION']
-
-    session = boto3.session.Session()
-    client = session.client(service_name='secretsmanager', region_name=region_name)
-
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
-        raise e
-
-    secret = eval(get_secret_value_response['SecretString'])
-    return secret
+# First key of the two-key advisory lock taken per company during signup; the
+# second key is the company id
+SIGNUP_LOCK_NAMESPACE = 727275
 
 def handler(event, context):
-    user_pool_id = os.environ['USER_POOL_ID']
-    db_name = os.environ['DB_NAME']
-
-    user_attributes = {attr['Name']: attr['Value'] for attr in event['request']['userAttributes']}
-    
-    # Get database connection details
-    secret = get_secret()
-    
-    # Connect to the database
-    conn = psycopg2.connect(
-        host=secret['host'],
-        database=db_name,
-        user=secret['username'],
-        password=secret['password']
-    )
-    
     try:
-        with conn.cursor() as cur:
-            # Check if this is the first user for the company
-            cur.execute("SELECT COUNT(*) FROM users WHERE company_id = %s", (user_attributes['custom:company_id'],))
-            is_first_user = cur.fetchone()[0] == 0
-
-            # Insert the new user into the users table
-            cur.execute("""
-                INSERT INTO users (cognito_user_id, profile_type, company_id, fname, lname, email)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                RETURNING user_id
-            """, (
-                user_attributes['sub'],
-                user_attributes['custom:role'],
-                user_attributes['custom:company_id'],
-                user_attributes['given_name'],
-                user_attributes['family_name'],
-                user_attributes['email']
-            ))
-            
-            new_user_id = cur.fetchone()[0]
-            
-            # If location_id was provided, update the user with it
-            if 'custom:location_id' in user_attributes:
-                cur.execute("""
-                    UPDATE users
-                    SET location_id = %s
-                    WHERE user_id = %s
-                """, (user_attributes['custom:location_id'], new_user_id))
-            
-            # If this is the first user, create a default location for the company
-            if is_first_user:
-                cur.execute("""
-                    INSERT INTO locations (company_id, name, address)
-                    VALUES (%s, 'Default Location', 'Default Address')
-                    RETURNING location_id
-                """, (user_attributes['custom:company_id'],))
-                default_location_id = cur.fetchone()[0]
-                
-                # Assign the default location to the user
-                cur.execute("""
-                    UPDATE users
-                    SET location_id = %s
-                    WHERE user_id = %s
-                """, (default_location_id, new_user_id))
-            
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
+        return register_user(event)
     finally:
-        conn.close()
+        instrumentation.emit_metrics()
+
+def insert_user(cur, user_attributes):
+    # One round-trip. The transaction-scoped advisory lock serialises signups
+    # for the same company, and because it is its own statement the CTE's
+    # snapshot is taken after the lock is granted: a second simultaneous first
+    # signup waits, then sees the first user and creates no default location.
+    # The first user of a company gets a default location, which takes
+    # precedence over any custom:location_id, as before.
+    cur.execute("""
+        SELECT pg_advisory_xact_lock(%(lock_namespace)s, %(company_id)s::integer);
+        WITH company AS (
+            SELECT NOT EXISTS (SELECT 1 FROM users WHERE company_id = %(company_id)s::integer) AS is_first_user
+        ), default_location AS (
+            INSERT INTO locations (company_id, name, address)
+            SELECT %(company_id)s::integer, 'Default Location', 'Default Address'
+            FROM company
+            WHERE is_first_user
+            RETURNING location_id
+        )
+        INSERT INTO users (cognito_user_id, profile_type, company_id, fname, lname, email, location_id)
+        SELECT %(sub)s, %(role)s, %(company_id)s::integer, %(fname)s, %(lname)s, %(email)s,
+               COALESCE((SELECT location_id FROM default_location), %(location_id)s::integer)
+        RETURNING user_id, location_id
+    """, {
+        'lock_namespace': SIGNUP_LOCK_NAMESPACE,
+        'company_id': user_attributes['custom:company_id'],
+        'sub': user_attributes['sub'],
+        'role': user_attributes['custom:role'],
+        'fname': user_attributes['given_name'],
+        'lname': user_attributes['family_name'],
+        'email': user_attributes['email'],
+        'location_id': user_attributes.get('custom:location_id'),
+    })
+    return cur.fetchone()
+
+def register_user(event):
+    user_attributes = {attr['Name']: attr['Value'] for attr in event['request']['userAttributes']}
+
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            insert_user(cur, user_attributes)
 
-    return event
\ No newline at end of file
+    return event
@@ -1,60 +1,50 @@
 import os
-import boto3
-import psycopg2
 from botocore.exceptions import ClientError
 
-def get_secret():
-    secret_name = os.environ['DB_SECRET_ARN']
-    region_name = os.environ['AWS_REGION']
+import db
+import cache
+import aws_clients
+import instrumentation
 
-    session = boto3.session.Session()
-    client = session.client(service_name='secretsmanager', region_name=region_name)
-
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
-        raise e
-
-    secret = eval(get_secret_value_response['SecretString'])
-    return secret
-
-def check_company_exists(company_id):
-    secret = get_secret()
-    conn = psycopg2.connect(
-        host=secret['host'],
-        database=os.environ['DB_NAME'],
-        user=secret['username'],
-        password=secret['password']
-    )
-    
-    try:
+def load_company_state(company_id):
+    # Both facts in one round-trip; EXISTS stops at the first matching user
+    # instead of counting every user of the company.
+    with db.connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM companies WHERE company_id = %s", (company_id,))
-            count = cur.fetchone()[0]
-        return count > 0
-    finally:
-        conn.close()
+            cur.execute("""
+                SELECT EXISTS (SELECT 1 FROM companies WHERE company_id = %s),
+                       EXISTS (SELECT 1 FROM users WHERE company_id = %s)
+            """, (company_id, company_id))
+            company_exists, has_users = cur.fetchone()
+    return {'exists': company_exists, 'has_users': has_users}
 
-def check_company_has_users(company_id):
-    secret = get_secret()
-    conn = psycopg2.connect(
-        host=secret['host'],
-        database=os.environ['DB_NAME'],
-        user=secret['username'],
-        password=secret['password']
+def check_company(company_id):
+    # Only companies that already have users are cached (which also proves they
+    # exist): a cached "no users" would let a second signup pass as the
+    # company's first super_admin.
+    state = cache.get_or_load(
+        cache.COMPANY_HAS_USERS, company_id,
+        lambda: load_company_state(company_id),
+        cache_if=lambda state: state['has_users']
     )
-    
+    return state['exists'], state['has_users']
+
+def get_creating_user_attributes(user_pool_id, username):
+    # Not cached: the creator's role is an authorization decision, and a
+    # demotion must take effect on the next signup rather than after a TTL
+    client = aws_clients.get_client('cognito-idp')
+    creating_user = client.admin_get_user(UserPoolId=user_pool_id, Username=username)
+    return {attr['Name']: attr['Value'] for attr in creating_user['UserAttributes']}
+
+def handler(event, context):
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM users WHERE company_id = %s", (company_id,))
-            count = cur.fetchone()[0]
-        return count > 0
+        return validate_signup(event, context)
     finally:
-        conn.close()
+        cache.emit_metrics()
+        instrumentation.emit_metrics()
 
-def handler(event, context):
+def validate_signup(event, context):
     user_pool_id = os.environ['USER_POOL_ID']
-    client = boto3.client('cognito-idp')
 
     user_attributes = {attr['Name']: attr['Value'] for attr in event['request']['userAttributes']}
     
@@ -64,12 +54,12 @@ def handler(event, context):
     
     company_id = user_attributes['custom:company_id']
     
-    # Check if the company exists
-    if not check_company_exists(company_id):
+    # Check if the company exists and whether this is its first user
+    company_exists, has_users = check_company(company_id)
+    if not company_exists:
         raise Exception("Invalid company ID")
     
-    # Check if this is the first user for the company
-    is_first_user = not check_company_has_users(company_id)
+    is_first_user = not has_users
     
     if is_first_user:
         # If this is the first user, they must be a super_admin
@@ -78,11 +68,7 @@ def handler(event, context):
     else:
         # If not the first user, check if the creating user is an admin or super_admin
         try:
-            creating_user = client.admin_get_user(
-                UserPoolId=user_pool_id,
-                Username=context.identity.username
-            )
-            creating_user_attributes = {attr['Name']: attr['Value'] for attr in creating_user['UserAttributes']}
+            creating_user_attributes = get_creating_user_attributes(user_pool_id, context.identity.username)
             
             if creating_user_attributes.get('custom:role') not in ['admin', 'super_admin']:
                 raise Exception("Only admins or super admins can create new users")
@@ -1,70 +1,306 @@
-import os
 import json
-import boto3
-import psycopg2
-import uuid
-from botocore.exceptions import ClientError
 
-def get_secret():
-    secret_name = os.environ['DB_SECRET_ARN']
-    region_name = os.environ['AWS_REGION']
+import psycopg2.errors
+from psycopg2.extras import RealDictCursor
 
-    session = boto3.session.Session()
-    client = session.client(service_name='secretsmanager', region_name=region_name)
+import db
+import auth
+import cache
+import instrumentation
 
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
-        raise e
+COMPANY_COLUMNS = "company_id, name, created_at, revision"
+LOCATION_COLUMNS = "location_id, company_id, name, address, created_at"
 
-    secret = eval(get_secret_value_response['SecretString'])
-    return secret
+def response(status_code, body, headers=None):
+    result = {
+        'statusCode': status_code,
+        'body': json.dumps(body, default=str)
+    }
+    if headers:
+        result['headers'] = headers
+    return result
 
-def create_company(company_name):
-    secret = get_secret()
-    conn = psycopg2.connect(
-        host=secret['host'],
-        database=os.environ['DB_NAME'],
-        user=secret['username'],
-        password=secret['password']
-    )
-    
+def path_id(event, name):
     try:
+        return int(event['pathParameters'][name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def create_company(company_name):
+    # Unscoped: the new company is outside the caller's row-level security scope
+    with db.connection() as conn:
         with conn.cursor() as cur:
-            company_id = str(uuid.uuid4())  # Generate a unique company ID
-            cur.execute("INSERT INTO companies (company_id, name) VALUES (%s, %s)", (company_id, company_name))
-        conn.commit()
-        return company_id
+            cur.execute("INSERT INTO companies (name) VALUES (%s) RETURNING company_id", (company_name,))
+            return cur.fetchone()[0]
+
+def post_company(event):
+    body = json.loads(event['body'])
+    company_name = body.get('company_name')
+
+    if not company_name:
+        return {
+            'statusCode': 400,
+            'body': json.dumps('Company name is required')
+        }
+
+    try:
+        company_id = create_company(company_name)
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'company_id': company_id, 'message': 'Company created successfully'})
+        }
     except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+        return {
+            'statusCode': 500,
+            'body': json.dumps(f'Error creating company: {str(e)}')
+        }
+
+# Every handler below runs under db.connection(company_id) for the caller's
+# company, so row-level security (V10) hides other tenants' rows even where a
+# query only filters by id.
+
+def list_companies(company_id):
+    with db.connection(company_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"SELECT {COMPANY_COLUMNS} FROM companies WHERE company_id = %s", (company_id,))
+            return response(200, {'companies': cur.fetchall()})
+
+def get_company(company_id):
+    with db.connection(company_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"SELECT {COMPANY_COLUMNS} FROM companies WHERE company_id = %s", (company_id,))
+            company = cur.fetchone()
+    if not company:
+        return response(404, {'message': 'Company not found'})
+    return response(200, company)
+
+def update_company(company_id, event):
+    company_name = json.loads(event['body'] or '{}').get('company_name')
+    if not company_name:
+        return response(400, {'message': 'Company name is required'})
+    with db.connection(company_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # The name is part of the org tree, so renaming starts a new revision
+            cur.execute(f"""
+                UPDATE companies SET name = %s, revision = revision + 1
+                WHERE company_id = %s
+                RETURNING {COMPANY_COLUMNS}
+            """, (company_name, company_id))
+            company = cur.fetchone()
+    if not company:
+        return response(404, {'message': 'Company not found'})
+    return response(200, company)
+
+def delete_company(company_id):
+    try:
+        with db.connection(company_id) as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM companies WHERE company_id = %s RETURNING company_id", (company_id,))
+                deleted = cur.fetchone()
+    except psycopg2.errors.ForeignKeyViolation:
+        return response(409, {'message': 'Company still has locations or users'})
+    if not deleted:
+        return response(404, {'message': 'Company not found'})
+    return response(200, {'message': 'Company deleted successfully'})
+
+def company_etag(company_id, revision):
+    return f'"{company_id}-{revision}"'
+
+def if_none_match(event):
+    # API Gateway passes headers as sent; HTTP header names are case-insensitive
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'if-none-match'), None)
+    if not value:
+        return set()
+    return {tag.strip().replace('W/', '', 1) for tag in value.split(',')}
+
+def load_company_tree(company_id):
+    # Locations with their user counts, plus users not placed in any location,
+    # in one statement over idx_users_company_id
+    with db.connection(company_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                WITH user_counts AS (
+                    SELECT location_id, count(*) AS user_count
+                    FROM users
+                    WHERE company_id = %(company_id)s
+                    GROUP BY location_id
+                )
+                SELECT c.company_id, c.name, c.revision,
+                       COALESCE((SELECT sum(user_count) FROM user_counts), 0)::integer AS user_count,
+                       COALESCE((SELECT user_count FROM user_counts WHERE location_id IS NULL), 0)::integer
+                           AS unassigned_user_count,
+                       COALESCE((
+                           SELECT json_agg(json_build_object(
+                               'location_id', l.location_id,
+                               'name', l.name,
+                               'address', l.address,
+                               'user_count', COALESCE(uc.user_count, 0)
+                           ) ORDER BY l.location_id)
+                           FROM locations l
+                           LEFT JOIN user_counts uc ON uc.location_id = l.location_id
+                           WHERE l.company_id = c.company_id
+                       ), '[]'::json) AS locations
+                FROM companies c
+                WHERE c.company_id = %(company_id)s
+            """, {'company_id': company_id})
+            tree = cur.fetchone()
+    return dict(tree) if tree else None
+
+def get_company_tree(company_id, event):
+    # The revision is a primary key lookup; the aggregation only runs when the
+    # client's copy is stale and no other request has loaded this revision.
+    with db.connection(company_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT revision FROM companies WHERE company_id = %s", (company_id,))
+            result = cur.fetchone()
+    if not result:
+        return response(404, {'message': 'Company not found'})
+
+    revision = result[0]
+    etag = company_etag(company_id, revision)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag in if_none_match(event):
+        return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+    tree = cache.get_or_load(cache.COMPANY_TREE, f'{company_id}:{revision}', lambda: load_company_tree(company_id))
+    if not tree:
+        return response(404, {'message': 'Company not found'})
+    # A write between the two reads means the tree is newer than the revision
+    # looked up first; label it with its own revision
+    headers['ETag'] = company_etag(company_id, tree['revision'])
+    return response(200, tree, headers)
+
+def create_location(company_id, event):
+    body = json.loads(event['body'] or '{}')
+    if not body.get('name'):
+        return response(400, {'message': 'name is required'})
+    if body.get('company_id') not in (None, company_id, str(company_id)):
+        return response(403, {'message': 'Locations can only be created in your own company'})
+    with db.connection(company_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"""
+                INSERT INTO locations (company_id, name, address)
+                VALUES (%s, %s, %s)
+                RETURNING {LOCATION_COLUMNS}
+            """, (company_id, body['name'], body.get('address')))
+            location = cur.fetchone()
+    return response(200, location)
+
+def list_locations(company_id):
+    with db.connection(company_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"""
+                SELECT {LOCATION_COLUMNS} FROM locations WHERE company_id = %s ORDER BY location_id
+            """, (company_id,))
+            return response(200, {'locations': cur.fetchall()})
+
+def get_location(company_id, location_id):
+    with db.connection(company_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"""
+                SELECT {LOCATION_COLUMNS} FROM locations WHERE location_id = %s AND company_id = %s
+            """, (location_id, company_id))
+            location = cur.fetchone()
+    if not location:
+        return response(404, {'message': 'Location not found'})
+    return response(200, location)
+
+def update_location(company_id, location_id, event):
+    body = json.loads(event['body'] or '{}')
+    if not body.get('name') and 'address' not in body:
+        return response(400, {'message': 'name or address is required'})
+    with db.connection(company_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"""
+                UPDATE locations
+                SET name = COALESCE(%s, name),
+                    address = CASE WHEN %s THEN %s ELSE address END
+                WHERE location_id = %s AND company_id = %s
+                RETURNING {LOCATION_COLUMNS}
+            """, (body.get('name'), 'address' in body, body.get('address'), location_id, company_id))
+            location = cur.fetchone()
+    if not location:
+        return response(404, {'message': 'Location not found'})
+    return response(200, location)
+
+def delete_location(company_id, location_id):
+    try:
+        with db.connection(company_id) as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM locations WHERE location_id = %s AND company_id = %s RETURNING location_id",
+                    (location_id, company_id)
+                )
+                deleted = cur.fetchone()
+    except psycopg2.errors.ForeignKeyViolation:
+        return response(409, {'message': 'Location still has users or tasks'})
+    if not deleted:
+        return response(404, {'message': 'Location not found'})
+    return response(200, {'message': 'Location deleted successfully'})
 
 def handler(event, context):
-    if event['httpMethod'] == 'POST':
-        body = json.loads(event['body'])
-        company_name = body.get('company_name')
-        
-        if not company_name:
-            return {
-                'statusCode': 400,
-                'body': json.dumps('Company name is required')
-            }
-        
-        try:
-            company_id = create_company(company_name)
-            return {
-                'statusCode': 200,
-                'body': json.dumps({'company_id': company_id, 'message': 'Company created successfully'})
-            }
-        except Exception as e:
-            return {
-                'statusCode': 500,
-                'body': json.dumps(f'Error creating company: {str(e)}')
-            }
-    else:
-        return {
-            'statusCode': 405,
-            'body': json.dumps('Method not allowed')
-        }
\ No newline at end of file
+    try:
+        return route(event)
+    finally:
+        cache.emit_metrics()
+        instrumentation.emit_metrics()
+
+def route(event):
+    http_method = event['httpMethod']
+    resource = event['resource']
+
+    caller = auth.get_caller(event)
+    if not caller:
+        return response(403, {'message': 'User not found'})
+    # Reads are open to everyone in the company; changes need an admin, and
+    # creating or listing companies is reserved to super admins
+    if http_method in ('POST', 'PUT', 'DELETE') and caller['profile_type'] not in auth.ADMIN_ROLES:
+        return response(403, {'message': 'Only admins or super admins can change companies and locations'})
+    if resource == '/companies' and caller['profile_type'] != 'super_admin':
+        return response(403, {'message': 'Only super admins can create or list companies'})
+
+    if resource == '/companies' and http_method == 'POST':
+        return post_company(event)
+
+    company_id = caller['company_id']
+    try:
+        if resource == '/companies' and http_method == 'GET':
+            # A super admin's scope is still their own company
+            return list_companies(company_id)
+        elif resource.startswith('/companies/{companyId}'):
+            # Other companies are reported as missing rather than forbidden
+            # so their ids can't be probed
+            if path_id(event, 'companyId') != company_id:
+                return response(404, {'message': 'Company not found'})
+            if resource == '/companies/{companyId}/tree' and http_method == 'GET':
+                return get_company_tree(company_id, event)
+            elif resource == '/companies/{companyId}':
+                if http_method == 'GET':
+                    return get_company(company_id)
+                elif http_method == 'PUT':
+                    return update_company(company_id, event)
+                elif http_method == 'DELETE':
+                    return delete_company(company_id)
+        elif resource == '/locations' and http_method == 'POST':
+            return create_location(company_id, event)
+        elif resource == '/locations' and http_method == 'GET':
+            return list_locations(company_id)
+        elif resource == '/locations/{locationId}':
+            location_id = path_id(event, 'locationId')
+            if location_id is None:
+                return response(400, {'message': 'Invalid location id'})
+            if http_method == 'GET':
+                return get_location(company_id, location_id)
+            elif http_method == 'PUT':
+                return update_location(company_id, location_id, event)
+            elif http_method == 'DELETE':
+                return delete_location(company_id, location_id)
+    except Exception as e:
+        print(f"Error handling {http_method} {resource}: {str(e)}")
+        return response(500, {'error': str(e)})
+
+    return {
+        'statusCode': 405,
+        'body': json.dumps('Method not allowed')
+    }
@@ -1,13 +1,15 @@
 import os
-import boto3
+import re
+import time
+import hashlib
 import psycopg2
-from botocore.exceptions import ClientError
 import json
 import logging
-from psycopg2 import sql
-from psycopg2.errors import DuplicateTable, DuplicateObject
 import urllib3
 
+import aws_clients
+import instrumentation
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
@@ -31,11 +33,21 @@ def send_cfn_response(event, context, response_status, reason=None, response_dat
         logger.error(f"Failed to send CFN response: {str(e)}")
 
 def get_secret(secret_arn):
-    client = boto3.client('secretsmanager')
+    client = aws_clients.get_client('secretsmanager')
     response = client.get_secret_value(SecretId=secret_arn)
     return json.loads(response['SecretString'])
 
-def check_migrations_applied(cur):
+# Arbitrary constant shared by every deploy so only one runner migrates at a time
+MIGRATION_LOCK_ID = 727274
+BATCH_DIRECTIVE = re.compile(r'^\s*--\s*@batch\b', re.MULTILINE)
+# Statements PostgreSQL refuses to run inside a transaction block
+NON_TRANSACTIONAL = re.compile(r'\bCONCURRENTLY\b|^\s*VACUUM\b|^\s*ALTER\s+SYSTEM\b', re.IGNORECASE)
+DOLLAR_QUOTE = re.compile(r'\$[A-Za-z_][A-Za-z0-9_]*\$|\$\$')
+CONCURRENT_INDEX = re.compile(
+    r'\bCREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?("[^"]+"|\w+)', re.IGNORECASE
+)
+
+def ensure_migrations_table(cur, conn):
     cur.execute("""
         CREATE TABLE IF NOT EXISTS migrations (
             id SERIAL PRIMARY KEY,
@@ -43,57 +55,233 @@ def check_migrations_applied(cur):
             applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
         )
     """)
-    cur.execute("SELECT COUNT(*) FROM migrations")
-    count = cur.fetchone()[0]
-    return count > 0
+    # Rows written by the original runner are complete migrations without a checksum
+    cur.execute("""
+        ALTER TABLE migrations
+            ADD COLUMN IF NOT EXISTS checksum VARCHAR(64),
+            ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'applied',
+            ADD COLUMN IF NOT EXISTS completed_steps INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS execution_ms INTEGER
+    """)
+    conn.commit()
+
+def strip_comments(statement):
+    return '\n'.join(line for line in statement.splitlines() if not line.strip().startswith('--')).strip()
+
+def split_statements(sql_content):
+    # Split on top-level semicolons, skipping over comments, quoted strings,
+    # quoted identifiers and $tag$ bodies so plpgsql functions stay whole.
+    statements = []
+    start = i = 0
+    length = len(sql_content)
+    while i < length:
+        if sql_content.startswith('--', i):
+            newline = sql_content.find('\n', i)
+            i = length if newline == -1 else newline + 1
+        elif sql_content.startswith('/*', i):
+            close = sql_content.find('*/', i + 2)
+            i = length if close == -1 else close + 2
+        elif sql_content[i] in ("'", '"'):
+            quote = sql_content[i]
+            i += 1
+            while i < length:
+                if sql_content[i] == quote:
+                    if sql_content.startswith(quote * 2, i):
+                        i += 2
+                        continue
+                    break
+                i += 1
+            i += 1
+        elif sql_content[i] == '$' and DOLLAR_QUOTE.match(sql_content, i):
+            tag = DOLLAR_QUOTE.match(sql_content, i).group()
+            close = sql_content.find(tag, i + len(tag))
+            i = length if close == -1 else close + len(tag)
+        elif sql_content[i] == ';':
+            statements.append(sql_content[start:i].strip())
+            start = i = i + 1
+        else:
+            i += 1
+    statements.append(sql_content[start:].strip())
+    return [statement for statement in statements if strip_comments(statement)]
+
+def build_steps(statements):
+    # Consecutive ordinary statements share one transaction; statements that
+    # cannot run in a transaction and "-- @batch" backfills get a step each.
+    steps = []
+    for statement in statements:
+        if BATCH_DIRECTIVE.search(statement):
+            steps.append(('batch', [statement]))
+        elif NON_TRANSACTIONAL.search(strip_comments(statement)):
+            steps.append(('autocommit', [statement]))
+        elif steps and steps[-1][0] == 'transaction':
+            steps[-1][1].append(statement)
+        else:
+            steps.append(('transaction', [statement]))
+    return steps
+
+def list_migration_files(current_dir):
+    migration_files = [f for f in os.listdir(current_dir) if re.match(r'^V\d+__.*\.sql$', f)]
+    # Numeric ordering so V10 runs after V9
+    return sorted(migration_files, key=lambda f: int(f[1:].split('__')[0]))
+
+def record_progress(cur, version, completed_steps):
+    cur.execute(
+        "UPDATE migrations SET completed_steps = %s WHERE version = %s",
+        (completed_steps, version)
+    )
+
+def run_batch(cur, conn, version, statement):
+    # Re-run the statement in its own short transaction until it touches no
+    # rows, so a large backfill never holds its locks for the whole migration.
+    total_rows = 0
+    chunks = 0
+    while True:
+        start = time.monotonic()
+        cur.execute(statement)
+        conn.commit()
+        if cur.rowcount <= 0:
+            break
+        chunks += 1
+        total_rows += cur.rowcount
+        logger.info(f"{version}: backfill chunk {chunks} updated {cur.rowcount} rows in {time.monotonic() - start:.2f}s")
+    logger.info(f"{version}: backfill finished, {total_rows} rows in {chunks} chunks")
 
-def apply_migrations(cur, conn):
-    if check_migrations_applied(cur):
-        logger.info("Migrations have already been applied. Skipping.")
+def drop_invalid_index(cur, version, statement):
+    # A CREATE INDEX CONCURRENTLY that failed or was interrupted leaves an
+    # invalid index behind. The retry would fail on the name, or with IF NOT
+    # EXISTS skip it and leave the index unusable, so it is dropped first.
+    match = CONCURRENT_INDEX.search(strip_comments(statement))
+    if not match:
+        return
+    name = match.group(1)
+    name = name[1:-1] if name.startswith('"') else name.lower()
+    cur.execute("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND pg_table_is_visible(c.oid) AND NOT i.indisvalid
+    """, (name,))
+    if cur.fetchone():
+        logger.warning(f"{version}: dropping invalid index {name} left by an earlier attempt")
+        cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+def run_step(cur, conn, version, kind, statements, step_number):
+    if kind == 'transaction':
+        for statement in statements:
+            cur.execute(statement)
+        record_progress(cur, version, step_number)
+        conn.commit()
         return
 
-    cur.execute("SELECT version FROM migrations")
-    applied_migrations = set(row[0] for row in cur.fetchall())
-    logger.info(f"Already applied migrations: {applied_migrations}")
+    if kind == 'batch':
+        run_batch(cur, conn, version, statements[0])
+    else:
+        conn.autocommit = True
+        try:
+            drop_invalid_index(cur, version, statements[0])
+            cur.execute(statements[0])
+        finally:
+            conn.autocommit = False
+    record_progress(cur, version, step_number)
+    conn.commit()
 
-    current_dir = os.path.dirname(os.path.realpath(__file__))
-    logger.info(f"Current directory: {current_dir}")
-    migration_files = sorted([f for f in os.listdir(current_dir) if f.endswith('.sql')])
-    logger.info(f"Found migration files: {migration_files}")
+def apply_migration(cur, conn, version, migration_file, sql_content, checksum, completed_steps):
+    steps = build_steps(split_statements(sql_content))
+    if completed_steps:
+        logger.info(f"Resuming migration {migration_file} at step {completed_steps + 1} of {len(steps)}")
+    else:
+        logger.info(f"Applying new migration {migration_file} ({len(steps)} steps)")
+        cur.execute(
+            "INSERT INTO migrations (version, checksum, status, completed_steps) VALUES (%s, %s, 'in_progress', 0)",
+            (version, checksum)
+        )
+        conn.commit()
 
-    for migration_file in migration_files:
-        version = migration_file.split('__')[0]
-        if version not in applied_migrations:
-            logger.info(f"Applying new migration: {migration_file}")
+    migration_start = time.monotonic()
+    for step_number, (kind, statements) in enumerate(steps, start=1):
+        if step_number <= completed_steps:
+            continue
+        step_start = time.monotonic()
+        try:
+            run_step(cur, conn, version, kind, statements, step_number)
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error in {migration_file} step {step_number} ({kind}): {str(e)}")
+            raise
+        logger.info(
+            f"{migration_file} step {step_number}/{len(steps)} ({kind}, {len(statements)} statement(s)) "
+            f"took {time.monotonic() - step_start:.2f}s"
+        )
+
+    execution_ms = int((time.monotonic() - migration_start) * 1000)
+    cur.execute(
+        "UPDATE migrations SET status = 'applied', applied_at = CURRENT_TIMESTAMP, execution_ms = %s WHERE version = %s",
+        (execution_ms, version)
+    )
+    conn.commit()
+    logger.info(f"Successfully applied migration {migration_file} in {execution_ms} ms")
+
+def apply_migrations(cur, conn, migrations_dir=None):
+    ensure_migrations_table(cur, conn)
+
+    # Session-level lock: held across the per-step commits below
+    cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+    try:
+        # Let index builds use parallel maintenance workers
+        cur.execute("SELECT set_config('max_parallel_maintenance_workers', %s, false)",
+                    (os.environ.get('MIGRATION_PARALLEL_WORKERS', '2'),))
+        conn.commit()
+
+        cur.execute("SELECT version, checksum, status, completed_steps FROM migrations")
+        applied_migrations = {row[0]: row[1:] for row in cur.fetchall()}
+        logger.info(f"Known migrations: {sorted(applied_migrations)}")
+
+        # The packaged Lambda has the .sql files next to this module
+        current_dir = migrations_dir or os.path.dirname(os.path.realpath(__file__))
+        migration_files = list_migration_files(current_dir)
+        logger.info(f"Found migration files: {migration_files}")
+
+        for migration_file in migration_files:
+            version = migration_file.split('__')[0]
             with open(os.path.join(current_dir, migration_file), 'r') as file:
                 sql_content = file.read()
+            checksum = hashlib.sha256(sql_content.encode()).hexdigest()
 
-            try:
-                with conn.cursor() as migration_cur:
-                    migration_cur.execute("BEGIN")
-                    try:
-                        migration_cur.execute(sql_content)
-                        migration_cur.execute(
-                            sql.SQL("INSERT INTO migrations (version) VALUES (%s)"),
-                            (version,)
-                        )
-                        conn.commit()
-                        logger.info(f"Successfully applied migration: {migration_file}")
-                    except (DuplicateTable, DuplicateObject) as e:
-                        conn.rollback()
-                        logger.warning(f"Skipping migration {migration_file} due to {str(e)}")
-                    except Exception as e:
-                        conn.rollback()
-                        logger.error(f"Error applying migration {migration_file}: {str(e)}")
-                        raise
-            except Exception as e:
-                logger.error(f"Transaction error for migration {migration_file}: {str(e)}")
-                raise
-        else:
-            logger.info(f"Skipping already applied migration: {migration_file}")
+            recorded_checksum, status, completed_steps = applied_migrations.get(version, (None, None, 0))
+            if recorded_checksum and recorded_checksum != checksum:
+                raise RuntimeError(f"Checksum mismatch for {migration_file}: it was changed after being applied")
+
+            if status == 'applied':
+                if recorded_checksum is None:
+                    cur.execute("UPDATE migrations SET checksum = %s WHERE version = %s", (checksum, version))
+                    conn.commit()
+                logger.info(f"Skipping already applied migration: {migration_file}")
+                continue
+
+            apply_migration(cur, conn, version, migration_file, sql_content, checksum,
+                            completed_steps if status == 'in_progress' else 0)
+    finally:
+        try:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+        except psycopg2.Error as e:
+            # The lock dies with the session anyway; don't mask the original error
+            logger.warning(f"Could not release migration lock: {str(e)}")
 
     logger.info("All migrations have been checked and applied if necessary")
 
+def ensure_task_changes_partitions(cur, conn):
+    # Keep monthly task_changes partitions created ahead of the audit trigger
+    cur.execute("SELECT to_regproc('create_task_changes_partitions')")
+    if cur.fetchone()[0] is None:
+        logger.info("task_changes is not partitioned yet. Skipping partition creation.")
+        return
+
+    months_ahead = int(os.environ.get('TASK_CHANGES_PARTITIONS_AHEAD', '3'))
+    cur.execute("SELECT create_task_changes_partitions(CURRENT_DATE, %s)", (months_ahead,))
+    created = cur.fetchone()[0]
+    conn.commit()
+    logger.info(f"Created {created} task_changes partition(s) up to {months_ahead} months ahead")
+
 def lambda_handler(event, context):
     # Handle custom resource events
     if event.get('RequestType') == 'Delete':
@@ -112,12 +300,14 @@ def lambda_handler(event, context):
             port=secret['port'],
             dbname=db_name,
             user=secret['username'],
-            password=secret['password']
+            password=secret['password'],
+            connection_factory=instrumentation.InstrumentedConnection
         )
         logger.info("Successfully connected to the database")
 
         with conn.cursor() as cur:
             apply_migrations(cur, conn)
+            ensure_task_changes_partitions(cur, conn)
         logger.info("Database migrations completed successfully")
 
         send_cfn_response(event, context, 'SUCCESS', response_data={'Message': 'Database migrations complete'})
@@ -130,4 +320,5 @@ def lambda_handler(event, context):
     finally:
         if conn:
             conn.close()
-            logger.info("Database connection closed")
\ No newline at end of file
+            logger.info("Database connection closed")
+        instrumentation.emit_metrics()
\ No newline at end of file
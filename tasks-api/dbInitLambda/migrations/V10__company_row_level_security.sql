@@ -0,0 +1,66 @@
+-- V10__company_row_level_security.sql
+
+-- Tenant isolation enforced by Postgres. Tenant-scoped requests run as the
+-- tasks_tenant role with app.company_id set for the session (shared/db.py
+-- does both when a connection is checked out for a company), and see only
+-- their company's users, locations, tasks and task_changes. The table owner,
+-- used by migrations, maintenance jobs, triggers and the signup/user admin
+-- Lambdas, keeps bypassing RLS (ENABLE, not FORCE). A tenant session without
+-- app.company_id sees nothing.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'tasks_tenant') THEN
+        CREATE ROLE tasks_tenant NOLOGIN;
+    END IF;
+END
+$$;
+
+-- Lets the application user SET ROLE tasks_tenant
+GRANT tasks_tenant TO CURRENT_USER;
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON ALL TABLES IN SCHEMA public TO tasks_tenant;
+GRANT USAGE ON ALL SEQUENCES IN SCHEMA public TO tasks_tenant;
+ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT SELECT, INSERT, UPDATE, DELETE ON TABLES TO tasks_tenant;
+ALTER DEFAULT PRIVILEGES IN SCHEMA public GRANT USAGE ON SEQUENCES TO tasks_tenant;
+
+-- Views run with their owner's rights and would bypass the policies below;
+-- the bookkeeping tables are never touched by tenant requests
+REVOKE ALL ON employee_dashboard, admin_dashboard, location_dashboard FROM tasks_tenant;
+REVOKE ALL ON migrations, cognito_outbox FROM tasks_tenant;
+
+-- Inlined into the policies as a stable expression, so "company_id =
+-- app_company_id()" is an index condition on idx_*_company_id.
+CREATE OR REPLACE FUNCTION app_company_id()
+RETURNS INTEGER AS $$
+    SELECT NULLIF(current_setting('app.company_id', true), '')::integer
+$$ LANGUAGE sql STABLE;
+
+-- tasks carry no company_id. Comparing location_id against this array keeps
+-- the policy a plain "location_id = ANY(...)" index condition on the
+-- location-leading task indexes; the array is computed once per scan.
+CREATE OR REPLACE FUNCTION app_company_location_ids()
+RETURNS INTEGER[] AS $$
+    SELECT COALESCE(array_agg(location_id), '{}') FROM locations WHERE company_id = app_company_id()
+$$ LANGUAGE sql STABLE;
+
+ALTER TABLE companies ENABLE ROW LEVEL SECURITY;
+CREATE POLICY company_isolation ON companies TO tasks_tenant
+    USING (company_id = app_company_id());
+
+ALTER TABLE locations ENABLE ROW LEVEL SECURITY;
+CREATE POLICY company_isolation ON locations TO tasks_tenant
+    USING (company_id = app_company_id());
+
+ALTER TABLE users ENABLE ROW LEVEL SECURITY;
+CREATE POLICY company_isolation ON users TO tasks_tenant
+    USING (company_id = app_company_id());
+
+ALTER TABLE tasks ENABLE ROW LEVEL SECURITY;
+CREATE POLICY company_isolation ON tasks TO tasks_tenant
+    USING (location_id = ANY (app_company_location_ids()));
+
+-- Audit rows follow their task (task_id is the leading column of the
+-- task_changes index, and tasks is probed by primary key)
+ALTER TABLE task_changes ENABLE ROW LEVEL SECURITY;
+CREATE POLICY company_isolation ON task_changes TO tasks_tenant
+    USING (EXISTS (SELECT 1 FROM tasks t WHERE t.task_id = task_changes.task_id));
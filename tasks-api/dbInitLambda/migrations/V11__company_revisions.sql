@@ -0,0 +1,69 @@
+-- V11__company_revisions.sql
+
+-- Per-company revision counter versioning GET /companies/{id}/tree. Anything
+-- that changes the tree (the company's name, its locations, which location a
+-- user belongs to) bumps it, so the API can answer If-None-Match with a 304
+-- from a primary key lookup instead of re-running the aggregation. The
+-- constant default makes this a catalog-only change.
+ALTER TABLE companies ADD COLUMN revision BIGINT NOT NULL DEFAULT 1;
+
+-- Statement-level: a bulk import or multi-row update bumps each company once.
+-- Company rows are locked in id order so statements spanning several
+-- companies cannot deadlock with each other.
+CREATE OR REPLACE FUNCTION bump_company_revision()
+RETURNS TRIGGER AS $$
+DECLARE
+    company_ids INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT company_id) INTO company_ids FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT company_id) INTO company_ids FROM old_rows;
+    ELSE
+        SELECT array_agg(DISTINCT company_id) INTO company_ids
+        FROM (SELECT company_id FROM new_rows UNION SELECT company_id FROM old_rows) changed;
+    END IF;
+
+    PERFORM 1 FROM companies WHERE company_id = ANY(company_ids) ORDER BY company_id FOR UPDATE;
+    UPDATE companies SET revision = revision + 1 WHERE company_id = ANY(company_ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables allow only one event per trigger
+CREATE TRIGGER bump_company_revision_insert
+AFTER INSERT ON locations
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_company_revision();
+
+CREATE TRIGGER bump_company_revision_update
+AFTER UPDATE ON locations
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_company_revision();
+
+CREATE TRIGGER bump_company_revision_delete
+AFTER DELETE ON locations
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_company_revision();
+
+CREATE TRIGGER bump_company_revision_insert
+AFTER INSERT ON users
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_company_revision();
+
+-- Only the columns the tree counts by; name and role edits leave it as is
+CREATE TRIGGER bump_company_revision_update
+AFTER UPDATE OF location_id, company_id ON users
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_company_revision();
+
+CREATE TRIGGER bump_company_revision_delete
+AFTER DELETE ON users
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_company_revision();
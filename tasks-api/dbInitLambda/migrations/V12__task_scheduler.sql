@@ -0,0 +1,36 @@
+-- V12__task_scheduler.sql
+
+-- Templates the nightly scheduler (shared/task_scheduler.py) turns into
+-- ordinary tasks. next_due_date is the due date of the next instance to
+-- create; generating an instance advances it by recurrence_interval in the
+-- same statement, so reruns never create duplicates.
+CREATE TABLE recurring_tasks (
+    recurrence_id SERIAL PRIMARY KEY,
+    location_id INTEGER NOT NULL REFERENCES locations(location_id) ON DELETE CASCADE,
+    created_by INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    task_title VARCHAR(200) NOT NULL,
+    description TEXT,
+    assigned_to INTEGER REFERENCES users(user_id) ON DELETE SET NULL,
+    is_pooled BOOLEAN NOT NULL DEFAULT FALSE,
+    priority INTEGER CHECK (priority BETWEEN 1 AND 5),
+    recurrence_interval INTERVAL NOT NULL CHECK (recurrence_interval >= INTERVAL '1 day'),
+    next_due_date DATE NOT NULL,
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- The scheduler pages through due templates in (next_due_date, recurrence_id)
+-- order; templates that are paused never enter the index.
+CREATE INDEX idx_recurring_tasks_due ON recurring_tasks (next_due_date, recurrence_id) WHERE active;
+
+-- Same tenant isolation as tasks (V10)
+ALTER TABLE recurring_tasks ENABLE ROW LEVEL SECURITY;
+CREATE POLICY company_isolation ON recurring_tasks TO tasks_tenant
+    USING (location_id = ANY (app_company_location_ids()));
+
+-- Overdue escalation pages through open tasks by (due_date, task_id). Tasks
+-- already at the top priority can't be escalated further and drop out of the
+-- index, so each night only reads tasks that may still need a bump.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_overdue_escalation
+    ON tasks (due_date, task_id)
+    WHERE status = 'open' AND due_date IS NOT NULL AND (priority IS NULL OR priority > 1);
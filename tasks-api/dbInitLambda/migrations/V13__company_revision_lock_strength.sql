@@ -0,0 +1,28 @@
+-- V13__company_revision_lock_strength.sql
+
+-- bump_company_revision (V11) locked the company rows FOR UPDATE. That mode
+-- conflicts with the FOR KEY SHARE locks the locations and users foreign keys
+-- take on companies, so two transactions each inserting into the same company
+-- and then reaching the trigger waited on each other's KEY SHARE lock and
+-- deadlocked. Only revision changes, never the key, so FOR NO KEY UPDATE (the
+-- lock the UPDATE takes anyway) is enough: it still orders concurrent bumps
+-- by company id but no longer conflicts with foreign key checks.
+CREATE OR REPLACE FUNCTION bump_company_revision()
+RETURNS TRIGGER AS $$
+DECLARE
+    company_ids INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT company_id) INTO company_ids FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT company_id) INTO company_ids FROM old_rows;
+    ELSE
+        SELECT array_agg(DISTINCT company_id) INTO company_ids
+        FROM (SELECT company_id FROM new_rows UNION SELECT company_id FROM old_rows) changed;
+    END IF;
+
+    PERFORM 1 FROM companies WHERE company_id = ANY(company_ids) ORDER BY company_id FOR NO KEY UPDATE;
+    UPDATE companies SET revision = revision + 1 WHERE company_id = ANY(company_ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,24 @@
+-- V14__rls_policy_initplans.sql
+
+-- app_company_location_ids() aggregates over locations, so the planner can't
+-- inline it: wherever the tasks policy ends up as a filter rather than an
+-- index condition (company-wide exports, search over the GIN index, any
+-- sequential scan) the function and its locations lookup ran once per row.
+-- Wrapped in a scalar sub-select it becomes an InitPlan, evaluated once per
+-- query and compared as a parameter. app_company_id() gets the same treatment
+-- so current_setting() isn't re-read per row either. task_changes' policy is
+-- a correlated probe of tasks and is left as is.
+ALTER POLICY company_isolation ON companies
+    USING (company_id = (SELECT app_company_id()));
+
+ALTER POLICY company_isolation ON locations
+    USING (company_id = (SELECT app_company_id()));
+
+ALTER POLICY company_isolation ON users
+    USING (company_id = (SELECT app_company_id()));
+
+ALTER POLICY company_isolation ON tasks
+    USING (location_id = ANY ((SELECT app_company_location_ids())));
+
+ALTER POLICY company_isolation ON recurring_tasks
+    USING (location_id = ANY ((SELECT app_company_location_ids())));
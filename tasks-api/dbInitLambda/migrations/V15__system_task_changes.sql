@@ -0,0 +1,35 @@
+-- V15__system_task_changes.sql
+
+-- Changes made by scheduled jobs rather than a user (overdue escalation in
+-- the nightly task scheduler) were attributed to the task's assignee by
+-- log_task_changes' fallback. Such jobs now set app.current_user_id to
+-- 'system' and their audit rows carry no changed_by. Dropping NOT NULL on the
+-- partitioned parent is a catalog-only change for every partition.
+ALTER TABLE task_changes ALTER COLUMN changed_by DROP NOT NULL;
+
+CREATE OR REPLACE FUNCTION log_task_changes()
+RETURNS TRIGGER AS $$
+DECLARE
+    current_user_setting TEXT := NULLIF(current_setting('app.current_user_id', true), '');
+BEGIN
+    INSERT INTO task_changes (task_id, field_name, old_value, new_value, changed_by)
+    SELECT
+        n.task_id,
+        c.field_name,
+        c.old_value,
+        c.new_value,
+        CASE WHEN current_user_setting = 'system' THEN NULL
+             ELSE COALESCE(current_user_setting::integer, n.assigned_to, n.source)
+        END
+    FROM new_rows n
+    JOIN old_rows o ON o.task_id = n.task_id
+    CROSS JOIN LATERAL (VALUES
+        ('task_title', o.task_title, n.task_title),
+        ('description', o.description, n.description),
+        ('status', o.status::text, n.status::text),
+        ('priority', o.priority::text, n.priority::text)
+    ) AS c(field_name, old_value, new_value)
+    WHERE c.old_value IS DISTINCT FROM c.new_value;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
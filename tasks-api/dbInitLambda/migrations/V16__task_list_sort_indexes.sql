@@ -0,0 +1,19 @@
+-- V16__task_list_sort_indexes.sql
+
+-- GET /tasks?location_id= and ?assigned_to= list every status, so V2's
+-- partial "active" indexes can't serve them and idx_tasks_location_status_sort
+-- only returns SORT_KEY order once status is fixed. Without these each page
+-- read the location's or assignee's whole history, completed tasks included,
+-- into a top-N sort. The sort columns mirror SORT_KEY in backend/tasks.py.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_location_sort
+    ON tasks (location_id, COALESCE(due_date, 'infinity'::date), COALESCE(priority, 6), task_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_assignee_sort
+    ON tasks (assigned_to, COALESCE(due_date, 'infinity'::date), COALESCE(priority, 6), task_id);
+
+-- Superseded: no query filters an assignee's tasks to the active ones, and
+-- assigned_to lookups (including the users foreign key) use the leading
+-- column of idx_tasks_assignee_sort. idx_tasks_location_active_sort stays
+-- for the board's active-task read.
+DROP INDEX CONCURRENTLY IF EXISTS idx_tasks_assignee_active_sort;
+DROP INDEX CONCURRENTLY IF EXISTS idx_tasks_assigned_to;
@@ -0,0 +1,46 @@
+-- V17__tenant_table_grants.sql
+
+-- V10 granted tasks_tenant every table in the schema, now and in future, and
+-- revoked the few it knew to be unsafe. Tables without a policy were still
+-- open to every tenant: the counters (readable and writable across
+-- companies), task_changes' partitions (policies are not inherited, so a
+-- partition queried by name bypassed them) and anything a later migration
+-- adds. Tenants now get only the tables that carry a company_isolation
+-- policy, plus read access to the counters under policies of their own.
+REVOKE ALL ON ALL TABLES IN SCHEMA public FROM tasks_tenant;
+REVOKE ALL ON ALL SEQUENCES IN SCHEMA public FROM tasks_tenant;
+ALTER DEFAULT PRIVILEGES IN SCHEMA public REVOKE SELECT, INSERT, UPDATE, DELETE ON TABLES FROM tasks_tenant;
+ALTER DEFAULT PRIVILEGES IN SCHEMA public REVOKE USAGE ON SEQUENCES FROM tasks_tenant;
+
+GRANT SELECT, INSERT, UPDATE, DELETE
+    ON companies, locations, users, tasks, task_changes, recurring_tasks
+    TO tasks_tenant;
+GRANT SELECT ON user_task_counters, location_task_counters TO tasks_tenant;
+
+DO $$
+DECLARE
+    seq TEXT;
+BEGIN
+    FOR seq IN
+        SELECT pg_get_serial_sequence(t.name, t.id_column)
+        FROM (VALUES ('companies', 'company_id'), ('locations', 'location_id'), ('users', 'user_id'),
+                     ('tasks', 'task_id'), ('task_changes', 'change_id'),
+                     ('recurring_tasks', 'recurrence_id')) AS t (name, id_column)
+    LOOP
+        EXECUTE format('GRANT USAGE ON SEQUENCE %s TO tasks_tenant', seq);
+    END LOOP;
+END
+$$;
+
+-- Same scoping as the rows they count
+ALTER TABLE location_task_counters ENABLE ROW LEVEL SECURITY;
+CREATE POLICY company_isolation ON location_task_counters TO tasks_tenant
+    USING (location_id = ANY ((SELECT app_company_location_ids())));
+
+ALTER TABLE user_task_counters ENABLE ROW LEVEL SECURITY;
+CREATE POLICY company_isolation ON user_task_counters TO tasks_tenant
+    USING (EXISTS (SELECT 1 FROM users u WHERE u.user_id = user_task_counters.user_id));
+
+-- Tenant task writes still move the counters: the trigger's upserts run with
+-- the owner's rights, which bypass RLS, instead of the tenant's.
+ALTER FUNCTION bump_task_counters(tasks, INTEGER) SECURITY DEFINER SET search_path = public;
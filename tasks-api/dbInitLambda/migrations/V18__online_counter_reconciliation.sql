@@ -0,0 +1,124 @@
+-- V18__online_counter_reconciliation.sql
+
+-- rebuild_task_counters() holds SHARE on tasks for a full aggregate, blocking
+-- every task write for the whole scan, which is too disruptive to run
+-- nightly. Reconciliation instead works in two transactions and takes no
+-- table locks:
+--   1. stage_task_counter_drift(), under REPEATABLE READ, compares counts
+--      computed from tasks with the counters in the same snapshot. Triggers
+--      update both in the writing transaction, so any difference is drift.
+--   2. apply_task_counter_drift(), under READ COMMITTED, adds that drift to
+--      the current counters. Increments commute with trigger deltas committed
+--      in between, so only the counter rows being corrected are locked.
+
+CREATE OR REPLACE FUNCTION stage_task_counter_drift()
+RETURNS VOID AS $$
+BEGIN
+    DROP TABLE IF EXISTS pg_temp.user_counter_drift, pg_temp.location_counter_drift;
+
+    CREATE TEMP TABLE user_counter_drift AS
+    SELECT *
+    FROM (
+        SELECT
+            COALESCE(e.user_id, c.user_id) AS user_id,
+            COALESCE(e.assigned_open, 0) - COALESCE(c.assigned_open, 0) AS assigned_open,
+            COALESCE(e.assigned_in_progress, 0) - COALESCE(c.assigned_in_progress, 0) AS assigned_in_progress,
+            COALESCE(e.assigned_completed, 0) - COALESCE(c.assigned_completed, 0) AS assigned_completed,
+            COALESCE(e.involved_open, 0) - COALESCE(c.involved_open, 0) AS involved_open,
+            COALESCE(e.involved_in_progress, 0) - COALESCE(c.involved_in_progress, 0) AS involved_in_progress,
+            COALESCE(e.involved_completed, 0) - COALESCE(c.involved_completed, 0) AS involved_completed,
+            COALESCE(e.tasks_created, 0) - COALESCE(c.tasks_created, 0) AS tasks_created
+        FROM (
+            SELECT
+                i.user_id,
+                COUNT(*) FILTER (WHERE i.is_assignee AND i.status = 'open')::integer AS assigned_open,
+                COUNT(*) FILTER (WHERE i.is_assignee AND i.status = 'in progress')::integer AS assigned_in_progress,
+                COUNT(*) FILTER (WHERE i.is_assignee AND i.status = 'completed')::integer AS assigned_completed,
+                COUNT(*) FILTER (WHERE i.status = 'open')::integer AS involved_open,
+                COUNT(*) FILTER (WHERE i.status = 'in progress')::integer AS involved_in_progress,
+                COUNT(*) FILTER (WHERE i.status = 'completed')::integer AS involved_completed,
+                COUNT(*) FILTER (WHERE i.is_source)::integer AS tasks_created
+            FROM (
+                SELECT u.user_id, t.status,
+                       u.user_id = t.assigned_to AS is_assignee,
+                       u.user_id = t.source AS is_source
+                FROM tasks t
+                CROSS JOIN LATERAL (
+                    SELECT t.assigned_to AS user_id WHERE t.assigned_to IS NOT NULL
+                    UNION
+                    SELECT t.source
+                ) u
+            ) i
+            GROUP BY i.user_id
+        ) e
+        FULL JOIN user_task_counters c ON c.user_id = e.user_id
+    ) d
+    WHERE (assigned_open, assigned_in_progress, assigned_completed,
+           involved_open, involved_in_progress, involved_completed, tasks_created)
+          <> (0, 0, 0, 0, 0, 0, 0);
+
+    CREATE TEMP TABLE location_counter_drift AS
+    SELECT *
+    FROM (
+        SELECT
+            COALESCE(e.location_id, c.location_id) AS location_id,
+            COALESCE(e.total_open, 0) - COALESCE(c.total_open, 0) AS total_open,
+            COALESCE(e.total_in_progress, 0) - COALESCE(c.total_in_progress, 0) AS total_in_progress,
+            COALESCE(e.total_completed, 0) - COALESCE(c.total_completed, 0) AS total_completed
+        FROM (
+            SELECT location_id,
+                   COUNT(*) FILTER (WHERE status = 'open')::integer AS total_open,
+                   COUNT(*) FILTER (WHERE status = 'in progress')::integer AS total_in_progress,
+                   COUNT(*) FILTER (WHERE status = 'completed')::integer AS total_completed
+            FROM tasks
+            WHERE location_id IS NOT NULL
+            GROUP BY location_id
+        ) e
+        FULL JOIN location_task_counters c ON c.location_id = e.location_id
+    ) d
+    WHERE (total_open, total_in_progress, total_completed) <> (0, 0, 0);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Returns the number of counter rows corrected. Users and locations deleted
+-- since the snapshot are skipped; their counter rows went with them.
+CREATE OR REPLACE FUNCTION apply_task_counter_drift()
+RETURNS INTEGER AS $$
+DECLARE
+    user_rows INTEGER;
+    location_rows INTEGER;
+BEGIN
+    INSERT INTO user_task_counters AS c (
+        user_id, assigned_open, assigned_in_progress, assigned_completed,
+        involved_open, involved_in_progress, involved_completed, tasks_created
+    )
+    SELECT d.user_id, d.assigned_open, d.assigned_in_progress, d.assigned_completed,
+           d.involved_open, d.involved_in_progress, d.involved_completed, d.tasks_created
+    FROM pg_temp.user_counter_drift d
+    JOIN users u ON u.user_id = d.user_id
+    FOR KEY SHARE OF u
+    ON CONFLICT (user_id) DO UPDATE SET
+        assigned_open = c.assigned_open + EXCLUDED.assigned_open,
+        assigned_in_progress = c.assigned_in_progress + EXCLUDED.assigned_in_progress,
+        assigned_completed = c.assigned_completed + EXCLUDED.assigned_completed,
+        involved_open = c.involved_open + EXCLUDED.involved_open,
+        involved_in_progress = c.involved_in_progress + EXCLUDED.involved_in_progress,
+        involved_completed = c.involved_completed + EXCLUDED.involved_completed,
+        tasks_created = c.tasks_created + EXCLUDED.tasks_created;
+    GET DIAGNOSTICS user_rows = ROW_COUNT;
+
+    INSERT INTO location_task_counters AS c (location_id, total_open, total_in_progress, total_completed)
+    SELECT d.location_id, d.total_open, d.total_in_progress, d.total_completed
+    FROM pg_temp.location_counter_drift d
+    JOIN locations l ON l.location_id = d.location_id
+    FOR KEY SHARE OF l
+    ON CONFLICT (location_id) DO UPDATE SET
+        total_open = c.total_open + EXCLUDED.total_open,
+        total_in_progress = c.total_in_progress + EXCLUDED.total_in_progress,
+        total_completed = c.total_completed + EXCLUDED.total_completed;
+    GET DIAGNOSTICS location_rows = ROW_COUNT;
+
+    DROP TABLE pg_temp.user_counter_drift, pg_temp.location_counter_drift;
+    RETURN user_rows + location_rows;
+END;
+$$ LANGUAGE plpgsql;
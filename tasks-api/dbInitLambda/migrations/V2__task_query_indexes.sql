@@ -0,0 +1,30 @@
+-- V2__task_query_indexes.sql
+
+-- Composite indexes matching the backend's task list queries. The sort columns
+-- mirror SORT_KEY in backend/tasks.py exactly so keyset pages are served by a
+-- single index range scan with no separate sort step. Built CONCURRENTLY so
+-- the deploy never blocks writes to tasks.
+
+-- Open / in-progress tasks for a location, ordered by due date
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_location_active_sort
+    ON tasks (location_id, COALESCE(due_date, 'infinity'::date), COALESCE(priority, 6), task_id)
+    WHERE status <> 'completed';
+
+-- Open / in-progress tasks for an assignee, ordered by due date
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_assignee_active_sort
+    ON tasks (assigned_to, COALESCE(due_date, 'infinity'::date), COALESCE(priority, 6), task_id)
+    WHERE status <> 'completed';
+
+-- Location list filtered by an exact status (including completed history)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_location_status_sort
+    ON tasks (location_id, status, COALESCE(due_date, 'infinity'::date), COALESCE(priority, 6), task_id);
+
+-- Audit rows are looked up and deleted by task
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_task_changes_task_id ON task_changes (task_id);
+
+-- Superseded indexes: cognito_user_id is already covered by its UNIQUE
+-- constraint and a bare status index is too unselective to ever be chosen
+-- over the composites above.
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_cognito_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_tasks_status;
+DROP INDEX CONCURRENTLY IF EXISTS idx_tasks_location_id;
@@ -0,0 +1,208 @@
+-- V3__dashboard_counters.sql
+
+-- Per-user and per-location task counters, maintained incrementally by
+-- triggers so dashboard reads are primary-key lookups instead of a
+-- JOIN + GROUP BY over the whole tasks table.
+
+CREATE TABLE user_task_counters (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    -- Tasks assigned to the user
+    assigned_open INTEGER NOT NULL DEFAULT 0,
+    assigned_in_progress INTEGER NOT NULL DEFAULT 0,
+    assigned_completed INTEGER NOT NULL DEFAULT 0,
+    -- Tasks the user is assigned to or created (each task counted once)
+    involved_open INTEGER NOT NULL DEFAULT 0,
+    involved_in_progress INTEGER NOT NULL DEFAULT 0,
+    involved_completed INTEGER NOT NULL DEFAULT 0,
+    tasks_created INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE location_task_counters (
+    location_id INTEGER PRIMARY KEY REFERENCES locations(location_id) ON DELETE CASCADE,
+    total_open INTEGER NOT NULL DEFAULT 0,
+    total_in_progress INTEGER NOT NULL DEFAULT 0,
+    total_completed INTEGER NOT NULL DEFAULT 0
+);
+
+-- Apply +delta / -delta for a single task row to every counter it touches
+CREATE OR REPLACE FUNCTION bump_task_counters(t tasks, delta INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    d_open INTEGER := CASE WHEN t.status = 'open' THEN delta ELSE 0 END;
+    d_in_progress INTEGER := CASE WHEN t.status = 'in progress' THEN delta ELSE 0 END;
+    d_completed INTEGER := CASE WHEN t.status = 'completed' THEN delta ELSE 0 END;
+BEGIN
+    IF t.assigned_to IS NOT NULL THEN
+        INSERT INTO user_task_counters AS c (
+            user_id, assigned_open, assigned_in_progress, assigned_completed,
+            involved_open, involved_in_progress, involved_completed, tasks_created
+        )
+        VALUES (
+            t.assigned_to, d_open, d_in_progress, d_completed,
+            d_open, d_in_progress, d_completed,
+            CASE WHEN t.source = t.assigned_to THEN delta ELSE 0 END
+        )
+        ON CONFLICT (user_id) DO UPDATE SET
+            assigned_open = c.assigned_open + EXCLUDED.assigned_open,
+            assigned_in_progress = c.assigned_in_progress + EXCLUDED.assigned_in_progress,
+            assigned_completed = c.assigned_completed + EXCLUDED.assigned_completed,
+            involved_open = c.involved_open + EXCLUDED.involved_open,
+            involved_in_progress = c.involved_in_progress + EXCLUDED.involved_in_progress,
+            involved_completed = c.involved_completed + EXCLUDED.involved_completed,
+            tasks_created = c.tasks_created + EXCLUDED.tasks_created;
+    END IF;
+
+    IF t.source IS DISTINCT FROM t.assigned_to THEN
+        INSERT INTO user_task_counters AS c (
+            user_id, involved_open, involved_in_progress, involved_completed, tasks_created
+        )
+        VALUES (t.source, d_open, d_in_progress, d_completed, delta)
+        ON CONFLICT (user_id) DO UPDATE SET
+            involved_open = c.involved_open + EXCLUDED.involved_open,
+            involved_in_progress = c.involved_in_progress + EXCLUDED.involved_in_progress,
+            involved_completed = c.involved_completed + EXCLUDED.involved_completed,
+            tasks_created = c.tasks_created + EXCLUDED.tasks_created;
+    END IF;
+
+    IF t.location_id IS NOT NULL THEN
+        INSERT INTO location_task_counters AS c (location_id, total_open, total_in_progress, total_completed)
+        VALUES (t.location_id, d_open, d_in_progress, d_completed)
+        ON CONFLICT (location_id) DO UPDATE SET
+            total_open = c.total_open + EXCLUDED.total_open,
+            total_in_progress = c.total_in_progress + EXCLUDED.total_in_progress,
+            total_completed = c.total_completed + EXCLUDED.total_completed;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION maintain_task_counters()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_task_counters(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_task_counters(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER maintain_task_counters_insert_delete
+AFTER INSERT OR DELETE ON tasks
+FOR EACH ROW
+EXECUTE FUNCTION maintain_task_counters();
+
+-- Only transitions that move a task between counters need any work
+CREATE TRIGGER maintain_task_counters_update
+AFTER UPDATE OF status, assigned_to, source, location_id ON tasks
+FOR EACH ROW
+WHEN (OLD.status IS DISTINCT FROM NEW.status
+      OR OLD.assigned_to IS DISTINCT FROM NEW.assigned_to
+      OR OLD.source IS DISTINCT FROM NEW.source
+      OR OLD.location_id IS DISTINCT FROM NEW.location_id)
+EXECUTE FUNCTION maintain_task_counters();
+
+-- Recompute every counter from scratch. Blocks task writes for the duration
+-- so no trigger delta can interleave with the rebuild.
+CREATE OR REPLACE FUNCTION rebuild_task_counters()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE tasks IN SHARE MODE;
+    LOCK TABLE user_task_counters, location_task_counters IN EXCLUSIVE MODE;
+
+    DELETE FROM user_task_counters;
+    DELETE FROM location_task_counters;
+
+    INSERT INTO user_task_counters (
+        user_id, assigned_open, assigned_in_progress, assigned_completed,
+        involved_open, involved_in_progress, involved_completed, tasks_created
+    )
+    SELECT
+        i.user_id,
+        COUNT(*) FILTER (WHERE i.is_assignee AND i.status = 'open'),
+        COUNT(*) FILTER (WHERE i.is_assignee AND i.status = 'in progress'),
+        COUNT(*) FILTER (WHERE i.is_assignee AND i.status = 'completed'),
+        COUNT(*) FILTER (WHERE i.status = 'open'),
+        COUNT(*) FILTER (WHERE i.status = 'in progress'),
+        COUNT(*) FILTER (WHERE i.status = 'completed'),
+        COUNT(*) FILTER (WHERE i.is_source)
+    FROM (
+        SELECT u.user_id, t.status,
+               u.user_id = t.assigned_to AS is_assignee,
+               u.user_id = t.source AS is_source
+        FROM tasks t
+        CROSS JOIN LATERAL (
+            SELECT t.assigned_to AS user_id WHERE t.assigned_to IS NOT NULL
+            UNION
+            SELECT t.source
+        ) u
+    ) i
+    GROUP BY i.user_id;
+
+    INSERT INTO location_task_counters (location_id, total_open, total_in_progress, total_completed)
+    SELECT location_id,
+           COUNT(*) FILTER (WHERE status = 'open'),
+           COUNT(*) FILTER (WHERE status = 'in progress'),
+           COUNT(*) FILTER (WHERE status = 'completed')
+    FROM tasks
+    WHERE location_id IS NOT NULL
+    GROUP BY location_id;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_task_counters();
+
+-- Dashboards become primary-key lookups against the counters
+DROP VIEW IF EXISTS employee_dashboard;
+DROP VIEW IF EXISTS admin_dashboard;
+
+CREATE VIEW employee_dashboard AS
+SELECT
+    u.user_id,
+    u.cognito_user_id,
+    u.company_id,
+    u.location_id,
+    u.fname,
+    u.lname,
+    COALESCE(c.assigned_open, 0)::bigint AS total_open_tasks,
+    COALESCE(c.assigned_in_progress, 0)::bigint AS total_in_progress_tasks,
+    COALESCE(c.assigned_completed, 0)::bigint AS total_completed_tasks
+FROM
+    users u
+LEFT JOIN
+    user_task_counters c ON c.user_id = u.user_id
+WHERE
+    u.profile_type = 'employee';
+
+CREATE VIEW admin_dashboard AS
+SELECT
+    u.user_id,
+    u.cognito_user_id,
+    u.company_id,
+    u.location_id,
+    u.fname,
+    u.lname,
+    COALESCE(c.involved_open, 0)::bigint AS total_open_tasks,
+    COALESCE(c.involved_in_progress, 0)::bigint AS total_in_progress_tasks,
+    COALESCE(c.involved_completed, 0)::bigint AS total_completed_tasks,
+    COALESCE(c.tasks_created, 0)::bigint AS tasks_created
+FROM
+    users u
+LEFT JOIN
+    user_task_counters c ON c.user_id = u.user_id
+WHERE
+    u.profile_type IN ('admin', 'super_admin');
+
+CREATE VIEW location_dashboard AS
+SELECT
+    l.location_id,
+    l.company_id,
+    l.name,
+    COALESCE(c.total_open, 0)::bigint AS total_open_tasks,
+    COALESCE(c.total_in_progress, 0)::bigint AS total_in_progress_tasks,
+    COALESCE(c.total_completed, 0)::bigint AS total_completed_tasks
+FROM
+    locations l
+LEFT JOIN
+    location_task_counters c ON c.location_id = l.location_id;
@@ -0,0 +1,39 @@
+-- V4__batched_task_change_log.sql
+
+-- Replace the per-row audit trigger (up to four single-row INSERTs per
+-- updated task) with a statement-level trigger that reads the transition
+-- tables and writes every field change of an UPDATE in one INSERT.
+DROP TRIGGER IF EXISTS log_task_changes ON tasks;
+DROP FUNCTION IF EXISTS log_task_changes();
+
+-- changed_by comes from the app.current_user_id setting the API sets for the
+-- transaction, falling back to the assignee and then the creator so the NOT
+-- NULL constraint holds for unassigned tasks too.
+CREATE OR REPLACE FUNCTION log_task_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO task_changes (task_id, field_name, old_value, new_value, changed_by)
+    SELECT
+        n.task_id,
+        c.field_name,
+        c.old_value,
+        c.new_value,
+        COALESCE(NULLIF(current_setting('app.current_user_id', true), '')::integer, n.assigned_to, n.source)
+    FROM new_rows n
+    JOIN old_rows o ON o.task_id = n.task_id
+    CROSS JOIN LATERAL (VALUES
+        ('task_title', o.task_title, n.task_title),
+        ('description', o.description, n.description),
+        ('status', o.status::text, n.status::text),
+        ('priority', o.priority::text, n.priority::text)
+    ) AS c(field_name, old_value, new_value)
+    WHERE c.old_value IS DISTINCT FROM c.new_value;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER log_task_changes
+AFTER UPDATE ON tasks
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION log_task_changes();
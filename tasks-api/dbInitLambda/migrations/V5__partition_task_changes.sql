@@ -0,0 +1,65 @@
+-- V5__partition_task_changes.sql
+
+-- Convert task_changes into a table range-partitioned by month so history
+-- lookups, vacuum and retention only ever touch a bounded set of partitions.
+ALTER TABLE task_changes RENAME TO task_changes_legacy;
+ALTER INDEX IF EXISTS idx_task_changes_task_id RENAME TO idx_task_changes_legacy_task_id;
+ALTER SEQUENCE task_changes_change_id_seq OWNED BY NONE;
+
+CREATE TABLE task_changes (
+    change_id INTEGER NOT NULL DEFAULT nextval('task_changes_change_id_seq'),
+    task_id INTEGER NOT NULL REFERENCES tasks(task_id),
+    change_timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    field_name VARCHAR(50) NOT NULL,
+    old_value TEXT,
+    new_value TEXT,
+    changed_by INTEGER NOT NULL REFERENCES users(user_id),
+    PRIMARY KEY (change_id, change_timestamp)
+) PARTITION BY RANGE (change_timestamp);
+
+ALTER SEQUENCE task_changes_change_id_seq OWNED BY task_changes.change_id;
+
+-- Created on every partition automatically
+CREATE INDEX idx_task_changes_task_id_timestamp ON task_changes (task_id, change_timestamp);
+
+-- Safety net so an audit insert never fails for lack of a partition; the
+-- monthly partitions below are created ahead of time so it stays empty.
+CREATE TABLE task_changes_default PARTITION OF task_changes DEFAULT;
+
+-- Create one partition per month from from_month through months_ahead months
+-- past the current one. Returns the number of partitions created.
+CREATE OR REPLACE FUNCTION create_task_changes_partitions(from_month DATE, months_ahead INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := 'task_changes_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF task_changes FOR VALUES FROM (%L) TO (%L)',
+                partition_name,
+                month_start::timestamp AT TIME ZONE 'UTC',
+                (month_start + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC'
+            );
+            created := created + 1;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_task_changes_partitions(
+    COALESCE((SELECT MIN(change_timestamp) FROM task_changes_legacy)::date, CURRENT_DATE),
+    3
+);
+
+INSERT INTO task_changes (change_id, task_id, change_timestamp, field_name, old_value, new_value, changed_by)
+SELECT change_id, task_id, COALESCE(change_timestamp, CURRENT_TIMESTAMP), field_name, old_value, new_value, changed_by
+FROM task_changes_legacy;
+
+DROP TABLE task_changes_legacy;
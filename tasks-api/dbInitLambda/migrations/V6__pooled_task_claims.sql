@@ -0,0 +1,9 @@
+-- V6__pooled_task_claims.sql
+
+-- Claimable pool for POST /tasks/claim: unassigned, open, pooled tasks per
+-- location in claim order. Claimed rows leave the predicate, so the index
+-- only ever holds the backlog and each claimer's FOR UPDATE SKIP LOCKED scan
+-- starts at the next free row instead of walking tasks other claimers hold.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_pool_claim
+    ON tasks (location_id, COALESCE(due_date, 'infinity'::date), COALESCE(priority, 6), task_id)
+    WHERE is_pooled AND assigned_to IS NULL AND status = 'open';
@@ -0,0 +1,30 @@
+-- V7__cognito_outbox.sql
+
+-- Transactional outbox for Cognito side effects. userManagement writes the
+-- users row and the matching outbox entry in one transaction and returns;
+-- the drain_cognito_outbox maintenance job applies entries to Cognito in
+-- batches, retrying with backoff, so Cognito latency and throttling never
+-- sit in the request path and a failed call can no longer leave the two
+-- stores out of step.
+CREATE TABLE cognito_outbox (
+    outbox_id BIGSERIAL PRIMARY KEY,
+    operation VARCHAR(30) NOT NULL CHECK (operation IN ('update_attributes', 'delete_user')),
+    username VARCHAR(255) NOT NULL,
+    -- update_attributes: {"attributes": {"given_name": "...", ...}}
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(10) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'done', 'dead')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    -- Claimed entries are leased by pushing this forward; failures back off the same way
+    available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Only pending entries are ever scanned by the worker
+CREATE INDEX idx_cognito_outbox_pending ON cognito_outbox (available_at, outbox_id)
+    WHERE status = 'pending';
+
+-- Per-user ordering check: is there an earlier entry for this username still pending?
+CREATE INDEX idx_cognito_outbox_pending_username ON cognito_outbox (username, outbox_id)
+    WHERE status = 'pending';
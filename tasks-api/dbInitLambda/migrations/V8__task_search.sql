@@ -0,0 +1,13 @@
+-- V8__task_search.sql
+
+-- Full-text search over task titles and descriptions for GET /tasks/search.
+-- The vector is a stored generated column, so every write keeps it current
+-- without a trigger; titles are weighted above descriptions for ranking.
+-- Adding it rewrites tasks once under an exclusive lock: deploy off-peak.
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(task_title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_search ON tasks USING GIN (search_vector);
@@ -0,0 +1,29 @@
+-- V9__cheaper_admin_creation_check.sql
+
+-- ensure_admin_creation ran for every inserted user and looked the creator up
+-- twice. It can only ever reject admin/super_admin rows that name a creator
+-- (a NULL created_by makes both checks NULL, i.e. pass), so the trigger now
+-- fires only for those rows and the function reads the creator once.
+-- Behaviour is unchanged.
+CREATE OR REPLACE FUNCTION ensure_admin_creation()
+RETURNS TRIGGER AS $$
+DECLARE
+    creator_type VARCHAR(20);
+BEGIN
+    SELECT profile_type INTO creator_type FROM users WHERE user_id = NEW.created_by;
+    IF creator_type NOT IN ('admin', 'super_admin') THEN
+        RAISE EXCEPTION 'Only admins or super admins can create admin accounts';
+    END IF;
+    IF NEW.profile_type = 'super_admin' AND creator_type != 'super_admin' THEN
+        RAISE EXCEPTION 'Only super admins can create super admin accounts';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS enforce_admin_creation ON users;
+CREATE TRIGGER enforce_admin_creation
+BEFORE INSERT ON users
+FOR EACH ROW
+WHEN (NEW.profile_type IN ('admin', 'super_admin') AND NEW.created_by IS NOT NULL)
+EXECUTE FUNCTION ensure_admin_creation();
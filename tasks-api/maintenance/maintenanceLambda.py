@@ -0,0 +1,183 @@
+import os
+import re
+import gzip
+import json
+import logging
+import time
+from datetime import date
+
+import psycopg2.errors
+
+import db
+import aws_clients
+import cognito_outbox
+import instrumentation
+import task_scheduler
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DETACH_LOCK_TIMEOUT = os.environ.get('TASK_CHANGES_DETACH_LOCK_TIMEOUT', '5s')
+
+def reconcile_counters(event):
+    # Correct any drift between the dashboard counters and the tasks table
+    # without blocking task writes (V18): the drift is measured in one
+    # snapshot, then added to the live counters in a short second transaction.
+    start = time.monotonic()
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cur.execute("SELECT stage_task_counter_drift()")
+            conn.commit()
+            cur.execute("SELECT apply_task_counter_drift()")
+            corrected = cur.fetchone()[0]
+    elapsed = time.monotonic() - start
+    logger.info(f"Task counters reconciled in {elapsed:.2f}s, {corrected} row(s) corrected")
+    return {'corrected': corrected, 'elapsed_seconds': round(elapsed, 3)}
+
+def ensure_partitions(event):
+    months_ahead = int(event.get('months_ahead', os.environ.get('TASK_CHANGES_PARTITIONS_AHEAD', '3')))
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT create_task_changes_partitions(CURRENT_DATE, %s)", (months_ahead,))
+            created = cur.fetchone()[0]
+    logger.info(f"Created {created} task_changes partition(s)")
+    return {'created': created}
+
+def expired_partitions(cur, retention_months):
+    # Also returns monthly tables already detached by a run that failed before
+    # dropping them, so the next run finishes archiving them
+    today = date.today()
+    cutoff_index = today.year * 12 + today.month - 1 - retention_months
+    cur.execute("""
+        SELECT c.relname, i.inhrelid IS NOT NULL AS attached
+        FROM pg_class c
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = 'task_changes'::regclass
+        WHERE c.relkind = 'r' AND c.relname ~ '^task_changes_[0-9]{4}_[0-9]{2}$' AND pg_table_is_visible(c.oid)
+        ORDER BY c.relname
+    """)
+    expired = []
+    for name, attached in cur.fetchall():
+        match = re.fullmatch(r'task_changes_(\d{4})_(\d{2})', name)
+        # A partition expires once its whole month is older than the cutoff
+        if match and int(match.group(1)) * 12 + int(match.group(2)) - 1 < cutoff_index:
+            expired.append((name, attached))
+    return expired
+
+def export_partition(cur, name, archive_dir):
+    path = os.path.join(archive_dir, f'{name}.csv.gz')
+    with gzip.open(path, 'wb') as archive:
+        cur.copy_expert(f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER)', archive)
+    return path
+
+def upload_archive(path):
+    bucket = os.environ.get('TASK_CHANGES_ARCHIVE_BUCKET')
+    if not bucket:
+        return path
+    key = f"task_changes/{os.path.basename(path)}"
+    aws_clients.get_client('s3').upload_file(path, bucket, key)
+    os.remove(path)
+    return f's3://{bucket}/{key}'
+
+def detach_partition(name):
+    # DETACH takes an ACCESS EXCLUSIVE lock on task_changes (PostgreSQL 13 has
+    # no DETACH CONCURRENTLY), blocking every task write while it waits and
+    # while it holds it. It is committed on its own and gives up after
+    # DETACH_LOCK_TIMEOUT rather than queue behind a long transaction.
+    try:
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL lock_timeout = %s", (DETACH_LOCK_TIMEOUT,))
+                cur.execute(f'ALTER TABLE task_changes DETACH PARTITION "{name}"')
+    except psycopg2.errors.LockNotAvailable:
+        logger.warning(f"Could not lock task_changes to detach {name} within {DETACH_LOCK_TIMEOUT}, skipping")
+        return False
+    return True
+
+def archive_task_changes(event):
+    # Detach, export and drop partitions older than the retention window
+    retention_months = int(event.get('retention_months', os.environ.get('TASK_CHANGES_RETENTION_MONTHS', '24')))
+    archive_dir = event.get('archive_dir', os.environ.get('TASK_CHANGES_ARCHIVE_DIR', '/tmp'))
+
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            partitions = expired_partitions(cur, retention_months)
+
+    archived = []
+    for name, attached in partitions:
+        start = time.monotonic()
+        if attached and not detach_partition(name):
+            continue
+        # The detached table is only read and then dropped once the export has
+        # been uploaded; a failure in between leaves it for the next run.
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                path = export_partition(cur, name, archive_dir)
+        location = upload_archive(path)
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f'DROP TABLE "{name}"')
+        logger.info(f"Archived {name} to {location} in {time.monotonic() - start:.2f}s")
+        archived.append({'partition': name, 'archive': location})
+    return {'archived': archived}
+
+def drain_cognito_outbox(event):
+    # Meant to run every minute; each run drains what is due and exits
+    start = time.monotonic()
+    summary = cognito_outbox.drain(
+        aws_clients.get_client('cognito-idp'),
+        os.environ['COGNITO_USER_POOL_ID'],
+        max_batches=event.get('max_batches'),
+    )
+    logger.info(f"Cognito outbox drained in {time.monotonic() - start:.2f}s: {summary}")
+    return summary
+
+def schedule_tasks(event):
+    # Nightly: recurring task instances and overdue escalation. Stops a minute
+    # short of the Lambda timeout by default; an unfinished run hands its
+    # 'resume' cursors to a fresh asynchronous invocation of this function,
+    # which carries on from there.
+    start = time.monotonic()
+    summary = task_scheduler.run(
+        chunk_size=int(event.get('chunk_size', task_scheduler.CHUNK_SIZE)),
+        lead_days=int(event.get('lead_days', task_scheduler.LEAD_DAYS)),
+        max_seconds=float(event.get('max_seconds', os.environ.get('TASK_SCHEDULER_MAX_SECONDS', '840'))),
+        resume=event.get('resume'),
+    )
+    logger.info(f"Task scheduler ran in {time.monotonic() - start:.2f}s: {summary}")
+    if summary['resume']:
+        aws_clients.get_client('lambda').invoke(
+            FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+            InvocationType='Event',
+            Payload=json.dumps({**event, 'resume': summary['resume']}),
+        )
+        logger.info(f"Task scheduler continues in a new invocation from {summary['resume']}")
+    return summary
+
+# Scheduled jobs, selected by the 'job' key of the invoking event
+JOBS = {
+    'reconcile_counters': reconcile_counters,
+    'ensure_partitions': ensure_partitions,
+    'archive_task_changes': archive_task_changes,
+    'drain_cognito_outbox': drain_cognito_outbox,
+    'schedule_tasks': schedule_tasks,
+}
+
+def handler(event, context):
+    job_name = event.get('job')
+    job = JOBS.get(job_name)
+    if job is None:
+        logger.error(f"Unknown maintenance job: {job_name}")
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': f'Unknown job: {job_name}'})
+        }
+
+    try:
+        result = job(event)
+    finally:
+        instrumentation.emit_metrics()
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'job': job_name, 'result': result})
+    }
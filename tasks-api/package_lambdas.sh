@@ -5,6 +5,52 @@ set -e  # Exit immediately if a command exits with a non-zero status.
 # Change to the tasks-api directory
 cd "$(dirname "$0")"
 
+# Remove files that are never loaded at runtime from an installed package tree
+# and precompile the rest for the Lambda interpreter. The read-only Lambda
+# filesystem means a missing or mismatched .pyc is recompiled on every cold
+# start, so only the cpython-39 caches are kept.
+strip_package() {
+    local target_dir=$1
+
+    find "$target_dir" -type d \( -name "tests" -o -name "test" \) -prune -exec rm -rf {} +
+    find "$target_dir" -type d -name "*.dist-info" -prune -exec rm -rf {} +
+    find "$target_dir" -type f \( -name "*.pyi" -o -name "*.pyx" -o -name "*.c" -o -name "*.h" \) -delete
+    find "$target_dir" -type f -name "*.pyc" ! -name "*.cpython-39.pyc" -delete
+    python3.9 -m compileall -q "$target_dir"
+}
+
+# Function to install requirements if the file lists any
+install_requirements() {
+    local requirements_file=$1
+    local target_dir=$2
+
+    if grep -qv '^[[:space:]]*\(#\|$\)' "$requirements_file"; then
+        pip3.9 install --platform=manylinux2014_x86_64 --only-binary=:all: --python-version 3.9 \
+            -r "$requirements_file" -t "$target_dir"
+    fi
+}
+
+# Package the shared dependency layer (psycopg2). boto3, botocore and urllib3
+# are already provided by the Lambda Python runtime, so no function ships them.
+package_layer() {
+    local requirements_file=$1
+    local output_zip=$2
+
+    echo "Packaging $output_zip..."
+    rm -f "$output_zip"
+    mkdir -p temp_layer/python
+
+    install_requirements "$requirements_file" temp_layer/python
+    strip_package temp_layer/python
+
+    cd temp_layer
+    zip -qr ../$output_zip .
+    cd ..
+    rm -rf temp_layer
+
+    echo "$output_zip packaged successfully"
+}
+
 # Function to package a Lambda
 package_lambda() {
     local source_dir=$1
@@ -19,21 +65,17 @@ package_lambda() {
     # Create a temporary directory for packaging
     mkdir -p temp_package
 
-    # Copy the Lambda function code
+    # Copy the Lambda function code along with the shared data-access modules
     cp $source_dir/*.py temp_package/
+    cp shared/*.py temp_package/
 
-    # Check if psycopg2-binary is in requirements.txt
-    if grep -q "psycopg2-binary" "$requirements_file"; then
-        echo "psycopg2-binary found in $requirements_file, installing with platform-specific options..."
-        pip3.9 install --platform=manylinux1_x86_64 --only-binary=:all: psycopg2-binary -t temp_package/
-    fi
-
-    # Install other dependencies
-    pip3.9 install -r $requirements_file -t temp_package/
+    # Install function-specific dependencies (psycopg2 comes from the layer)
+    install_requirements "$requirements_file" temp_package/
+    strip_package temp_package
 
     # Create the zip file
     cd temp_package
-    zip -r ../$output_zip .
+    zip -qr ../$output_zip .
     cd ..
 
     # Clean up
@@ -42,6 +84,9 @@ package_lambda() {
     echo "$output_zip packaged successfully"
 }
 
+# Package the shared dependency layer used by every function
+package_layer "layer/requirements.txt" "lambda_layer_deps.zip"
+
 # Package the main backend Lambda
 package_lambda "backend" "backend/requirements.txt" "lambda_backend.zip"
 
@@ -57,6 +102,9 @@ package_lambda "companyManagement" "companyManagement/requirements.txt" "lambda_
 # Package the User Management Lambda
 package_lambda "userManagement" "userManagement/requirements.txt" "lambda_user_management.zip"
 
+# Package the scheduled maintenance jobs Lambda
+package_lambda "maintenance" "maintenance/requirements.txt" "lambda_maintenance.zip"
+
 # Copy the SQL files into the db_init Lambda package
 # Add SQL files to the db_init Lambda package
 zip -j lambda_db_init.zip dbInitLambda/migrations/*.sql
@@ -0,0 +1,45 @@
+import os
+
+from psycopg2.extras import RealDictCursor
+
+import db
+import cache
+
+# Resolves the calling user from the Cognito claims API Gateway's authorizer
+# puts on every request. The result decides company scoping and role checks,
+# so it is cached only briefly: userManagement invalidates it on update and
+# delete, but with the default per-process LocalCache that invalidation does
+# not reach other Lambdas' containers, and a demoted or deleted user keeps
+# their old role there for up to AUTH_CACHE_TTL_SECONDS. Set CACHE_REDIS_URL to
+# make invalidations immediate everywhere.
+AUTH_CACHE_TTL_SECONDS = int(os.environ.get('AUTH_CACHE_TTL_SECONDS', '10'))
+
+ADMIN_ROLES = ('admin', 'super_admin')
+
+
+def claims(event):
+    return ((event.get('requestContext') or {}).get('authorizer') or {}).get('claims') or {}
+
+
+def load_user(cognito_user_id):
+    # Runs unscoped because the company is what it resolves
+    with db.connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                "SELECT user_id, company_id, location_id, profile_type FROM users WHERE cognito_user_id = %s",
+                (cognito_user_id,)
+            )
+            user = cur.fetchone()
+    return dict(user) if user else None
+
+
+def get_user(cognito_user_id):
+    return cache.get_or_load(
+        cache.USER_BY_COGNITO_ID, cognito_user_id, lambda: load_user(cognito_user_id), ttl=AUTH_CACHE_TTL_SECONDS
+    )
+
+
+def get_caller(event):
+    # None when the request carries no identity or it maps to no user
+    sub = claims(event).get('sub')
+    return get_user(sub) if sub else None
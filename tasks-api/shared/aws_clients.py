@@ -0,0 +1,17 @@
+import os
+import threading
+
+import instrumentation
+
+_clients = {}
+_lock = threading.Lock()
+
+def get_client(service_name):
+    # boto3 is a large share of cold-start import time, so it is only imported
+    # (and each client only built) the first time a handler actually needs it
+    with _lock:
+        if service_name not in _clients:
+            import boto3
+            client = boto3.client(service_name, region_name=os.environ.get('AWS_REGION'))
+            _clients[service_name] = instrumentation.instrument_client(client, service_name)
+        return _clients[service_name]
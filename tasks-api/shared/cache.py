@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# Read-through cache for rarely changing lookups. By default entries live in
+# an in-process LRU that survives warm invocations of the same container;
+# setting CACHE_REDIS_URL shares them through a Redis-compatible store so an
+# invalidation in one Lambda is seen by all of them. Values stored in Redis
+# round-trip through JSON, so dates come back as ISO strings.
+DEFAULT_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', '60'))
+MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '1024'))
+KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'tasks')
+
+# Namespaces shared by every Lambda so writers can invalidate readers' entries
+USER_BY_ID = 'user'
+COGNITO_ID_BY_USER = 'cognito_user_id'
+USER_BY_COGNITO_ID = 'user_by_cognito_id'
+COMPANY_HAS_USERS = 'company_has_users'
+# Keyed by company id and revision, so a new revision never reads a stale entry
+COMPANY_TREE = 'company_tree'
+
+
+class LocalCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class RedisCache:
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2)
+
+    def get(self, key):
+        raw = self.client.get(key)
+        if raw is None:
+            return False, None
+        return True, json.loads(raw)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, json.dumps(value, default=str), ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+logger = logging.getLogger()
+
+_backend = None
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        redis_url = os.environ.get('CACHE_REDIS_URL')
+        _backend = RedisCache(redis_url) if redis_url else LocalCache(MAX_ENTRIES)
+    return _backend
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def _record(namespace, outcome):
+    with _stats_lock:
+        counts = _stats.setdefault(namespace, {'hits': 0, 'misses': 0})
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+
+def _key(namespace, key):
+    return f'{KEY_PREFIX}:{namespace}:{key}'
+
+
+def get_or_load(namespace, key, loader, ttl=None, cache_if=None):
+    # cache_if decides which loaded values may be stored; by default "not
+    # found" results are never cached so newly created rows show up at once.
+    # The cache is only ever an optimisation: if the backend (Redis) is down
+    # or slow the value is loaded from the source instead of failing the request.
+    cache_key = _key(namespace, key)
+    try:
+        found, value = get_backend().get(cache_key)
+    except Exception as e:
+        logger.warning(f"Cache read failed for {namespace}, loading directly: {str(e)}")
+        _record(namespace, 'errors')
+        return loader()
+    if found:
+        _record(namespace, 'hits')
+        return value
+
+    _record(namespace, 'misses')
+    value = loader()
+    if (cache_if or (lambda v: v is not None))(value):
+        try:
+            get_backend().set(cache_key, value, ttl or DEFAULT_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Cache write failed for {namespace}: {str(e)}")
+            _record(namespace, 'errors')
+    return value
+
+
+def invalidate(namespace, *keys):
+    # Only reaches other Lambdas' entries with the shared (Redis) backend; with
+    # the per-process LocalCache other containers keep theirs until the TTL.
+    backend = get_backend()
+    for key in keys:
+        if key is None:
+            continue
+        try:
+            backend.delete(_key(namespace, key))
+        except Exception as e:
+            logger.error(f"Cache invalidation failed for {namespace}:{key}: {str(e)}")
+            _record(namespace, 'errors')
+
+
+def stats():
+    with _stats_lock:
+        return {namespace: dict(counts) for namespace, counts in _stats.items()}
+
+
+def emit_metrics():
+    # CloudWatch Embedded Metric Format: one log line, no PutMetricData call
+    current = stats()
+    if not current:
+        return
+    metrics = []
+    record = {}
+    for namespace, counts in current.items():
+        for outcome, count in counts.items():
+            name = f'{namespace}.{outcome}'
+            metrics.append({'Name': name, 'Unit': 'Count'})
+            record[name] = count
+    record['_aws'] = {
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{'Namespace': 'TasksApi/Cache', 'Dimensions': [[]], 'Metrics': metrics}],
+    }
+    print(json.dumps(record))
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,217 @@
+import os
+import json
+import random
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+
+import db
+
+logger = logging.getLogger()
+
+# Worker for the cognito_outbox table (V7). Entries are claimed in batches by
+# leasing them (pushing available_at forward), applied to Cognito outside any
+# database transaction, then marked done or rescheduled with backoff in one
+# statement. Entries for the same user are applied strictly in order, which
+# relies on only one drain running at a time.
+BATCH_SIZE = int(os.environ.get('COGNITO_OUTBOX_BATCH_SIZE', '100'))
+MAX_ATTEMPTS = int(os.environ.get('COGNITO_OUTBOX_MAX_ATTEMPTS', '10'))
+LEASE_SECONDS = int(os.environ.get('COGNITO_OUTBOX_LEASE_SECONDS', '300'))
+CONCURRENCY = int(os.environ.get('COGNITO_OUTBOX_CONCURRENCY', '4'))
+MAX_BACKOFF_SECONDS = 900
+
+# Arbitrary constant for the session advisory lock that serialises drains
+DRAIN_LOCK_ID = 727275
+
+THROTTLING_ERRORS = ('TooManyRequestsException', 'ThrottlingException', 'LimitExceededException')
+
+
+def claim_batch(batch_size):
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            # Skip entries whose user still has an earlier entry leased or
+            # backing off, so an update can never overtake the delete before it
+            cur.execute("""
+                WITH claimable AS (
+                    SELECT o.outbox_id
+                    FROM cognito_outbox o
+                    WHERE o.status = 'pending' AND o.available_at <= CURRENT_TIMESTAMP
+                      AND NOT EXISTS (
+                          SELECT 1 FROM cognito_outbox e
+                          WHERE e.username = o.username AND e.status = 'pending'
+                            AND e.outbox_id < o.outbox_id AND e.available_at > CURRENT_TIMESTAMP
+                      )
+                    ORDER BY o.outbox_id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE cognito_outbox o
+                SET available_at = CURRENT_TIMESTAMP + make_interval(secs => %s), attempts = o.attempts + 1
+                FROM claimable
+                WHERE o.outbox_id = claimable.outbox_id
+                RETURNING o.outbox_id, o.operation, o.username, o.payload, o.attempts
+            """, (batch_size, LEASE_SECONDS))
+            rows = cur.fetchall()
+    return sorted(rows)
+
+
+def error_code(error):
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code')
+
+
+def apply_user_entries(cognito, user_pool_id, username, entries):
+    # Consecutive attribute updates are merged into one call; a delete makes
+    # any updates queued before it moot.
+    results = {}
+    pending_updates = []
+    attributes = {}
+
+    def flush_updates():
+        if not pending_updates:
+            return
+        try:
+            cognito.admin_update_user_attributes(
+                UserPoolId=user_pool_id,
+                Username=username,
+                UserAttributes=[{'Name': name, 'Value': str(value)} for name, value in attributes.items()],
+            )
+            outcome = ('done', None)
+        except Exception as e:
+            outcome = ('dead' if error_code(e) == 'UserNotFoundException' else 'retry', str(e))
+        for outbox_id in pending_updates:
+            results[outbox_id] = outcome
+        pending_updates.clear()
+        attributes.clear()
+
+    for outbox_id, operation, payload in entries:
+        if operation == 'update_attributes':
+            pending_updates.append(outbox_id)
+            attributes.update(payload.get('attributes', {}))
+            continue
+
+        for update_id in pending_updates:
+            results[update_id] = ('done', None)
+        pending_updates.clear()
+        attributes.clear()
+        try:
+            cognito.admin_delete_user(UserPoolId=user_pool_id, Username=username)
+            results[outbox_id] = ('done', None)
+        except Exception as e:
+            if error_code(e) == 'UserNotFoundException':
+                results[outbox_id] = ('done', None)
+            else:
+                results[outbox_id] = ('retry', str(e))
+
+    flush_updates()
+
+    # Anything after a failed entry waits for it so ordering is preserved
+    blocked = False
+    for outbox_id, _, _ in entries:
+        if blocked:
+            results[outbox_id] = ('wait', None)
+        elif results[outbox_id][0] == 'retry':
+            blocked = True
+    return results
+
+
+def backoff_seconds(attempts, throttled):
+    # Exponential with full jitter; throttling retries sooner but spread out
+    ceiling = min(MAX_BACKOFF_SECONDS, (2 if throttled else 5) * 2 ** attempts)
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def record_results(rows, results):
+    values = []
+    for outbox_id, _, _, _, attempts in rows:
+        status, error = results[outbox_id]
+        refund = 0
+        retry_in = 0.0
+        if status == 'wait':
+            # Never attempted: hand the attempt back and let the ordering check hold it
+            status, refund = 'pending', 1
+        elif status == 'retry':
+            status = 'dead' if attempts >= MAX_ATTEMPTS else 'pending'
+            retry_in = backoff_seconds(attempts, any(code in (error or '') for code in THROTTLING_ERRORS))
+        values.append((outbox_id, status, error, retry_in, refund))
+
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                UPDATE cognito_outbox o
+                SET status = v.status,
+                    attempts = o.attempts - v.refund,
+                    last_error = COALESCE(v.error, o.last_error),
+                    processed_at = CASE WHEN v.status = 'pending' THEN NULL ELSE CURRENT_TIMESTAMP END,
+                    available_at = CASE WHEN v.status = 'pending'
+                                        THEN CURRENT_TIMESTAMP + make_interval(secs => v.retry_in)
+                                        ELSE o.available_at END
+                FROM (VALUES %s) AS v (outbox_id, status, error, retry_in, refund)
+                WHERE o.outbox_id = v.outbox_id
+            """, values, template='(%s::bigint, %s, %s, %s::double precision, %s::int)', page_size=len(values))
+    return values
+
+
+@contextmanager
+def drain_lock():
+    # A second drain would not see the first one's uncommitted lease in
+    # claim_batch's ordering check and could claim a user's later entry while
+    # an earlier one is still being applied, so overlapping runs back off.
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (DRAIN_LOCK_ID,))
+            acquired = cur.fetchone()[0]
+            conn.commit()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    conn.rollback()
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (DRAIN_LOCK_ID,))
+
+
+def drain(cognito, user_pool_id, max_batches=None, batch_size=BATCH_SIZE):
+    with drain_lock() as acquired:
+        if not acquired:
+            logger.info("Another Cognito outbox drain is running; skipping this one")
+            return {'done': 0, 'retried': 0, 'dead': 0, 'batches': 0, 'skipped': True}
+        return drain_batches(cognito, user_pool_id, max_batches, batch_size)
+
+
+def drain_batches(cognito, user_pool_id, max_batches, batch_size):
+    summary = {'done': 0, 'retried': 0, 'dead': 0, 'batches': 0}
+    while max_batches is None or summary['batches'] < max_batches:
+        rows = claim_batch(batch_size)
+        if not rows:
+            break
+        summary['batches'] += 1
+
+        by_user = {}
+        for outbox_id, operation, username, payload, _ in rows:
+            if isinstance(payload, str):
+                payload = json.loads(payload)
+            by_user.setdefault(username, []).append((outbox_id, operation, payload))
+
+        # Users are independent, so fan out across them; each user's entries stay sequential
+        results = {}
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+            for user_results in executor.map(
+                lambda item: apply_user_entries(cognito, user_pool_id, *item), by_user.items()
+            ):
+                results.update(user_results)
+
+        for _, status, _, _, _ in record_results(rows, results):
+            if status == 'done':
+                summary['done'] += 1
+            elif status == 'dead':
+                summary['dead'] += 1
+            else:
+                summary['retried'] += 1
+
+        if len(rows) < batch_size:
+            break
+    if summary['dead']:
+        logger.error(f"{summary['dead']} Cognito outbox entries gave up after {MAX_ATTEMPTS} attempts")
+    return summary
@@ -0,0 +1,68 @@
+import re
+
+# Dataloader-style batching: callers ask for rows by key and every key not
+# already loaded in this loader's lifetime is fetched with one batch call
+# (typically a single "= ANY(%s)" query) instead of one query per key.
+# Loaders are meant to live for a single request so their memo never serves
+# stale rows across invocations.
+MAX_BATCH_IDS = 500
+# Ids are INTEGER (SERIAL) columns; anything larger fails the query's cast
+MAX_ID = 2 ** 31 - 1
+
+_FIELD_NAME = re.compile(r'^[a-z_]+$')
+
+
+class DataLoader:
+    def __init__(self, batch_fn, max_batch_size=MAX_BATCH_IDS):
+        # batch_fn(keys) returns {key: value} for the keys that exist
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.memo = {}
+
+    def load(self, key):
+        return self.load_many([key])[key]
+
+    def load_many(self, keys):
+        missing = [key for key in dict.fromkeys(keys) if key not in self.memo]
+        for start in range(0, len(missing), self.max_batch_size):
+            batch = missing[start:start + self.max_batch_size]
+            found = self.batch_fn(batch)
+            for key in batch:
+                self.memo[key] = found.get(key)
+        return {key: self.memo[key] for key in keys}
+
+    def prime(self, key, value):
+        self.memo.setdefault(key, value)
+
+    def clear(self, key=None):
+        if key is None:
+            self.memo.clear()
+        else:
+            self.memo.pop(key, None)
+
+
+def parse_ids(raw, max_ids=MAX_BATCH_IDS):
+    # "1,2,3" -> [1, 2, 3], order preserved and duplicates dropped
+    try:
+        ids = list(dict.fromkeys(int(part) for part in raw.split(',') if part.strip()))
+    except ValueError:
+        raise ValueError('ids must be a comma-separated list of integers')
+    if not ids:
+        raise ValueError('ids must not be empty')
+    if any(not 0 < key <= MAX_ID for key in ids):
+        raise ValueError(f'ids must be between 1 and {MAX_ID}')
+    if len(ids) > max_ids:
+        raise ValueError(f'At most {max_ids} ids can be requested at once')
+    return ids
+
+
+def parse_fields(raw, allowed, key_field):
+    # Projection of caller-chosen columns, checked against an allow-list so the
+    # names are safe to interpolate; the key column is always included.
+    if not raw:
+        return list(allowed)
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed or not _FIELD_NAME.match(field)]
+    if unknown:
+        raise ValueError('Unknown fields: ' + ', '.join(unknown))
+    return [key_field] + [field for field in dict.fromkeys(fields) if field != key_field]
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+import aws_clients
+import instrumentation
+
+logger = logging.getLogger()
+
+# Module-level state survives across warm invocations of the same container,
+# so the secret and open connections are only paid for on a cold start.
+SECRET_TTL_SECONDS = int(os.environ.get('DB_SECRET_TTL_SECONDS', '300'))
+HEALTHCHECK_IDLE_SECONDS = int(os.environ.get('DB_HEALTHCHECK_IDLE_SECONDS', '30'))
+# Connections one container may hold in total, across this pool and (in the
+# backend) async_db's asyncpg pool. The database sees up to concurrent
+# containers x budget connections: keep reserved concurrency x budget under
+# RDS max_connections, or put RDS Proxy in front and point DB_SECRET_ARN at it.
+CONNECTION_BUDGET = int(os.environ.get('DB_CONNECTION_BUDGET', '4'))
+POOL_MAX_CONNECTIONS = int(os.environ.get('DB_POOL_MAX_CONNECTIONS', str(CONNECTION_BUDGET)))
+# Role the row-level security policies (V10) apply to; empty disables tenant scoping
+TENANT_ROLE = os.environ.get('DB_TENANT_ROLE', 'tasks_tenant')
+
+_lock = threading.RLock()
+_secret = None
+_secret_fetched_at = 0.0
+_pool = None
+_last_used = {}
+_owners = {}
+# Tenant each pooled connection's session is currently scoped to (None: unscoped)
+_tenants = {}
+
+# Extra psycopg2.connect() arguments (e.g. a connection_factory) for local
+# tooling; applied when the pool is next built.
+connect_options = {}
+
+
+def reserve_connections(count):
+    # Hands count connections of the budget to another pool in this process;
+    # this pool keeps the rest, at least one, from the next time it is built.
+    global POOL_MAX_CONNECTIONS
+    POOL_MAX_CONNECTIONS = max(1, min(POOL_MAX_CONNECTIONS, CONNECTION_BUDGET - count))
+
+
+def get_secret(force_refresh=False):
+    global _secret, _secret_fetched_at
+    with _lock:
+        expired = time.monotonic() - _secret_fetched_at > SECRET_TTL_SECONDS
+        if _secret is None or expired or force_refresh:
+            response = aws_clients.get_client('secretsmanager').get_secret_value(SecretId=os.environ['DB_SECRET_ARN'])
+            _secret = json.loads(response['SecretString'])
+            _secret_fetched_at = time.monotonic()
+        return _secret
+
+
+def connect_kwargs():
+    # DATABASE_URL points local runs and benchmarks at a database directly
+    if os.environ.get('DATABASE_URL'):
+        return {'dsn': os.environ['DATABASE_URL']}
+    secret = get_secret()
+    return {
+        'host': secret['host'],
+        'port': secret.get('port', 5432),
+        'dbname': os.environ['DB_NAME'],
+        'user': secret['username'],
+        'password': secret['password'],
+    }
+
+
+def _build_pool():
+    options = {'connection_factory': instrumentation.InstrumentedConnection, **connect_options}
+    return pool.ThreadedConnectionPool(0, POOL_MAX_CONNECTIONS, **connect_kwargs(), **options)
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = _build_pool()
+        return _pool
+
+
+def reset_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.closeall()
+        _pool = None
+        _last_used.clear()
+        _owners.clear()
+        _tenants.clear()
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    # Only ping connections that have sat idle long enough for the server or
+    # a NAT gateway to have dropped them; fresh or recently used ones are trusted.
+    last_used = _last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < HEALTHCHECK_IDLE_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _discard(db_pool, conn):
+    _last_used.pop(id(conn), None)
+    _owners.pop(id(conn), None)
+    _tenants.pop(id(conn), None)
+    try:
+        db_pool.putconn(conn, close=True)
+    except pool.PoolError:
+        conn.close()
+
+
+def checkout():
+    for attempt in range(2):
+        db_pool = _get_pool()
+        try:
+            conn = db_pool.getconn()
+        except psycopg2.OperationalError as e:
+            if attempt:
+                raise
+            # Most likely the credentials were rotated underneath us: pull a
+            # fresh secret and rebuild the pool with it before retrying once.
+            logger.warning(f"Database connect failed, refreshing secret: {str(e)}")
+            get_secret(force_refresh=True)
+            reset_pool()
+            continue
+
+        if not _is_healthy(conn):
+            _discard(db_pool, conn)
+            conn = db_pool.getconn()
+        _owners[id(conn)] = db_pool
+        return conn
+    raise psycopg2.OperationalError("Unable to obtain a database connection")
+
+
+def _set_tenant(conn, company_id):
+    # Session-level, so it is only sent when a connection changes tenant; run
+    # outside the request transaction so a rollback can never undo it while
+    # _tenants still claims the session is scoped.
+    tenant = str(company_id) if company_id is not None and TENANT_ROLE else None
+    if _tenants.get(id(conn)) == tenant:
+        return
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            if tenant is None:
+                cur.execute("RESET ROLE; RESET app.company_id")
+            else:
+                cur.execute(f"SET ROLE {TENANT_ROLE}; SELECT set_config('app.company_id', %s, false)", (tenant,))
+    except psycopg2.Error:
+        # Session state unknown: close it so release() drops it from the pool
+        conn.close()
+        raise
+    finally:
+        if not conn.closed:
+            conn.autocommit = False
+    _tenants[id(conn)] = tenant
+
+
+def release(conn):
+    db_pool = _owners.pop(id(conn), None)
+    if db_pool is None or db_pool is not _pool:
+        # The pool was rebuilt while this connection was checked out.
+        _tenants.pop(id(conn), None)
+        conn.close()
+        return
+    if conn.closed:
+        _discard(db_pool, conn)
+        return
+    _last_used[id(conn)] = time.monotonic()
+    db_pool.putconn(conn)
+
+
+@contextmanager
+def connection(company_id=None):
+    # With a company_id the session runs as TENANT_ROLE and row-level security
+    # limits every query to that company; without one it is unscoped.
+    conn = checkout()
+    try:
+        _set_tenant(conn, company_id)
+    except Exception:
+        release(conn)
+        raise
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        release(conn)
@@ -0,0 +1,214 @@
+import os
+import re
+import json
+import time
+import threading
+
+import psycopg2.extensions
+
+# Per-invocation timings for SQL statements, connection setup and AWS API
+# calls. Database connections are instrumented through a connection_factory
+# and boto3 clients through botocore's before-call/after-call events, so
+# handlers only need to call emit_metrics() once the invocation is done.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', '5'))
+MAX_REPORTED_STATEMENTS = 20
+STATEMENT_PREVIEW_CHARS = 500
+
+_lock = threading.Lock()
+_queries = {}
+_aws_calls = {}
+_totals = {'connects': 0, 'connect_ms': 0.0, 'slow_queries': 0, 'query_errors': 0}
+_cursor_classes = {}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _statement_text(cursor, query):
+    if isinstance(query, bytes):
+        return query.decode('utf-8', 'replace')
+    if isinstance(query, str):
+        return query
+    # psycopg2.sql.Composable
+    return query.as_string(cursor)
+
+
+def fingerprint(statement):
+    # Literals are folded so statements built by execute_values or string
+    # formatting still group with their siblings for N+1 detection.
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    return _WHITESPACE.sub(' ', statement).strip()[:STATEMENT_PREVIEW_CHARS]
+
+
+def _log(event, **fields):
+    print(json.dumps({'event': event, **fields}, default=str))
+
+
+def record_query(cursor, query, elapsed_ms, failed=False):
+    try:
+        statement = fingerprint(_statement_text(cursor, query))
+    except Exception:
+        statement = '<unprintable statement>'
+    with _lock:
+        entry = _queries.setdefault(statement, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        entry['calls'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        if failed:
+            _totals['query_errors'] += 1
+        if elapsed_ms >= SLOW_QUERY_MS:
+            _totals['slow_queries'] += 1
+    if elapsed_ms >= SLOW_QUERY_MS:
+        _log('slow_query', duration_ms=round(elapsed_ms, 2), threshold_ms=SLOW_QUERY_MS, statement=statement)
+
+
+def record_connect(elapsed_ms):
+    with _lock:
+        _totals['connects'] += 1
+        _totals['connect_ms'] += elapsed_ms
+
+
+def record_aws_call(service_name, operation, elapsed_ms, failed=False):
+    with _lock:
+        entry = _aws_calls.setdefault(service_name, {'calls': 0, 'total_ms': 0.0, 'errors': 0, 'operations': {}})
+        entry['calls'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['operations'][operation] = entry['operations'].get(operation, 0) + 1
+        if failed:
+            entry['errors'] += 1
+
+
+def _instrumented_cursor(factory):
+    # One subclass per cursor class in use (plain, RealDictCursor, ...)
+    with _lock:
+        if factory in _cursor_classes:
+            return _cursor_classes[factory]
+
+    def execute(cursor, query, vars=None):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = factory.execute(cursor, query, vars)
+            failed = False
+            return result
+        finally:
+            record_query(cursor, query, (time.perf_counter() - start) * 1000, failed)
+
+    def executemany(cursor, query, vars_list):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = factory.executemany(cursor, query, vars_list)
+            failed = False
+            return result
+        finally:
+            record_query(cursor, query, (time.perf_counter() - start) * 1000, failed)
+
+    cursor_class = type(f'Instrumented{factory.__name__}', (factory,), {
+        'execute': execute, 'executemany': executemany,
+    })
+    with _lock:
+        return _cursor_classes.setdefault(factory, cursor_class)
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        start = time.perf_counter()
+        super().__init__(*args, **kwargs)
+        record_connect((time.perf_counter() - start) * 1000)
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _instrumented_cursor(factory)
+        return super().cursor(*args, **kwargs)
+
+
+def instrument_client(client, service_name):
+    def before_call(context=None, **kwargs):
+        context['instrumentation_start'] = time.perf_counter()
+
+    def after_call(event_name, context=None, **kwargs):
+        start = (context or {}).pop('instrumentation_start', None)
+        if start is None:
+            return
+        # Error responses still arrive through after-call; transport failures
+        # through after-call-error
+        parsed = kwargs.get('parsed') or {}
+        failed = event_name.startswith('after-call-error') or 'Error' in parsed
+        record_aws_call(service_name, event_name.split('.')[-1], (time.perf_counter() - start) * 1000, failed)
+
+    client.meta.events.register('before-call', before_call)
+    client.meta.events.register('after-call', after_call)
+    client.meta.events.register('after-call-error', after_call)
+    return client
+
+
+def snapshot():
+    with _lock:
+        return {
+            'queries': {statement: dict(entry) for statement, entry in _queries.items()},
+            'aws_calls': {service: dict(entry, operations=dict(entry['operations'])) for service, entry in _aws_calls.items()},
+            'totals': dict(_totals),
+        }
+
+
+def reset():
+    with _lock:
+        _queries.clear()
+        _aws_calls.clear()
+        _totals.update(connects=0, connect_ms=0.0, slow_queries=0, query_errors=0)
+
+
+def emit_metrics():
+    # One CloudWatch Embedded Metric Format line per invocation; the top
+    # statements ride along as properties for Logs Insights queries.
+    current = snapshot()
+    reset()
+    queries = current['queries']
+    totals = current['totals']
+    if not queries and not current['aws_calls'] and not totals['connects']:
+        return
+
+    suspects = [
+        {'statement': statement, 'calls': entry['calls']}
+        for statement, entry in queries.items()
+        if entry['calls'] >= N_PLUS_ONE_THRESHOLD
+    ]
+    for suspect in suspects:
+        _log('n_plus_one', threshold=N_PLUS_ONE_THRESHOLD, **suspect)
+
+    record = {
+        'FunctionName': os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local'),
+        'QueryCount': sum(entry['calls'] for entry in queries.values()),
+        'QueryTimeMs': round(sum(entry['total_ms'] for entry in queries.values()), 2),
+        'SlowQueryCount': totals['slow_queries'],
+        'QueryErrorCount': totals['query_errors'],
+        'NPlusOneCount': len(suspects),
+        'ConnectCount': totals['connects'],
+        'ConnectTimeMs': round(totals['connect_ms'], 2),
+    }
+    metrics = [
+        {'Name': name, 'Unit': 'Milliseconds' if name.endswith('Ms') else 'Count'}
+        for name in record if name != 'FunctionName'
+    ]
+    for service_name, entry in current['aws_calls'].items():
+        for suffix, value in (('CallCount', entry['calls']), ('TimeMs', round(entry['total_ms'], 2)), ('ErrorCount', entry['errors'])):
+            name = f'{service_name}.{suffix}'
+            record[name] = value
+            metrics.append({'Name': name, 'Unit': 'Milliseconds' if suffix == 'TimeMs' else 'Count'})
+
+    top = sorted(queries.items(), key=lambda item: item[1]['total_ms'], reverse=True)[:MAX_REPORTED_STATEMENTS]
+    record['statements'] = [
+        {'statement': statement, 'calls': entry['calls'],
+         'total_ms': round(entry['total_ms'], 2), 'max_ms': round(entry['max_ms'], 2)}
+        for statement, entry in top
+    ]
+    record['aws_operations'] = {service: entry['operations'] for service, entry in current['aws_calls'].items()}
+    record['_aws'] = {
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{'Namespace': 'TasksApi/Queries', 'Dimensions': [['FunctionName']], 'Metrics': metrics}],
+    }
+    print(json.dumps(record))
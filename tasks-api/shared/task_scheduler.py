@@ -0,0 +1,200 @@
+import os
+import time
+import logging
+from datetime import date
+
+import psycopg2.errors
+
+import db
+
+logger = logging.getLogger()
+
+# Nightly pass over the task tables (V12): creates the instances of recurring
+# task templates that have come due and raises the priority of overdue open
+# tasks. Both walk their partial index in keyset order, CHUNK_SIZE rows per
+# statement and one short transaction per chunk. Rows locked by live API
+# writes are skipped (the idempotent next run picks them up) and lock or
+# statement timeouts halve the chunk instead of stalling the run.
+CHUNK_SIZE = int(os.environ.get('TASK_SCHEDULER_CHUNK_SIZE', '5000'))
+LOCK_TIMEOUT = os.environ.get('TASK_SCHEDULER_LOCK_TIMEOUT', '2s')
+STATEMENT_TIMEOUT = os.environ.get('TASK_SCHEDULER_STATEMENT_TIMEOUT', '30s')
+# Instances are created this many days before they are due
+LEAD_DAYS = int(os.environ.get('RECURRING_TASKS_LEAD_DAYS', '0'))
+# An overdue task gains one priority level per this many days late, up to 1
+ESCALATION_STEP_DAYS = int(os.environ.get('OVERDUE_ESCALATION_STEP_DAYS', '1'))
+MAX_CHUNK_RETRIES = 3
+# app.current_user_id for the scheduler's writes: the audit trigger (V15) logs
+# them with no changed_by instead of crediting the task's assignee
+SYSTEM_USER = 'system'
+
+# Keyset start for a fresh run: before every (date, id) pair
+START = ('-infinity', 0)
+
+
+def generate_recurring_chunk(cur, after, chunk_size, today, lead_days):
+    # The template columns are read by the locking scan itself, so a template
+    # another run advanced meanwhile is re-checked against the horizon rather
+    # than generated twice from its old next_due_date.
+    cur.execute("""
+        WITH due AS (
+            SELECT recurrence_id, location_id, created_by, task_title, description, assigned_to,
+                   is_pooled, priority, recurrence_interval, next_due_date
+            FROM recurring_tasks
+            WHERE active AND next_due_date <= %(horizon)s
+              AND (next_due_date, recurrence_id) > (%(after_date)s::date, %(after_id)s)
+            ORDER BY next_due_date, recurrence_id
+            LIMIT %(chunk_size)s
+            FOR UPDATE SKIP LOCKED
+        ), occurrences AS (
+            SELECT d.*, o::date AS due_date
+            FROM due d
+            CROSS JOIN LATERAL generate_series(
+                d.next_due_date::timestamp, %(horizon)s::timestamp, d.recurrence_interval
+            ) AS o
+        ), created AS (
+            INSERT INTO tasks (source, creation_date_by_user, location_id, task_title, description,
+                               due_date, assigned_to, is_pooled, status, priority)
+            SELECT created_by, %(today)s, location_id, task_title, description,
+                   due_date, assigned_to, is_pooled, 'open', priority
+            FROM occurrences
+            RETURNING task_id
+        ), advanced AS (
+            UPDATE recurring_tasks r
+            SET next_due_date = (o.last_due_date + r.recurrence_interval)::date
+            FROM (SELECT recurrence_id, max(due_date) AS last_due_date FROM occurrences GROUP BY recurrence_id) o
+            WHERE r.recurrence_id = o.recurrence_id
+        )
+        SELECT next_due_date, recurrence_id, (SELECT count(*) FROM due), (SELECT count(*) FROM created)
+        FROM due
+        ORDER BY next_due_date DESC, recurrence_id DESC
+        LIMIT 1
+    """, {
+        'horizon': date.fromordinal(today.toordinal() + lead_days),
+        'today': today,
+        'after_date': after[0],
+        'after_id': after[1],
+        'chunk_size': chunk_size,
+    })
+    row = cur.fetchone()
+    if row is None:
+        return None, 0, 0
+    return (row[0], row[1]), row[2], row[3]
+
+
+def escalate_overdue_chunk(cur, after, chunk_size, today, step_days):
+    # The target priority only depends on how late the task is, so rerunning
+    # a night (or resuming one) never escalates a task twice; explicit
+    # priorities above the target are left alone. The WHERE clause repeats
+    # idx_tasks_overdue_escalation's predicate so the scan uses it.
+    cur.execute("""
+        WITH chunk AS (
+            SELECT task_id, due_date, priority
+            FROM tasks
+            WHERE status = 'open' AND due_date IS NOT NULL AND (priority IS NULL OR priority > 1)
+              AND due_date < %(today)s
+              AND (due_date, task_id) > (%(after_date)s::date, %(after_id)s)
+            ORDER BY due_date, task_id
+            LIMIT %(chunk_size)s
+            FOR UPDATE SKIP LOCKED
+        ), targets AS (
+            SELECT task_id, priority,
+                   GREATEST(1, 6 - ceil((%(today)s - due_date) / %(step_days)s::numeric)::integer) AS target
+            FROM chunk
+        ), escalated AS (
+            UPDATE tasks t
+            SET priority = g.target
+            FROM targets g
+            WHERE t.task_id = g.task_id AND COALESCE(g.priority, 6) > g.target
+            RETURNING t.task_id
+        )
+        SELECT due_date, task_id, (SELECT count(*) FROM chunk), (SELECT count(*) FROM escalated)
+        FROM chunk
+        ORDER BY due_date DESC, task_id DESC
+        LIMIT 1
+    """, {
+        'today': today,
+        'step_days': step_days,
+        'after_date': after[0],
+        'after_id': after[1],
+        'chunk_size': chunk_size,
+    })
+    row = cur.fetchone()
+    if row is None:
+        return None, 0, 0
+    return (row[0], row[1]), row[2], row[3]
+
+
+def run_chunks(name, chunk_fn, after, chunk_size, deadline, *args):
+    summary = {'scanned': 0, 'changed': 0, 'chunks': 0, 'max_chunk_ms': 0.0}
+    retries = 0
+    while True:
+        if time.monotonic() > deadline:
+            logger.info(f"{name}: time budget used up, resume after {after}")
+            return summary, after
+        start = time.monotonic()
+        try:
+            with db.connection() as conn:
+                with conn.cursor() as cur:
+                    # Bound what one chunk can wait for or hold against API traffic
+                    cur.execute(
+                        "SET LOCAL lock_timeout = %s; SET LOCAL statement_timeout = %s; "
+                        "SELECT set_config('app.current_user_id', %s, true)",
+                        (LOCK_TIMEOUT, STATEMENT_TIMEOUT, SYSTEM_USER)
+                    )
+                    next_after, scanned, changed = chunk_fn(cur, after, chunk_size, *args)
+        except (psycopg2.errors.LockNotAvailable, psycopg2.errors.QueryCanceled) as e:
+            if retries >= MAX_CHUNK_RETRIES:
+                raise
+            retries += 1
+            chunk_size = max(1, chunk_size // 2)
+            logger.warning(f"{name}: chunk after {after} timed out ({str(e).strip()}), retrying with {chunk_size} rows")
+            continue
+        retries = 0
+
+        elapsed_ms = (time.monotonic() - start) * 1000
+        if next_after is None:
+            return summary, None
+        summary['chunks'] += 1
+        summary['scanned'] += scanned
+        summary['changed'] += changed
+        summary['max_chunk_ms'] = round(max(summary['max_chunk_ms'], elapsed_ms), 2)
+        after = next_after
+
+
+def encode_resume(after):
+    return [after[0].isoformat() if isinstance(after[0], date) else after[0], after[1]] if after else None
+
+
+def run(chunk_size=CHUNK_SIZE, lead_days=LEAD_DAYS, step_days=ESCALATION_STEP_DAYS, max_seconds=None, resume=None):
+    # Callable directly for local runs. With max_seconds the run stops between
+    # chunks once the budget is spent and returns where each pass got to;
+    # passing that back as resume continues from there.
+    resume = resume or {}
+    deadline = time.monotonic() + max_seconds if max_seconds else float('inf')
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT CURRENT_DATE")
+            today = cur.fetchone()[0]
+
+    recurring, recurring_after = run_chunks(
+        'recurring tasks', generate_recurring_chunk, tuple(resume.get('recurring') or START),
+        chunk_size, deadline, today, lead_days,
+    )
+    escalation, escalation_after = run_chunks(
+        'overdue escalation', escalate_overdue_chunk, tuple(resume.get('escalation') or START),
+        chunk_size, deadline, today, step_days,
+    )
+
+    recurring['tasks_created'] = recurring.pop('changed')
+    escalation['tasks_escalated'] = escalation.pop('changed')
+    pending = {}
+    if recurring_after:
+        pending['recurring'] = encode_resume(recurring_after)
+    if escalation_after:
+        pending['escalation'] = encode_resume(escalation_after)
+    return {
+        'date': today.isoformat(),
+        'recurring': recurring,
+        'escalation': escalation,
+        'resume': pending or None,
+    }
@@ -0,0 +1,207 @@
+import csv
+import io
+import json
+import os
+import re
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+from psycopg2.extras import execute_values
+
+import db
+
+REQUIRED_FIELDS = ('email', 'first_name', 'last_name', 'company_id', 'role', 'temporary_password')
+VALID_ROLES = ('super_admin', 'admin', 'employee')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+MAX_BULK_USERS = int(os.environ.get('BULK_MAX_USERS', '1000'))
+COGNITO_CONCURRENCY = int(os.environ.get('BULK_COGNITO_CONCURRENCY', '8'))
+# API Gateway gives up on the request after 29s. Cognito creates stop being
+# started once this budget is spent, leaving time for the batched insert; the
+# rows not attempted come back as 'skipped' for the client to resubmit.
+TIME_BUDGET_SECONDS = float(os.environ.get('BULK_TIME_BUDGET_SECONDS', '20'))
+COGNITO_MAX_RETRIES = 5
+THROTTLING_ERRORS = ('TooManyRequestsException', 'ThrottlingException', 'LimitExceededException')
+
+
+class BulkImportError(Exception):
+    def __init__(self, message, results=None):
+        super().__init__(message)
+        self.results = results or []
+
+
+def parse_rows(event):
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    body = event['body'] or ''
+    if 'csv' in headers.get('content-type', ''):
+        reader = csv.DictReader(io.StringIO(body))
+        return [{k.strip().lower(): (v or '').strip() for k, v in row.items() if k} for row in reader]
+
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = data.get('users', [])
+    if not isinstance(data, list):
+        raise BulkImportError('Expected a JSON array of users or a CSV body')
+    return data
+
+
+def validate_rows(rows, caller):
+    # Imports only ever add users to the caller's own company, and only super
+    # admins may create admins, as in the preSignup trigger
+    if not rows:
+        raise BulkImportError('No users supplied')
+    if len(rows) > MAX_BULK_USERS:
+        raise BulkImportError(f'At most {MAX_BULK_USERS} users can be imported per request')
+
+    results = []
+    seen_emails = set()
+    for index, row in enumerate(rows):
+        errors = []
+        if not isinstance(row, dict):
+            results.append({'row': index, 'status': 'invalid', 'errors': ['Row must be an object']})
+            continue
+        for field in REQUIRED_FIELDS:
+            if not str(row.get(field) or '').strip():
+                errors.append(f'{field} is required')
+        email = row['email'] = str(row.get('email') or '').strip().lower()
+        if email and not EMAIL_PATTERN.match(email):
+            errors.append('email is invalid')
+        if email in seen_emails:
+            errors.append('email is duplicated in this import')
+        seen_emails.add(email)
+        if row.get('role') and row['role'] not in VALID_ROLES:
+            errors.append('role must be one of ' + ', '.join(VALID_ROLES))
+        elif row.get('role') in ('admin', 'super_admin') and caller['profile_type'] != 'super_admin':
+            errors.append('only super admins can create admin or super admin users')
+        if str(row.get('company_id') or '').strip():
+            try:
+                row['company_id'] = int(row['company_id'])
+            except (TypeError, ValueError):
+                errors.append('company_id must be an integer')
+            else:
+                if row['company_id'] != caller['company_id']:
+                    errors.append('users can only be imported into your own company')
+        results.append({'row': index, 'email': email, 'status': 'invalid' if errors else 'valid', 'errors': errors})
+
+    # One query for every address and the company instead of one lookup per
+    # row. Emails are unique across companies, so this runs unscoped.
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT ARRAY(SELECT lower(email) FROM users WHERE lower(email) = ANY(%s)),
+                       EXISTS (SELECT 1 FROM companies WHERE company_id = %s)
+            """, (list(seen_emails), caller['company_id']))
+            existing, company_exists = cur.fetchone()
+    existing = set(existing)
+    for result in results:
+        if result.get('email') in existing:
+            result['status'] = 'invalid'
+            result['errors'].append('a user with this email already exists')
+        if not company_exists and result['status'] != 'invalid':
+            result['status'] = 'invalid'
+            result['errors'].append('company does not exist')
+
+    if any(result['status'] == 'invalid' for result in results):
+        raise BulkImportError('Validation failed, no users were imported', results)
+    return results
+
+
+def call_with_backoff(func, deadline=None, **kwargs):
+    for attempt in range(COGNITO_MAX_RETRIES + 1):
+        try:
+            return func(**kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in THROTTLING_ERRORS or attempt == COGNITO_MAX_RETRIES:
+                raise
+            # Full jitter keeps the worker threads from retrying in lockstep
+            delay = random.uniform(0, min(8, 0.2 * 2 ** attempt))
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise
+            time.sleep(delay)
+
+
+def create_cognito_user(cognito, user_pool_id, row, deadline=None):
+    response = call_with_backoff(
+        cognito.admin_create_user,
+        deadline=deadline,
+        UserPoolId=user_pool_id,
+        Username=row['email'],
+        UserAttributes=[
+            {'Name': 'email', 'Value': row['email']},
+            {'Name': 'given_name', 'Value': row['first_name']},
+            {'Name': 'family_name', 'Value': row['last_name']},
+            {'Name': 'custom:company_id', 'Value': str(row['company_id'])},
+            {'Name': 'custom:role', 'Value': row['role']},
+        ],
+        TemporaryPassword=row['temporary_password']
+    )
+    attributes = {attr['Name']: attr['Value'] for attr in response['User'].get('Attributes', [])}
+    return attributes.get('sub', response['User']['Username'])
+
+
+def delete_cognito_user(cognito, user_pool_id, username):
+    try:
+        call_with_backoff(cognito.admin_delete_user, UserPoolId=user_pool_id, Username=username)
+    except ClientError as e:
+        print(f"Error rolling back Cognito user {username}: {str(e)}")
+
+
+def import_users(rows, cognito, user_pool_id, caller):
+    deadline = time.monotonic() + TIME_BUDGET_SECONDS
+    results = validate_rows(rows, caller)
+
+    # Fan the Cognito creates out over a bounded pool; each row succeeds or fails on its own
+    def create(index):
+        if time.monotonic() > deadline:
+            return index, None, None
+        try:
+            return index, create_cognito_user(cognito, user_pool_id, rows[index], deadline), None
+        except Exception as e:
+            return index, None, str(e)
+
+    created = {}
+    with ThreadPoolExecutor(max_workers=COGNITO_CONCURRENCY) as executor:
+        for index, cognito_user_id, error in executor.map(create, range(len(rows))):
+            if error:
+                results[index].update(status='failed', errors=[error])
+            elif cognito_user_id is None:
+                results[index].update(status='skipped', errors=['Not attempted within the time limit; import it again'])
+            else:
+                created[index] = cognito_user_id
+
+    if created:
+        values = [
+            (
+                created[index],
+                rows[index]['role'],
+                rows[index]['company_id'],
+                rows[index]['first_name'],
+                rows[index]['last_name'],
+                results[index]['email'],
+            )
+            for index in sorted(created)
+        ]
+        try:
+            with db.connection() as conn:
+                with conn.cursor() as cur:
+                    inserted = execute_values(cur, """
+                        INSERT INTO users (cognito_user_id, profile_type, company_id, fname, lname, email)
+                        VALUES %s
+                        RETURNING user_id, email
+                    """, values, page_size=len(values), fetch=True)
+        except Exception as e:
+            # Keep Cognito and the database in step: undo the accounts we just created
+            with ThreadPoolExecutor(max_workers=COGNITO_CONCURRENCY) as executor:
+                for index in created:
+                    executor.submit(delete_cognito_user, cognito, user_pool_id, results[index]['email'])
+            for index in created:
+                results[index].update(status='failed', errors=[f'Database insert failed: {str(e)}'])
+            return results
+
+        user_ids = {email: user_id for user_id, email in inserted}
+        for index in created:
+            results[index].update(status='created', user_id=user_ids.get(results[index]['email']))
+
+    return results
@@ -1,42 +1,27 @@
 import json
 import os
-import boto3
-import psycopg2
 from psycopg2.extras import RealDictCursor
-from botocore.exceptions import ClientError
 
-# Initialize AWS clients
-cognito = boto3.client('cognito-idp')
-secretsmanager = boto3.client('secretsmanager')
+import db
+import auth
+import cache
+import aws_clients
+import instrumentation
+from dataloader import DataLoader, parse_fields, parse_ids
+from bulkImport import BulkImportError, import_users, parse_rows
 
 # Fetch configuration from environment variables
 USER_POOL_ID = os.environ['COGNITO_USER_POOL_ID']
 CLIENT_ID = os.environ['COGNITO_APP_CLIENT_ID']
-DB_SECRET_ARN = os.environ['DB_SECRET_ARN']
-DB_NAME = os.environ['DB_NAME']
 
-def get_db_connection():
-    try:
-        secret = secretsmanager.get_secret_value(SecretId=DB_SECRET_ARN)
-        secret_dict = json.loads(secret['SecretString'])
-        
-        conn = psycopg2.connect(
-            host=secret_dict['host'],
-            port=secret_dict['port'],
-            dbname=DB_NAME,
-            user=secret_dict['username'],
-            password=secret_dict['password']
-        )
-        return conn
-    except Exception as e:
-        print(f"Error connecting to database: {str(e)}")
-        raise e
+def cognito():
+    return aws_clients.get_client('cognito-idp')
 
 def create_user(event):
     user_data = json.loads(event['body'])
     try:
         # Create user in Cognito
-        cognito_response = cognito.admin_create_user(
+        cognito_response = cognito().admin_create_user(
             UserPoolId=USER_POOL_ID,
             Username=user_data['email'],
             UserAttributes=[
@@ -50,22 +35,21 @@ def create_user(event):
         )
         
         # Insert user into database
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO users (cognito_user_id, email, first_name, last_name, company_id, role)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                RETURNING user_id
-            """, (
-                cognito_response['User']['Username'],
-                user_data['email'],
-                user_data['first_name'],
-                user_data['last_name'],
-                user_data['company_id'],
-                user_data['role']
-            ))
-            user_id = cur.fetchone()[0]
-        conn.commit()
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO users (cognito_user_id, email, fname, lname, company_id, profile_type)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    RETURNING user_id
+                """, (
+                    cognito_response['User']['Username'],
+                    user_data['email'],
+                    user_data['first_name'],
+                    user_data['last_name'],
+                    user_data['company_id'],
+                    user_data['role']
+                ))
+                user_id = cur.fetchone()[0]
         
         return {
             'statusCode': 200,
@@ -78,18 +62,100 @@ def create_user(event):
             'body': json.dumps({'error': str(e)})
         }
 
-def get_user(event):
-    user_id = event['pathParameters']['userId']
+def bulk_create_users(event):
+    caller = auth.get_caller(event)
+    if not caller or caller['profile_type'] not in auth.ADMIN_ROLES:
+        return {
+            'statusCode': 403,
+            'body': json.dumps({'error': 'Only admins or super admins can import users'})
+        }
     try:
-        conn = get_db_connection()
+        rows = parse_rows(event)
+        results = import_users(rows, cognito(), USER_POOL_ID, caller)
+        counts = {status: sum(1 for result in results if result['status'] == status)
+                  for status in ('created', 'failed', 'skipped')}
+        return {
+            'statusCode': 200,
+            'body': json.dumps({**counts, 'results': results})
+        }
+    except (BulkImportError, ValueError) as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': str(e), 'results': getattr(e, 'results', [])})
+        }
+    except Exception as e:
+        print(f"Error importing users: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def load_user(user_id):
+    with db.connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
             user = cur.fetchone()
+    return dict(user) if user else None
+
+USER_FIELDS = (
+    'user_id', 'cognito_user_id', 'profile_type', 'creation_timestamp', 'fname', 'lname',
+    'email', 'location_id', 'created_by', 'company_id',
+)
+
+def load_users(user_ids, fields, company_id):
+    # Other companies' ids are reported as missing
+    columns = ', '.join(fields)
+    with db.connection(company_id) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                f"SELECT {columns} FROM users WHERE user_id = ANY(%s) AND company_id = %s",
+                (list(user_ids), company_id)
+            )
+            return {row['user_id']: dict(row) for row in cur.fetchall()}
+
+def get_users(event):
+    caller = auth.get_caller(event)
+    if not caller:
+        return {
+            'statusCode': 403,
+            'body': json.dumps({'message': 'User not found'})
+        }
+    params = event.get('queryStringParameters') or {}
+    try:
+        user_ids = parse_ids(params.get('ids') or '')
+        fields = parse_fields(params.get('fields'), USER_FIELDS, 'user_id')
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'message': str(e)})
+        }
+
+    try:
+        # One query for the whole id list, returned in the order requested
+        users = DataLoader(lambda ids: load_users(ids, fields, caller['company_id'])).load_many(user_ids)
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'users': [user for user in users.values() if user],
+                'missing': [user_id for user_id, user in users.items() if not user],
+            }, default=str)
+        }
+    except Exception as e:
+        print(f"Error getting users: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def get_user(event):
+    user_id = event['pathParameters']['userId']
+    try:
+        user = cache.get_or_load(cache.USER_BY_ID, user_id, lambda: load_user(user_id))
         
         if user:
             return {
                 'statusCode': 200,
-                'body': json.dumps(user)
+                'body': json.dumps(user, default=str)
             }
         else:
             return {
@@ -106,32 +172,43 @@ def get_user(event):
 def update_user(event):
     user_id = event['pathParameters']['userId']
     user_data = json.loads(event['body'])
+    attributes = {
+        'given_name': user_data['first_name'],
+        'family_name': user_data['last_name'],
+        'custom:role': user_data['role'],
+    }
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute("""
-                UPDATE users
-                SET first_name = %s, last_name = %s, role = %s
-                WHERE user_id = %s
-            """, (
-                user_data['first_name'],
-                user_data['last_name'],
-                user_data['role'],
-                user_id
-            ))
-        conn.commit()
-        
-        # Update user in Cognito
-        cognito_user_id = get_cognito_user_id(user_id)
-        cognito.admin_update_user_attributes(
-            UserPoolId=USER_POOL_ID,
-            Username=cognito_user_id,
-            UserAttributes=[
-                {'Name': 'given_name', 'Value': user_data['first_name']},
-                {'Name': 'family_name', 'Value': user_data['last_name']},
-                {'Name': 'custom:role', 'Value': user_data['role']},
-            ]
-        )
+        # The row and its Cognito outbox entry commit together; the
+        # drain_cognito_outbox job applies the attribute change afterwards.
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    WITH updated AS (
+                        UPDATE users
+                        SET fname = %s, lname = %s, profile_type = %s
+                        WHERE user_id = %s
+                        RETURNING cognito_user_id
+                    ), queued AS (
+                        INSERT INTO cognito_outbox (operation, username, payload)
+                        SELECT 'update_attributes', cognito_user_id, %s FROM updated
+                    )
+                    SELECT cognito_user_id FROM updated
+                """, (
+                    user_data['first_name'],
+                    user_data['last_name'],
+                    user_data['role'],
+                    user_id,
+                    json.dumps({'attributes': attributes})
+                ))
+                result = cur.fetchone()
+        if not result:
+            return {
+                'statusCode': 404,
+                'body': json.dumps({'message': 'User not found'})
+            }
+        cognito_user_id = result[0]
+        cache.invalidate(cache.USER_BY_ID, user_id)
+        cache.invalidate(cache.USER_BY_COGNITO_ID, cognito_user_id)
         
         return {
             'statusCode': 200,
@@ -147,18 +224,29 @@ def update_user(event):
 def delete_user(event):
     user_id = event['pathParameters']['userId']
     try:
-        # Delete user from database
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
-        conn.commit()
-        
-        # Delete user from Cognito
-        cognito_user_id = get_cognito_user_id(user_id)
-        cognito.admin_delete_user(
-            UserPoolId=USER_POOL_ID,
-            Username=cognito_user_id
-        )
+        # Delete from the database and queue the Cognito delete in one transaction
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    WITH deleted AS (
+                        DELETE FROM users WHERE user_id = %s RETURNING cognito_user_id, company_id
+                    ), queued AS (
+                        INSERT INTO cognito_outbox (operation, username)
+                        SELECT 'delete_user', cognito_user_id FROM deleted
+                    )
+                    SELECT cognito_user_id, company_id FROM deleted
+                """, (user_id,))
+                result = cur.fetchone()
+        if not result:
+            return {
+                'statusCode': 404,
+                'body': json.dumps({'message': 'User not found'})
+            }
+        cognito_user_id, company_id = result
+        cache.invalidate(cache.USER_BY_ID, user_id)
+        cache.invalidate(cache.COGNITO_ID_BY_USER, user_id)
+        cache.invalidate(cache.USER_BY_COGNITO_ID, cognito_user_id)
+        cache.invalidate(cache.COMPANY_HAS_USERS, company_id)
         
         return {
             'statusCode': 200,
@@ -172,18 +260,31 @@ def delete_user(event):
         }
 
 def get_cognito_user_id(user_id):
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        cur.execute("SELECT cognito_user_id FROM users WHERE user_id = %s", (user_id,))
-        result = cur.fetchone()
-    return result[0] if result else None
+    def load():
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT cognito_user_id FROM users WHERE user_id = %s", (user_id,))
+                result = cur.fetchone()
+        return result[0] if result else None
+    return cache.get_or_load(cache.COGNITO_ID_BY_USER, user_id, load)
 
 def handler(event, context):
+    try:
+        return route(event)
+    finally:
+        cache.emit_metrics()
+        instrumentation.emit_metrics()
+
+def route(event):
     http_method = event['httpMethod']
     resource = event['resource']
     
     if resource == '/users' and http_method == 'POST':
         return create_user(event)
+    elif resource == '/users' and http_method == 'GET':
+        return get_users(event)
+    elif resource == '/users/bulk' and http_method == 'POST':
+        return bulk_create_users(event)
     elif resource == '/users/{userId}':
         if http_method == 'GET':
             return get_user(event)
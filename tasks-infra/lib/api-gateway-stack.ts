@@ -56,6 +56,21 @@ export class APIGatewayStack extends cdk.Stack {
     tasks.addMethod('GET', tasksIntegration, { authorizer });
     tasks.addMethod('POST', tasksIntegration, { authorizer });
 
+    const tasksBulk = tasks.addResource('bulk');
+    tasksBulk.addMethod('PUT', tasksIntegration, { authorizer });
+
+    const tasksExport = tasks.addResource('export');
+    tasksExport.addMethod('GET', tasksIntegration, { authorizer });
+
+    const tasksClaim = tasks.addResource('claim');
+    tasksClaim.addMethod('POST', tasksIntegration, { authorizer });
+
+    const tasksSearch = tasks.addResource('search');
+    tasksSearch.addMethod('GET', tasksIntegration, { authorizer });
+
+    const tasksBoard = tasks.addResource('board');
+    tasksBoard.addMethod('GET', tasksIntegration, { authorizer });
+
     const task = tasks.addResource('{taskId}');
     task.addMethod('GET', tasksIntegration, { authorizer });
     task.addMethod('PUT', tasksIntegration, { authorizer });
@@ -71,10 +86,16 @@ export class APIGatewayStack extends cdk.Stack {
     company.addMethod('PUT', companyManagementIntegration, { authorizer });
     company.addMethod('DELETE', companyManagementIntegration, { authorizer });
 
+    const companyTree = company.addResource('tree');
+    companyTree.addMethod('GET', companyManagementIntegration, { authorizer });
+
     // User management endpoints
     const users = api.root.addResource('users');
     users.addMethod('POST', userManagementIntegration, { authorizer });
     users.addMethod('GET', userManagementIntegration, { authorizer });
+
+    const usersBulk = users.addResource('bulk');
+    usersBulk.addMethod('POST', userManagementIntegration, { authorizer });
     
     const user = users.addResource('{userId}');
     user.addMethod('GET', userManagementIntegration, { authorizer });
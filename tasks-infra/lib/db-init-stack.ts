@@ -22,9 +22,16 @@ export class DbInitStack extends cdk.Stack {
   constructor(scope: Construct, id: string, props: DbInitStackProps) {
     super(scope, id, props);
 
+    // Shared Python dependencies (psycopg2)
+    const depsLayer = new lambda.LayerVersion(this, 'DepsLayer', {
+      code: lambda.Code.fromAsset(path.join(__dirname, '../../tasks-api/lambda_layer_deps.zip')),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_9],
+    });
+
     // DB Init Lambda
     this.dbInitFunction = new lambda.Function(this, 'DBInitFunction', {
       runtime: lambda.Runtime.PYTHON_3_9,
+      layers: [depsLayer],
       handler: 'dbInitLambda.lambda_handler',
       code: lambda.Code.fromAsset(path.join(__dirname, '../../tasks-api/lambda_db_init.zip')),
       environment: {
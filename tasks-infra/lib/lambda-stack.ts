@@ -5,6 +5,9 @@ import * as rds from 'aws-cdk-lib/aws-rds';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
 import * as iam from 'aws-cdk-lib/aws-iam';
 import * as cognito from 'aws-cdk-lib/aws-cognito';
+import * as s3 from 'aws-cdk-lib/aws-s3';
+import * as events from 'aws-cdk-lib/aws-events';
+import * as targets from 'aws-cdk-lib/aws-events-targets';
 import * as path from 'path';
 
 interface LambdaStackProps extends cdk.StackProps {
@@ -20,6 +23,7 @@ export class LambdaStack extends cdk.Stack {
   public readonly backendFunction: lambda.Function;
   public readonly companyManagementFunction: lambda.Function;
   public readonly userManagementFunction: lambda.Function;
+  public readonly maintenanceFunction: lambda.Function;
 
   constructor(scope: Construct, id: string, props: LambdaStackProps) {
     super(scope, id, props);
@@ -38,8 +42,16 @@ export class LambdaStack extends cdk.Stack {
       resources: [props.databaseSecretArn],
     }));
 
+    // psycopg2 is shared through a layer so each function zip only carries its own code
+    const depsLayer = new lambda.LayerVersion(this, 'DepsLayer', {
+      code: lambda.Code.fromAsset(path.join(__dirname, '../../tasks-api/lambda_layer_deps.zip')),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_9],
+      description: 'Shared Python dependencies (psycopg2)',
+    });
+
     const commonLambdaProps = {
       runtime: lambda.Runtime.PYTHON_3_9,
+      layers: [depsLayer],
       vpc: props.vpc,
       vpcSubnets: { subnetType: ec2.SubnetType.PRIVATE_WITH_EGRESS }, // Updated this line
       securityGroups: [props.lambdaSecurityGroup],
@@ -58,6 +70,22 @@ export class LambdaStack extends cdk.Stack {
       code: lambda.Code.fromAsset(path.join(__dirname, '../../tasks-api/lambda_backend.zip')),
     });
 
+    // GET /tasks/export streams large exports here and returns a presigned URL,
+    // since Lambda buffers whole responses. Exports are only fetched once.
+    const taskExportBucket = new s3.Bucket(this, 'TaskExportBucket', {
+      blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
+      encryption: s3.BucketEncryption.S3_MANAGED,
+      enforceSSL: true,
+      lifecycleRules: [{
+        expiration: cdk.Duration.days(1),
+        abortIncompleteMultipartUploadAfter: cdk.Duration.days(1),
+      }],
+    });
+    // Multipart upload (including abort) and the GetObject the presigned URL is signed for
+    taskExportBucket.grantPut(this.backendFunction);
+    taskExportBucket.grantRead(this.backendFunction);
+    this.backendFunction.addEnvironment('TASK_EXPORT_BUCKET', taskExportBucket.bucketName);
+
     this.companyManagementFunction = new lambda.Function(this, 'CompanyManagementFunction', {
       ...commonLambdaProps,
       handler: 'companyManagementLambda.handler',
@@ -70,10 +98,97 @@ export class LambdaStack extends cdk.Stack {
       code: lambda.Code.fromAsset(path.join(__dirname, '../../tasks-api/lambda_user_management.zip')),
     });
 
+    // Scheduled jobs; each EventBridge rule below picks one with its 'job' key.
+    // Named up front so the shared role can allow it to invoke itself (the
+    // task scheduler continues unfinished runs) without a circular reference.
+    const maintenanceFunctionName = `${this.stackName}-maintenance`;
+    this.maintenanceFunction = new lambda.Function(this, 'MaintenanceFunction', {
+      ...commonLambdaProps,
+      functionName: maintenanceFunctionName,
+      handler: 'maintenanceLambda.handler',
+      code: lambda.Code.fromAsset(path.join(__dirname, '../../tasks-api/lambda_maintenance.zip')),
+      timeout: cdk.Duration.minutes(15),
+      // archive_task_changes stages a gzipped month of task_changes in /tmp
+      ephemeralStorageSize: cdk.Size.gibibytes(10),
+    });
+
+    // Expired task_changes partitions, exported before they are dropped
+    const taskChangesArchiveBucket = new s3.Bucket(this, 'TaskChangesArchiveBucket', {
+      blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
+      encryption: s3.BucketEncryption.S3_MANAGED,
+      enforceSSL: true,
+      removalPolicy: cdk.RemovalPolicy.RETAIN,
+    });
+    taskChangesArchiveBucket.grantPut(this.maintenanceFunction);
+    this.maintenanceFunction.addEnvironment('TASK_CHANGES_ARCHIVE_BUCKET', taskChangesArchiveBucket.bucketName);
+
+    // User management and the Cognito outbox drain write to the user pool
+    lambdaRole.addToPolicy(new iam.PolicyStatement({
+      actions: [
+        'cognito-idp:AdminCreateUser',
+        'cognito-idp:AdminGetUser',
+        'cognito-idp:AdminUpdateUserAttributes',
+        'cognito-idp:AdminDeleteUser',
+      ],
+      resources: [props.userPool.userPoolArn],
+    }));
+
+    // schedule_tasks hands an unfinished run to a new invocation of itself
+    lambdaRole.addToPolicy(new iam.PolicyStatement({
+      actions: ['lambda:InvokeFunction'],
+      resources: [cdk.Stack.of(this).formatArn({
+        service: 'lambda',
+        resource: 'function',
+        resourceName: maintenanceFunctionName,
+        arnFormat: cdk.ArnFormat.COLON_RESOURCE_NAME,
+      })],
+    }));
+
+    // Profile updates and deletes only reach Cognito through the outbox
+    new events.Rule(this, 'DrainCognitoOutboxRule', {
+      schedule: events.Schedule.rate(cdk.Duration.minutes(1)),
+      targets: [new targets.LambdaFunction(this.maintenanceFunction, {
+        event: events.RuleTargetInput.fromObject({ job: 'drain_cognito_outbox' }),
+        retryAttempts: 0,
+      })],
+    });
+
+    // Dashboard counters are maintained by triggers; the nightly rebuild corrects any drift
+    new events.Rule(this, 'ReconcileCountersRule', {
+      schedule: events.Schedule.cron({ minute: '45', hour: '1' }),
+      targets: [new targets.LambdaFunction(this.maintenanceFunction, {
+        event: events.RuleTargetInput.fromObject({ job: 'reconcile_counters' }),
+      })],
+    });
+
+    // Task changes are written into monthly partitions that must exist in advance
+    new events.Rule(this, 'EnsurePartitionsRule', {
+      schedule: events.Schedule.cron({ minute: '15', hour: '2' }),
+      targets: [new targets.LambdaFunction(this.maintenanceFunction, {
+        event: events.RuleTargetInput.fromObject({ job: 'ensure_partitions' }),
+      })],
+    });
+
+    // Recurring task instances and overdue escalation, after midnight UTC
+    new events.Rule(this, 'ScheduleTasksRule', {
+      schedule: events.Schedule.cron({ minute: '5', hour: '0' }),
+      targets: [new targets.LambdaFunction(this.maintenanceFunction, {
+        event: events.RuleTargetInput.fromObject({ job: 'schedule_tasks' }),
+      })],
+    });
+
+    new events.Rule(this, 'ArchiveTaskChangesRule', {
+      schedule: events.Schedule.cron({ minute: '30', hour: '3', day: '2' }),
+      targets: [new targets.LambdaFunction(this.maintenanceFunction, {
+        event: events.RuleTargetInput.fromObject({ job: 'archive_task_changes' }),
+      })],
+    });
+
     // Grant necessary permissions
     props.database.grantConnect(this.backendFunction);
     props.database.grantConnect(this.companyManagementFunction);
     props.database.grantConnect(this.userManagementFunction);
+    props.database.grantConnect(this.maintenanceFunction);
 
     // Output the Lambda function ARNs
     new cdk.CfnOutput(this, 'BackendFunctionArn', {
@@ -93,5 +208,11 @@ export class LambdaStack extends cdk.Stack {
       description: 'User Management Lambda Function ARN',
       exportName: 'TasksUserManagementFunctionArn',
     });
+
+    new cdk.CfnOutput(this, 'MaintenanceFunctionArn', {
+      value: this.maintenanceFunction.functionArn,
+      description: 'Maintenance Lambda Function ARN',
+      exportName: 'TasksMaintenanceFunctionArn',
+    });
   }
 }
\ No newline at end of file